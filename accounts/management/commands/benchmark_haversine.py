@@ -0,0 +1,58 @@
+"""
+Benchmark the scalar and vectorized haversine implementations
+"""
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.utils import haversine_distance, points_within
+
+
+class Command(BaseCommand):
+    help = 'Compare scalar and vectorized nearby-point distance calculations'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            nargs='+',
+            type=int,
+            default=[10_000, 100_000, 1_000_000],
+            help='Number of candidate points for each run',
+        )
+        parser.add_argument('--radius', type=float, default=50, help='Search radius in km')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        radius = options['radius']
+
+        # Searcher in Hyderabad, candidates spread over southern India
+        origin_lat, origin_lon = 17.385, 78.4867
+
+        self.stdout.write(f"{'points':>10} {'scalar (s)':>12} {'vectorized (s)':>15} {'speedup':>8} {'hits':>7}")
+
+        for size in options['sizes']:
+            latitudes = [rng.uniform(8.0, 24.0) for _ in range(size)]
+            longitudes = [rng.uniform(70.0, 86.0) for _ in range(size)]
+
+            start = time.perf_counter()
+            scalar_hits = sorted(
+                (distance, i)
+                for i, (lat, lon) in enumerate(zip(latitudes, longitudes))
+                for distance in [haversine_distance(origin_lat, origin_lon, lat, lon)]
+                if distance <= radius
+            )
+            scalar_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            indices, _ = points_within(origin_lat, origin_lon, latitudes, longitudes, radius)
+            vector_time = time.perf_counter() - start
+
+            if [i for _, i in scalar_hits] != indices.tolist():
+                self.stderr.write(self.style.ERROR(f'Result mismatch at {size} points'))
+
+            self.stdout.write(
+                f'{size:>10} {scalar_time:>12.4f} {vector_time:>15.4f} '
+                f'{scalar_time / vector_time:>7.1f}x {len(indices):>7}'
+            )
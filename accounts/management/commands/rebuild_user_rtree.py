@@ -0,0 +1,34 @@
+"""
+Rebuild the SQLite R*Tree index over user coordinates
+"""
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from accounts import rtree
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Drop and recreate the R*Tree table mirroring User latitude/longitude'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+
+        with transaction.atomic(using=connection.alias):
+            installed = rtree.rebuild(connection)
+
+        if not installed:
+            self.stdout.write(self.style.WARNING(
+                'R*Tree index not available on this database; '
+                'nearby searches use the column bounding box instead.'
+            ))
+            return
+
+        indexed = User.objects.using(connection.alias).filter(
+            latitude__isnull=False,
+            longitude__isnull=False,
+        ).count()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rtree.TABLE} with {indexed} users.'))
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def install_rtree(apps, schema_editor):
+    from accounts import rtree
+    rtree.install(schema_editor.connection)
+
+
+def uninstall_rtree(apps, schema_editor):
+    from accounts import rtree
+    rtree.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_user_role_location_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_rtree, uninstall_rtree),
+    ]
@@ -103,6 +103,13 @@ class User(AbstractUser):
     class Meta:
         verbose_name = 'User'
         verbose_name_plural = 'Users'
+        indexes = [
+            # Serves the bounding-box prefilter in accounts.utils.get_nearby_users
+            models.Index(
+                fields=['role', 'latitude', 'longitude'],
+                name='accounts_user_role_loc_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.username} ({self.get_role_display()})"
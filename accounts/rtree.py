@@ -0,0 +1,145 @@
+"""
+Optional SQLite R*Tree index over user coordinates
+
+When the database is SQLite and its R*Tree module is compiled in, a
+virtual table mirrors accounts_user.latitude/longitude and is kept in
+sync by triggers, so queryset.update() and raw SQL stay covered too.
+accounts.utils.get_nearby_users uses it for the bounding-box step when
+present and falls back to the plain column filter otherwise.
+"""
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .utils import bounding_box
+
+
+TABLE = 'accounts_user_rtree'
+
+CREATE_STATEMENTS = [
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING rtree(id, min_lat, max_lat, min_lon, max_lon)',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_insert AFTER INSERT ON accounts_user
+    WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL
+    BEGIN
+        INSERT OR REPLACE INTO {TABLE} VALUES (NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_update AFTER UPDATE OF latitude, longitude ON accounts_user
+    BEGIN
+        DELETE FROM {TABLE} WHERE id = OLD.id;
+        INSERT INTO {TABLE}
+            SELECT NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+            WHERE NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_delete AFTER DELETE ON accounts_user
+    BEGIN
+        DELETE FROM {TABLE} WHERE id = OLD.id;
+    END
+    ''',
+]
+
+DROP_STATEMENTS = [
+    f'DROP TRIGGER IF EXISTS {TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {TABLE}_update',
+    f'DROP TRIGGER IF EXISTS {TABLE}_delete',
+    f'DROP TABLE IF EXISTS {TABLE}',
+]
+
+POPULATE_STATEMENT = f'''
+    INSERT INTO {TABLE}
+        SELECT id, latitude, latitude, longitude, longitude FROM accounts_user
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+'''
+
+# Availability per database alias, detected once per process
+_available = {}
+
+
+def install(connection):
+    """
+    Create the R*Tree table and triggers and load existing users
+
+    Returns False (and changes nothing) when the database is not SQLite
+    or SQLite was built without the R*Tree module.
+    """
+    _available.pop(connection.alias, None)
+    if connection.vendor != 'sqlite':
+        return False
+
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(CREATE_STATEMENTS[0])
+        except DatabaseError:
+            return False
+        for statement in CREATE_STATEMENTS[1:]:
+            cursor.execute(statement)
+        cursor.execute(f'DELETE FROM {TABLE}')
+        cursor.execute(POPULATE_STATEMENT)
+    return True
+
+
+def uninstall(connection):
+    """Remove the R*Tree table and its triggers"""
+    _available.pop(connection.alias, None)
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for statement in DROP_STATEMENTS:
+            cursor.execute(statement)
+
+
+def rebuild(connection):
+    """
+    Drop and recreate the R*Tree table from accounts_user
+
+    Also refreshes planner statistics for accounts_user; without them
+    SQLite may prefer the role index over primary-key lookups of the
+    R*Tree matches.
+    """
+    uninstall(connection)
+    if not install(connection):
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE accounts_user')
+    return True
+
+
+def is_available(using='default'):
+    """Check whether the R*Tree table exists on the given database"""
+    if using not in _available:
+        connection = connections[using]
+        _available[using] = (
+            connection.vendor == 'sqlite'
+            and TABLE in connection.introspection.table_names()
+        )
+    return _available[using]
+
+
+def bounding_box_filter(latitude, longitude, distance_km):
+    """
+    Build a Q object restricting users to the bounding box around the
+    given coordinates, answered by the R*Tree
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, distance_km)
+
+    # Split the longitude range in two when it wraps around the antimeridian
+    if min_lon < -180:
+        lon_ranges = [(min_lon + 360, 180.0), (-180.0, max_lon)]
+    elif max_lon > 180:
+        lon_ranges = [(min_lon, 180.0), (-180.0, max_lon - 360)]
+    else:
+        lon_ranges = [(min_lon, max_lon)]
+
+    sql = ' UNION ALL '.join(
+        f'SELECT id FROM {TABLE} WHERE max_lat >= %s AND min_lat <= %s AND max_lon >= %s AND min_lon <= %s'
+        for _ in lon_ranges
+    )
+    params = []
+    for lon_min, lon_max in lon_ranges:
+        params.extend([min_lat, max_lat, lon_min, lon_max])
+
+    return Q(pk__in=RawSQL(sql, params))
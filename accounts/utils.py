@@ -3,6 +3,14 @@ Utility functions for location and distance calculations
 """
 import math
 
+import numpy as np
+from django.db.models import FloatField, Q
+from django.db.models.functions import Cast
+
+
+# Mean radius of the earth in kilometers
+EARTH_RADIUS_KM = 6371
+
 
 def haversine_distance(lat1, lon1, lat2, lon2):
     """
@@ -20,30 +28,232 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
     c = 2 * math.asin(math.sqrt(a))
     
-    # Radius of earth in kilometers
-    r = 6371
-    
-    return c * r
+    return c * EARTH_RADIUS_KM
+
+
+def haversine_distances(latitude, longitude, latitudes, longitudes):
+    """
+    Vectorized haversine: distances in kilometers from one point to
+    every point in the latitudes/longitudes arrays (decimal degrees)
+    """
+    lat1 = math.radians(float(latitude))
+    lon1 = math.radians(float(longitude))
+    lat2 = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon2 = np.radians(np.asarray(longitudes, dtype=np.float64))
+
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def points_within(latitude, longitude, latitudes, longitudes, max_distance_km):
+    """
+    Find the points within max_distance_km of the given coordinates
+
+    Returns (indices, distances) for the in-radius points, sorted by
+    ascending distance.
+    """
+    distances = haversine_distances(latitude, longitude, latitudes, longitudes)
+    indices = np.flatnonzero(distances <= max_distance_km)
+    order = np.argsort(distances[indices], kind='stable')
+    return indices[order], distances[indices][order]
+
+
+def bounding_box(latitude, longitude, distance_km):
+    """
+    Calculate the latitude/longitude box enclosing every point
+    within distance_km of the given coordinates
+
+    Returns (min_lat, max_lat, min_lon, max_lon). Longitudes may fall
+    outside [-180, 180] when the box crosses the antimeridian.
+    """
+    latitude = float(latitude)
+    longitude = float(longitude)
+    angular_distance = distance_km / EARTH_RADIUS_KM
+
+    min_lat = latitude - math.degrees(angular_distance)
+    max_lat = latitude + math.degrees(angular_distance)
+
+    # A pole inside the circle means every longitude is reachable
+    if min_lat <= -90 or max_lat >= 90 or angular_distance >= math.pi / 2:
+        return max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0
+
+    delta_lon = math.degrees(math.asin(
+        min(1.0, math.sin(angular_distance) / math.cos(math.radians(latitude)))
+    ))
+    return min_lat, max_lat, longitude - delta_lon, longitude + delta_lon
+
+
+def bounding_box_filter(latitude, longitude, distance_km, prefix=''):
+    """
+    Build a Q object restricting <prefix>latitude/<prefix>longitude
+    to the bounding box around the given coordinates
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, distance_km)
+
+    condition = Q(**{
+        f'{prefix}latitude__gte': min_lat,
+        f'{prefix}latitude__lte': max_lat,
+    })
+
+    if min_lon <= -180 and max_lon >= 180:
+        return condition & Q(**{f'{prefix}longitude__isnull': False})
+
+    # Split the longitude range in two when it wraps around the antimeridian
+    if min_lon < -180:
+        longitude_condition = (
+            Q(**{f'{prefix}longitude__gte': min_lon + 360})
+            | Q(**{f'{prefix}longitude__lte': max_lon})
+        )
+    elif max_lon > 180:
+        longitude_condition = (
+            Q(**{f'{prefix}longitude__gte': min_lon})
+            | Q(**{f'{prefix}longitude__lte': max_lon - 360})
+        )
+    else:
+        longitude_condition = Q(**{
+            f'{prefix}longitude__gte': min_lon,
+            f'{prefix}longitude__lte': max_lon,
+        })
+
+    return condition & longitude_condition
 
 
 def get_nearby_users(user, users_queryset, max_distance_km=50):
     """
     Filter users based on distance from current user
-    Returns users within max_distance_km radius
+    Returns users within max_distance_km radius, nearest first
+
+    Candidates are first narrowed in the database with a bounding box,
+    answered by the SQLite R*Tree when it is installed (see accounts.rtree)
+    and by the role/latitude/longitude index otherwise. Their coordinates are
+    read as plain floats and checked in one vectorized haversine pass, so
+    only the users actually in range are loaded as model instances.
     """
     if not user.latitude or not user.longitude:
         return users_queryset.none()
-    
+
+    from . import rtree
+
+    if users_queryset.model._meta.db_table == 'accounts_user' and rtree.is_available(users_queryset.db):
+        box = rtree.bounding_box_filter(user.latitude, user.longitude, max_distance_km)
+    else:
+        box = bounding_box_filter(user.latitude, user.longitude, max_distance_km)
+
+    candidates = list(
+        users_queryset.filter(box).annotate(
+            _lat=Cast('latitude', FloatField()),
+            _lon=Cast('longitude', FloatField()),
+        ).values_list('pk', '_lat', '_lon')
+    )
+    if not candidates:
+        return []
+
+    pks, latitudes, longitudes = zip(*candidates)
+    indices, distances = points_within(
+        user.latitude, user.longitude, latitudes, longitudes, max_distance_km
+    )
+    if not len(indices):
+        return []
+
+    distance_by_pk = {pks[i]: d for i, d in zip(indices.tolist(), distances.tolist())}
+    users_by_pk = users_queryset.in_bulk(list(distance_by_pk))
+
     nearby_users = []
-    for other_user in users_queryset:
-        if other_user.latitude and other_user.longitude:
-            distance = haversine_distance(
-                user.latitude, user.longitude,
-                other_user.latitude, other_user.longitude
-            )
-            if distance <= max_distance_km:
-                other_user.distance_km = round(distance, 2)
-                nearby_users.append(other_user)
-    
+    for pk, distance in distance_by_pk.items():
+        other_user = users_by_pk.get(pk)
+        if other_user is not None:
+            other_user.distance_km = round(distance, 2)
+            nearby_users.append(other_user)
+
     return nearby_users
 
+
+# ==========================
+# GEOHASH CELLS
+# ==========================
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash_cell_size(precision):
+    """Height and width in degrees of a geohash cell at this precision"""
+    bits = precision * 5
+    lat_bits = bits // 2
+    lon_bits = bits - lat_bits
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def encode_geohash(latitude, longitude, precision=6):
+    """Encode decimal-degree coordinates as a geohash string"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    latitude = float(latitude)
+    longitude = float(longitude)
+
+    chars = []
+    bit_count = 0
+    char_index = 0
+    even = True  # geohash interleaves bits starting with longitude
+    while len(chars) < precision:
+        value, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        char_index <<= 1
+        if value >= mid:
+            char_index |= 1
+            bounds[0] = mid
+        else:
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[char_index])
+            bit_count = 0
+            char_index = 0
+
+    return ''.join(chars)
+
+
+def decode_geohash(geohash):
+    """Return the (latitude, longitude) centre of a geohash cell"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        index = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            bounds = lon_range if even else lat_range
+            mid = (bounds[0] + bounds[1]) / 2
+            if index >> shift & 1:
+                bounds[0] = mid
+            else:
+                bounds[1] = mid
+            even = not even
+
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
+
+
+def geohash_cells(latitude, longitude, distance_km, precision):
+    """
+    Geohash cells at the given precision overlapping the bounding box
+    of a distance_km radius around the coordinates
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, distance_km)
+    cell_height, cell_width = geohash_cell_size(precision)
+
+    if max_lon - min_lon >= 360:
+        min_lon, max_lon = -180.0, 180.0 - cell_width / 2
+
+    cells = set()
+    lat = math.floor((min_lat + 90) / cell_height) * cell_height - 90 + cell_height / 2
+    while lat <= max_lat + cell_height / 2 and lat < 90:
+        lon = math.floor((min_lon + 180) / cell_width) * cell_width - 180 + cell_width / 2
+        while lon <= max_lon + cell_width / 2:
+            wrapped_lon = (lon + 180) % 360 - 180
+            cells.add(encode_geohash(min(max(lat, -90.0), 90.0), wrapped_lon, precision))
+            lon += cell_width
+        lat += cell_height
+
+    return cells
+
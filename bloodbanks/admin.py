@@ -2,7 +2,12 @@
 Admin configuration for bloodbanks app
 """
 from django.contrib import admin
-from .models import BloodBank, BloodInventory
+from . import services as inventory_service
+from .models import (
+    BloodBank, BloodBatch, BloodInventory, InventoryRollup, InventorySnapshot, InventoryTransaction,
+    LowStockAlert, LowStockThreshold,
+    DonationSlot, OpeningHours,
+)
 
 
 @admin.register(BloodBank)
@@ -21,3 +26,81 @@ class BloodInventoryAdmin(admin.ModelAdmin):
     list_filter = ('blood_group', 'last_updated')
     search_fields = ('blood_bank__user__username',)
 
+    def get_readonly_fields(self, request, obj=None):
+        # Batches and the ledger are kept per bank and group
+        if obj is not None:
+            return ('blood_bank', 'blood_group')
+        return ()
+
+    def save_model(self, request, obj, form, change):
+        # Counts go through the inventory service so batches, the ledger
+        # and low-stock alerts follow them
+        inventory = inventory_service.set_units(obj.blood_bank, obj.blood_group, obj.units)
+        obj.pk = inventory.pk
+
+
+@admin.register(BloodBatch)
+class BloodBatchAdmin(admin.ModelAdmin):
+    list_display = ('blood_bank', 'blood_group', 'units_remaining', 'units', 'collected_on', 'expires_on', 'status')
+    list_filter = ('status', 'blood_group', 'expires_on')
+    search_fields = ('blood_bank__user__username',)
+
+
+@admin.register(InventoryTransaction)
+class InventoryTransactionAdmin(admin.ModelAdmin):
+    list_display = ('blood_bank', 'blood_group', 'delta', 'reason', 'created_at')
+    list_filter = ('reason', 'blood_group', 'created_at')
+    search_fields = ('blood_bank__user__username',)
+
+    # The ledger is append-only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(InventorySnapshot)
+class InventorySnapshotAdmin(admin.ModelAdmin):
+    list_display = ('blood_bank', 'blood_group', 'units', 'ledger_position', 'taken_at')
+    list_filter = ('blood_group', 'taken_at')
+    search_fields = ('blood_bank__user__username',)
+
+
+@admin.register(InventoryRollup)
+class InventoryRollupAdmin(admin.ModelAdmin):
+    list_display = ('cell', 'blood_group', 'units')
+    list_filter = ('blood_group',)
+    search_fields = ('cell',)
+
+
+@admin.register(LowStockThreshold)
+class LowStockThresholdAdmin(admin.ModelAdmin):
+    list_display = ('blood_bank', 'blood_group', 'threshold')
+    list_filter = ('blood_group',)
+    search_fields = ('blood_bank__user__username',)
+
+
+@admin.register(LowStockAlert)
+class LowStockAlertAdmin(admin.ModelAdmin):
+    list_display = ('blood_bank', 'blood_group', 'units', 'threshold', 'created_at', 'resolved_at')
+    list_filter = ('blood_group', 'created_at', 'resolved_at')
+    search_fields = ('blood_bank__user__username',)
+
+
+@admin.register(OpeningHours)
+class OpeningHoursAdmin(admin.ModelAdmin):
+    list_display = ('blood_bank', 'weekday', 'opens_at', 'closes_at', 'slot_minutes', 'capacity')
+    list_filter = ('weekday',)
+    search_fields = ('blood_bank__user__username',)
+
+
+@admin.register(DonationSlot)
+class DonationSlotAdmin(admin.ModelAdmin):
+    list_display = ('blood_bank', 'starts_at', 'ends_at', 'booked', 'capacity')
+    list_filter = ('starts_at',)
+    search_fields = ('blood_bank__user__username',)
+
@@ -0,0 +1,217 @@
+"""
+Low-stock alerts raised from inventory changes
+
+bloodbanks.signals calls check_stock() for every stock write of a bank.
+Stock left below the blood group's threshold opens a LowStockAlert
+unless one is open already, and stock at or above it resolves the open
+one. Opening or resolving an alert also expires the bank's
+cached dashboard figures (bloodbanks.stats), which show the badges.
+
+Either way an event goes to the bank's channel group once the
+transaction commits, so open dashboards update without polling. Events
+only reach WebSockets held by processes sharing the channel layer: set
+REDIS_URL so web workers, management commands and the ASGI server share
+one. The in-memory default only serves a single process running
+everything (runserver, or one daphne). open_missing_alerts() catches up
+on stock written without a change going through here.
+"""
+from functools import partial
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import stats
+from .models import DEFAULT_LOW_STOCK_THRESHOLD, BloodInventory, LowStockAlert, LowStockThreshold
+
+
+def group_name(blood_bank_id):
+    """Channel group of a blood bank's alert subscribers"""
+    return f'bloodbank_{blood_bank_id}_alerts'
+
+
+def thresholds_for(blood_bank):
+    """{blood_group: threshold} for every blood group of a bank"""
+    thresholds = dict(
+        LowStockThreshold.objects.filter(blood_bank=blood_bank).values_list('blood_group', 'threshold')
+    )
+    return {
+        blood_group: thresholds.get(blood_group, DEFAULT_LOW_STOCK_THRESHOLD)
+        for blood_group, _ in BloodInventory.BLOOD_GROUP_CHOICES
+    }
+
+
+def _send(blood_bank_id, event):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(
+        group_name(blood_bank_id),
+        {'type': 'low_stock_alert', 'alert': event}
+    )
+
+
+def _notify(alert, status):
+    event = {
+        'id': alert.pk,
+        'status': status,
+        'blood_group': alert.blood_group,
+        'units': alert.units,
+        'threshold': alert.threshold,
+        'created_at': alert.created_at.isoformat(),
+    }
+    transaction.on_commit(partial(_send, alert.blood_bank_id, event))
+
+
+def open_alert(blood_bank_id, blood_group, units, threshold):
+    """Open an alert unless the group already has one; returns it or None"""
+    try:
+        with transaction.atomic():
+            alert = LowStockAlert.objects.create(
+                blood_bank_id=blood_bank_id,
+                blood_group=blood_group,
+                units=units,
+                threshold=threshold,
+            )
+    except IntegrityError:
+        # An alert is already open for this group
+        return None
+
+    stats.invalidate(blood_bank_id)
+    _notify(alert, 'open')
+    return alert
+
+
+def resolve_alerts(blood_bank_id, units_by_group):
+    """Close the open alerts of the groups in units_by_group (group -> units now)"""
+    alerts = list(LowStockAlert.objects.filter(
+        blood_bank_id=blood_bank_id,
+        blood_group__in=list(units_by_group),
+        resolved_at__isnull=True,
+    ))
+    if not alerts:
+        return
+
+    now = timezone.now()
+    LowStockAlert.objects.filter(pk__in=[alert.pk for alert in alerts]).update(resolved_at=now)
+    stats.invalidate(blood_bank_id)
+    for alert in alerts:
+        alert.resolved_at = now
+        alert.units = units_by_group[alert.blood_group]
+        _notify(alert, 'resolved')
+
+
+def check_stock(blood_bank_id, changes):
+    """
+    Open an alert for each changed group below its threshold without
+    one; resolve the open ones of groups back at their threshold
+
+    changes is [(inventory, previous_units)] for one bank. Thresholds and
+    open alerts are read once for all of them.
+    """
+    groups = [inventory.blood_group for inventory, _ in changes]
+    thresholds = dict(
+        LowStockThreshold.objects.filter(
+            blood_bank_id=blood_bank_id, blood_group__in=groups
+        ).values_list('blood_group', 'threshold')
+    )
+    open_groups = set(
+        LowStockAlert.objects.filter(
+            blood_bank_id=blood_bank_id, blood_group__in=groups, resolved_at__isnull=True
+        ).values_list('blood_group', flat=True)
+    )
+
+    recovered = {}
+    for inventory, _ in changes:
+        threshold = thresholds.get(inventory.blood_group, DEFAULT_LOW_STOCK_THRESHOLD)
+        if inventory.units < threshold:
+            if inventory.blood_group not in open_groups:
+                open_alert(blood_bank_id, inventory.blood_group, inventory.units, threshold)
+        elif inventory.blood_group in open_groups:
+            recovered[inventory.blood_group] = inventory.units
+
+    if recovered:
+        resolve_alerts(blood_bank_id, recovered)
+
+
+def open_missing_alerts(batch_size=1000):
+    """
+    Open an alert for every group below its threshold without one
+
+    One query finds the rows and bulk inserts open the alerts, without
+    channel events. Returns the number of alerts opened.
+    """
+    threshold = LowStockThreshold.objects.filter(
+        blood_bank=OuterRef('blood_bank'), blood_group=OuterRef('blood_group')
+    ).values('threshold')[:1]
+    open_alerts = LowStockAlert.objects.filter(
+        blood_bank=OuterRef('blood_bank'), blood_group=OuterRef('blood_group'),
+        resolved_at__isnull=True,
+    )
+
+    low_stock = BloodInventory.objects.annotate(
+        threshold=Coalesce(Subquery(threshold), Value(DEFAULT_LOW_STOCK_THRESHOLD))
+    ).filter(units__lt=F('threshold')).exclude(Exists(open_alerts))
+
+    # Conflicts only come from alerts opened since the query
+    created = LowStockAlert.objects.bulk_create(
+        [
+            LowStockAlert(
+                blood_bank_id=inventory.blood_bank_id,
+                blood_group=inventory.blood_group,
+                units=inventory.units,
+                threshold=inventory.threshold,
+            )
+            for inventory in low_stock.iterator()
+        ],
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+    stats.invalidate_many(alert.blood_bank_id for alert in created)
+    return len(created)
+
+
+def set_thresholds(blood_bank, thresholds_by_group):
+    """
+    Store a bank's thresholds and re-check its stock against them
+
+    Groups whose stock is now below the new threshold get an alert;
+    open alerts of groups now at or above it are resolved.
+    """
+    with transaction.atomic():
+        LowStockThreshold.objects.bulk_create(
+            [
+                LowStockThreshold(blood_bank=blood_bank, blood_group=blood_group, threshold=threshold)
+                for blood_group, threshold in thresholds_by_group.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['blood_bank', 'blood_group'],
+            update_fields=['threshold'],
+        )
+
+        stock = dict(
+            BloodInventory.objects.filter(
+                blood_bank=blood_bank, blood_group__in=list(thresholds_by_group)
+            ).values_list('blood_group', 'units')
+        )
+        open_groups = set(
+            LowStockAlert.objects.filter(
+                blood_bank=blood_bank, resolved_at__isnull=True
+            ).values_list('blood_group', flat=True)
+        )
+
+        recovered = {}
+        for blood_group, threshold in thresholds_by_group.items():
+            units = stock.get(blood_group)
+            if units is None:
+                continue
+            if units < threshold and blood_group not in open_groups:
+                open_alert(blood_bank.pk, blood_group, units, threshold)
+            elif units >= threshold and blood_group in open_groups:
+                recovered[blood_group] = units
+
+        if recovered:
+            resolve_alerts(blood_bank.pk, recovered)
@@ -5,3 +5,5 @@ class BloodbanksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bloodbanks'
 
+    def ready(self):
+        import bloodbanks.signals  # noqa
@@ -0,0 +1,50 @@
+"""
+WebSocket consumers for real-time blood bank notifications
+"""
+import json
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.db import database_sync_to_async
+from . import alerts
+from .models import BloodBank
+
+
+class LowStockAlertConsumer(AsyncWebsocketConsumer):
+    """Pushes a blood bank's low-stock alerts to its open dashboards"""
+    
+    async def connect(self):
+        """Handle WebSocket connection"""
+        self.user = self.scope['user']
+        
+        if self.user.is_anonymous or self.user.role != 'bloodbank':
+            await self.close()
+            return
+        
+        blood_bank_id = await self.get_blood_bank_id()
+        if blood_bank_id is None:
+            await self.close()
+            return
+        
+        # Join the bank's alert group
+        self.group_name = alerts.group_name(blood_bank_id)
+        await self.channel_layer.group_add(
+            self.group_name,
+            self.channel_name
+        )
+        
+        await self.accept()
+    
+    async def disconnect(self, close_code):
+        """Handle WebSocket disconnection"""
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(
+                self.group_name,
+                self.channel_name
+            )
+    
+    async def low_stock_alert(self, event):
+        """Receive an alert from the bank's group"""
+        await self.send(text_data=json.dumps(event['alert']))
+    
+    @database_sync_to_async
+    def get_blood_bank_id(self):
+        return BloodBank.objects.filter(user=self.user).values_list('pk', flat=True).first()
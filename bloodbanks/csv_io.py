@@ -0,0 +1,193 @@
+"""
+CSV export and import of blood bank stock and donation history
+
+Exports are streamed: rows come from .iterator(chunk_size=...) and are
+written to the response one at a time, so memory use does not grow with
+the history. Imports read the uploaded file line by line and hand
+validated rows to bloodbanks.services.import_stock, which writes them in
+bulk chunks.
+"""
+import csv
+import io
+from datetime import date
+
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date
+
+from donors.models import DonationSchedule
+from .models import BloodBatch, BloodInventory, InventoryTransaction
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+STOCK_COLUMNS = ['blood_group', 'units', 'collected_on', 'expires_on']
+
+
+class Echo:
+    """File-like object handing each written line straight back"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(filename, header, rows):
+    """StreamingHttpResponse writing header and rows as CSV"""
+    writer = csv.writer(Echo())
+
+    def lines():
+        yield writer.writerow(header)
+        for row in rows:
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(lines(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _isoformat(value):
+    return value.isoformat() if value else ''
+
+
+def export_stock(blood_bank):
+    """The bank's live batches, in the format import_stock reads back"""
+    rows = BloodBatch.objects.live().filter(blood_bank=blood_bank).order_by(
+        'blood_group', 'expires_on', 'id'
+    ).values_list('blood_group', 'units_remaining', 'collected_on', 'expires_on')
+
+    return stream_csv(
+        f'stock-{blood_bank.pk}-{date.today().isoformat()}.csv',
+        STOCK_COLUMNS,
+        (
+            (blood_group, units, _isoformat(collected_on), _isoformat(expires_on))
+            for blood_group, units, collected_on, expires_on in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        )
+    )
+
+
+def export_inventory(blood_bank):
+    """Current counter of every blood group"""
+    rows = BloodInventory.objects.filter(blood_bank=blood_bank).order_by(
+        'blood_group'
+    ).values_list('blood_group', 'units', 'last_updated')
+
+    return stream_csv(
+        f'inventory-{blood_bank.pk}-{date.today().isoformat()}.csv',
+        ['blood_group', 'units', 'last_updated'],
+        (
+            (blood_group, units, _isoformat(last_updated))
+            for blood_group, units, last_updated in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        )
+    )
+
+
+def export_ledger(blood_bank):
+    """Every inventory change recorded for the bank, oldest first"""
+    rows = InventoryTransaction.objects.filter(blood_bank=blood_bank).order_by(
+        'id'
+    ).values_list('id', 'created_at', 'blood_group', 'delta', 'reason')
+
+    return stream_csv(
+        f'inventory-ledger-{blood_bank.pk}.csv',
+        ['id', 'created_at', 'blood_group', 'delta', 'reason'],
+        (
+            (pk, _isoformat(created_at), blood_group, delta, reason)
+            for pk, created_at, blood_group, delta, reason in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        )
+    )
+
+
+def export_donations(blood_bank):
+    """The bank's donation schedule history, oldest first"""
+    rows = DonationSchedule.objects.filter(blood_bank=blood_bank).order_by(
+        'scheduled_date', 'id'
+    ).values_list(
+        'id', 'scheduled_date', 'status', 'donor__user__username',
+        'donor__blood_group', 'notes', 'created_at', 'updated_at'
+    )
+
+    return stream_csv(
+        f'donations-{blood_bank.pk}.csv',
+        ['id', 'scheduled_date', 'status', 'donor', 'blood_group', 'notes', 'created_at', 'updated_at'],
+        (
+            (pk, _isoformat(scheduled_date), status, donor, blood_group, notes,
+             _isoformat(created_at), _isoformat(updated_at))
+            for pk, scheduled_date, status, donor, blood_group, notes, created_at, updated_at
+            in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        )
+    )
+
+
+class StockImportError(ValueError):
+    """A stock file row that cannot be imported"""
+
+    def __init__(self, line, message):
+        self.line = line
+        super().__init__(f"Line {line}: {message}")
+
+
+def _optional_date(value):
+    value = (value or '').strip()
+    if not value:
+        return None
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+
+def _csv_rows(reader):
+    """The reader's rows, with malformed CSV reported as StockImportError"""
+    try:
+        yield from reader
+    except csv.Error as e:
+        # line_num has not yet counted the line that failed
+        raise StockImportError(reader.line_num + 1, f"not valid CSV ({e})")
+
+
+def read_stock_csv(uploaded_file):
+    """
+    Yield validated batches from an uploaded stock CSV
+
+    Columns: blood_group, units, and optionally collected_on and
+    expires_on (YYYY-MM-DD). collected_on defaults to today and
+    expires_on to the standard shelf life after collection. Raises
+    StockImportError on the first bad row.
+    """
+    valid_groups = {group for group, _ in BloodInventory.BLOOD_GROUP_CHOICES}
+    reader = csv.DictReader(io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', newline=''))
+
+    try:
+        fieldnames = reader.fieldnames
+    except csv.Error as e:
+        raise StockImportError(1, f"not valid CSV ({e})")
+    missing = {'blood_group', 'units'} - set(fieldnames or [])
+    if missing:
+        raise StockImportError(1, f"missing column(s): {', '.join(sorted(missing))}")
+
+    for row in _csv_rows(reader):
+        line = reader.line_num
+        blood_group = (row.get('blood_group') or '').strip().upper()
+        if blood_group not in valid_groups:
+            raise StockImportError(line, f"unknown blood group {blood_group!r}")
+
+        try:
+            units = int(row.get('units') or '')
+        except ValueError:
+            raise StockImportError(line, "units must be a whole number")
+        if units < 1:
+            raise StockImportError(line, "units must be at least 1")
+
+        try:
+            collected_on = _optional_date(row.get('collected_on')) or date.today()
+            expires_on = _optional_date(row.get('expires_on')) or BloodBatch.default_expiry(collected_on)
+        except ValueError:
+            raise StockImportError(line, "dates must be YYYY-MM-DD")
+        if expires_on < collected_on:
+            raise StockImportError(line, "expires_on is before collected_on")
+
+        yield {
+            'blood_group': blood_group,
+            'units': units,
+            'collected_on': collected_on,
+            'expires_on': expires_on,
+        }
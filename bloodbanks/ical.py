@@ -0,0 +1,131 @@
+"""
+iCalendar (.ics) feed of a blood bank's bookings
+
+Calendar clients poll the feed every few minutes, so the common case is
+"nothing changed": feed_state() answers that with one aggregate query
+(latest updated_at and row count of the bank's bookings, found through
+its calendar token), from which the view derives ETag and Last-Modified
+and returns 304 before any booking is read. Otherwise the body is
+streamed from an iterator over the bookings.
+"""
+from datetime import timedelta
+
+from django.db.models import Count, Max
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from donors.models import DonationSchedule
+from .models import DEFAULT_SLOT_MINUTES, BloodBank
+
+
+# Days of past bookings kept in the feed
+FEED_PAST_DAYS = 7
+
+FEED_CHUNK_SIZE = 500
+
+# Right-hand side of event UIDs, which must stay stable across fetches
+UID_DOMAIN = 'lifelink'
+
+# Statuses shown in the feed; cancelled and expired bookings drop out
+FEED_STATUSES = ['scheduled', 'completed']
+
+
+def feed_state(token):
+    """
+    {'pk', 'name', 'last_modified', 'bookings'} of the bank owning a
+    calendar token, or None for an unknown token
+    """
+    return BloodBank.objects.filter(calendar_token=token).annotate(
+        last_modified=Max('scheduled_donations__updated_at'),
+        bookings=Count('scheduled_donations'),
+    ).values('pk', 'name', 'last_modified', 'bookings').first()
+
+
+def etag(state, today=None):
+    """
+    Entity tag of a feed
+
+    The date is part of it because the feed's window moves daily even
+    when no booking changes.
+    """
+    today = today or timezone.localdate()
+    last_modified = state['last_modified'].timestamp() if state['last_modified'] else 0
+    return f'"{state["pk"]}-{state["bookings"]}-{last_modified:.6f}-{today.isoformat()}"'
+
+
+def _escape(value):
+    """Escape a TEXT value (RFC 5545 3.3.11)"""
+    return (
+        str(value).replace('\\', '\\\\').replace(';', '\\;')
+        .replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def _fold(line):
+    """Fold a content line to 75 octets (RFC 5545 3.1)"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+
+    parts = []
+    while encoded:
+        limit = 75 if not parts else 74
+        cut = min(limit, len(encoded))
+        # Do not split a multi-byte character
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _stamp(value):
+    return value.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _lines(state):
+    yield _fold('BEGIN:VCALENDAR')
+    yield _fold('VERSION:2.0')
+    yield _fold('PRODID:-//LifeLink//Blood Bank Bookings//EN')
+    yield _fold('CALSCALE:GREGORIAN')
+    yield _fold(f'X-WR-CALNAME:{_escape(state["name"])} donations')
+
+    bookings = DonationSchedule.objects.filter(
+        blood_bank_id=state['pk'],
+        status__in=FEED_STATUSES,
+        scheduled_date__gte=timezone.now() - timedelta(days=FEED_PAST_DAYS),
+    ).order_by('scheduled_date', 'id').values_list(
+        'id', 'scheduled_date', 'slot__ends_at', 'status', 'notes', 'updated_at',
+        'donor__user__username', 'donor__blood_group', 'donor__phone_number',
+    )
+
+    default_length = timedelta(minutes=DEFAULT_SLOT_MINUTES)
+    for (pk, starts_at, ends_at, status, notes, updated_at,
+         donor, blood_group, phone_number) in bookings.iterator(chunk_size=FEED_CHUNK_SIZE):
+        description = f'Blood group: {blood_group}'
+        if phone_number:
+            description += f'\nPhone: {phone_number}'
+        if notes:
+            description += f'\n{notes}'
+
+        yield _fold('BEGIN:VEVENT')
+        yield _fold(f'UID:donation-{pk}@{UID_DOMAIN}')
+        yield _fold(f'DTSTAMP:{_stamp(updated_at)}')
+        yield _fold(f'LAST-MODIFIED:{_stamp(updated_at)}')
+        yield _fold(f'DTSTART:{_stamp(starts_at)}')
+        yield _fold(f'DTEND:{_stamp(ends_at or starts_at + default_length)}')
+        yield _fold(f'SUMMARY:{_escape(f"Blood donation: {donor} ({blood_group})")}')
+        yield _fold(f'DESCRIPTION:{_escape(description)}')
+        yield _fold('STATUS:CONFIRMED')
+        if status == 'completed':
+            yield _fold('CATEGORIES:COMPLETED')
+        yield _fold('END:VEVENT')
+
+    yield _fold('END:VCALENDAR')
+
+
+def feed_response(state):
+    """Streamed .ics body of a bank's bookings"""
+    response = StreamingHttpResponse(_lines(state), content_type='text/calendar; charset=utf-8')
+    response['Content-Disposition'] = f'inline; filename="bloodbank-{state["pk"]}.ics"'
+    return response
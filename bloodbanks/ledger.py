@@ -0,0 +1,103 @@
+"""
+Point-in-time inventory from the InventoryTransaction ledger
+
+Stock at a moment is the latest InventorySnapshot taken before it plus
+the ledger deltas recorded after that snapshot, so a query only replays
+the tail since the last snapshot rather than the whole history.
+"""
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import BloodBank, BloodInventory, InventorySnapshot, InventoryTransaction
+
+
+def stock_on(blood_bank, at):
+    """Units per blood group held by blood_bank at the datetime at"""
+    snapshots = InventorySnapshot.objects.filter(blood_bank=blood_bank, taken_at__lte=at)
+    position = snapshots.aggregate(position=Max('ledger_position'))['position']
+
+    stock = {}
+    tail = InventoryTransaction.objects.filter(blood_bank=blood_bank, created_at__lte=at)
+    if position is not None:
+        stock = dict(
+            snapshots.filter(ledger_position=position).values_list('blood_group', 'units')
+        )
+        tail = tail.filter(pk__gt=position)
+
+    deltas = tail.values('blood_group').annotate(total=Sum('delta')).values_list('blood_group', 'total')
+    for blood_group, total in deltas:
+        stock[blood_group] = stock.get(blood_group, 0) + total
+
+    return {
+        blood_group: stock.get(blood_group, 0)
+        for blood_group, _ in BloodInventory.BLOOD_GROUP_CHOICES
+    }
+
+
+def units_received(blood_bank, start, end):
+    """Units added or donated per blood group between start and end"""
+    received = InventoryTransaction.objects.filter(
+        blood_bank=blood_bank,
+        reason__in=['add', 'donation'],
+        created_at__gte=start,
+        created_at__lt=end,
+    ).values('blood_group').annotate(total=Sum('delta')).values_list('blood_group', 'total')
+    return dict(received)
+
+
+def take_snapshot(blood_bank):
+    """
+    Record the bank's current stock at its latest ledger position
+
+    The inventory rows are locked first, so every ledger entry written
+    for them has committed and the counters agree with the ledger.
+    Returns the new snapshot rows (empty when the ledger has nothing
+    since the last snapshot).
+    """
+    with transaction.atomic():
+        stock = list(
+            BloodInventory.objects.select_for_update().filter(
+                blood_bank=blood_bank
+            ).order_by('blood_group').values_list('blood_group', 'units')
+        )
+        position = InventoryTransaction.objects.filter(
+            blood_bank=blood_bank
+        ).aggregate(position=Max('id'))['position']
+        last_snapshot = InventorySnapshot.objects.filter(
+            blood_bank=blood_bank
+        ).aggregate(position=Max('ledger_position'))['position']
+
+        if position is None or position == last_snapshot:
+            return []
+
+        taken_at = timezone.now()
+        return InventorySnapshot.objects.bulk_create([
+            InventorySnapshot(
+                blood_bank=blood_bank,
+                blood_group=blood_group,
+                units=units,
+                ledger_position=position,
+                taken_at=taken_at,
+            )
+            for blood_group, units in stock
+        ])
+
+
+def banks_needing_snapshot(min_transactions=1):
+    """Blood banks with at least min_transactions ledger entries since their last snapshot"""
+    last_snapshot = InventorySnapshot.objects.filter(
+        blood_bank=OuterRef('pk')
+    ).order_by('-ledger_position').values('ledger_position')[:1]
+
+    pending = InventoryTransaction.objects.filter(
+        blood_bank=OuterRef('pk'),
+        id__gt=Coalesce(OuterRef('last_snapshot'), 0),
+    ).values('blood_bank').annotate(count=Count('id')).values('count')
+
+    return BloodBank.objects.annotate(
+        last_snapshot=Subquery(last_snapshot)
+    ).annotate(
+        pending=Coalesce(Subquery(pending), 0)
+    ).filter(pending__gte=min_transactions)
@@ -0,0 +1,27 @@
+"""
+Write off blood batches past their expiry date
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from bloodbanks import services
+
+
+class Command(BaseCommand):
+    help = 'Mark expired blood batches and take their units out of inventory'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='Blood banks processed per transaction'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        batches, units = services.expire_batches(chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Expired {batches} batches ({units} units) in {elapsed:.2f}s.'
+        ))
@@ -0,0 +1,27 @@
+"""
+Create donation slots for the days ahead from blood bank opening hours
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from bloodbanks import slots
+
+
+class Command(BaseCommand):
+    help = 'Generate the missing donation slots of every blood bank from its opening hours'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=slots.SLOT_DAYS_AHEAD,
+            help='Days ahead to generate slots for'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        created = slots.generate(days=options['days'])
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {created} donation slots in {elapsed:.2f}s.'
+        ))
@@ -0,0 +1,21 @@
+"""
+Open the low-stock alerts missing for stock already below its threshold
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from bloodbanks import alerts
+
+
+class Command(BaseCommand):
+    help = 'Open a low-stock alert for every blood group below its threshold without one'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        opened = alerts.open_missing_alerts()
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Opened {opened} low-stock alerts in {elapsed:.2f}s.'
+        ))
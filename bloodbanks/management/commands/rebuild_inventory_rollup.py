@@ -0,0 +1,14 @@
+"""
+Rebuild the per-cell blood stock rollup from inventory
+"""
+from django.core.management.base import BaseCommand
+
+from bloodbanks import rollup
+
+
+class Command(BaseCommand):
+    help = 'Recompute blood bank cells and the InventoryRollup table from BloodInventory'
+
+    def handle(self, *args, **options):
+        rows = rollup.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt inventory rollup with {rows} rows.'))
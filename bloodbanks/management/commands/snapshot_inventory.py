@@ -0,0 +1,24 @@
+"""
+Snapshot blood bank stock so point-in-time queries replay a short ledger tail
+"""
+from django.core.management.base import BaseCommand
+
+from bloodbanks import ledger
+
+
+class Command(BaseCommand):
+    help = 'Record inventory snapshots for blood banks with new ledger entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-transactions', type=int, default=1,
+            help='Only snapshot banks with at least this many ledger entries since their last snapshot'
+        )
+
+    def handle(self, *args, **options):
+        snapshotted = 0
+        for blood_bank in ledger.banks_needing_snapshot(options['min_transactions']).iterator():
+            if ledger.take_snapshot(blood_bank):
+                snapshotted += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Recorded snapshots for {snapshotted} blood banks.'))
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def record_opening_balances(apps, schema_editor):
+    """Seed the ledger with the stock held before it existed"""
+    BloodInventory = apps.get_model('bloodbanks', 'BloodInventory')
+    InventoryTransaction = apps.get_model('bloodbanks', 'InventoryTransaction')
+
+    InventoryTransaction.objects.bulk_create(
+        [
+            InventoryTransaction(
+                blood_bank_id=inventory.blood_bank_id,
+                blood_group=inventory.blood_group,
+                delta=inventory.units,
+                reason='opening',
+                created_at=inventory.last_updated,
+            )
+            for inventory in BloodInventory.objects.filter(units__gt=0).iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bloodbanks', '0003_bloodbank_description_bloodbank_emergency_contact_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('blood_group', models.CharField(choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('AB+', 'AB+'), ('AB-', 'AB-'), ('O+', 'O+'), ('O-', 'O-')], max_length=3)),
+                ('delta', models.IntegerField()),
+                ('reason', models.CharField(choices=[('opening', 'Opening balance'), ('add', 'Add'), ('remove', 'Remove'), ('update', 'Update'), ('donation', 'Donation')], max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('blood_bank', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_transactions', to='bloodbanks.bloodbank')),
+            ],
+            options={
+                'verbose_name': 'Inventory Transaction',
+                'verbose_name_plural': 'Inventory Transactions',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['blood_bank', 'created_at'], name='bloodbanks_txn_bank_time_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='InventorySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('blood_group', models.CharField(choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('AB+', 'AB+'), ('AB-', 'AB-'), ('O+', 'O+'), ('O-', 'O-')], max_length=3)),
+                ('units', models.PositiveIntegerField()),
+                ('ledger_position', models.BigIntegerField()),
+                ('taken_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('blood_bank', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_snapshots', to='bloodbanks.bloodbank')),
+            ],
+            options={
+                'verbose_name': 'Inventory Snapshot',
+                'verbose_name_plural': 'Inventory Snapshots',
+                'indexes': [models.Index(fields=['blood_bank', 'taken_at'], name='bloodbanks_snap_bank_time_idx')],
+                'unique_together': {('blood_bank', 'blood_group', 'ledger_position')},
+            },
+        ),
+        migrations.RunPython(record_opening_balances, migrations.RunPython.noop),
+    ]
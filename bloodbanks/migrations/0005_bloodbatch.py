@@ -0,0 +1,70 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:46
+
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+SHELF_LIFE_DAYS = 35
+
+
+def create_legacy_batches(apps, schema_editor):
+    """
+    Back existing stock with one batch per blood group
+
+    The collection date of stock recorded before batches is unknown, so
+    it is treated as collected on the day of the migration.
+    """
+    BloodInventory = apps.get_model('bloodbanks', 'BloodInventory')
+    BloodBatch = apps.get_model('bloodbanks', 'BloodBatch')
+
+    today = datetime.date.today()
+    BloodBatch.objects.bulk_create(
+        [
+            BloodBatch(
+                blood_bank_id=inventory.blood_bank_id,
+                blood_group=inventory.blood_group,
+                units=inventory.units,
+                units_remaining=inventory.units,
+                collected_on=today,
+                expires_on=today + datetime.timedelta(days=SHELF_LIFE_DAYS),
+            )
+            for inventory in BloodInventory.objects.filter(units__gt=0).iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bloodbanks', '0004_inventory_ledger'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='inventorytransaction',
+            name='reason',
+            field=models.CharField(choices=[('opening', 'Opening balance'), ('add', 'Add'), ('remove', 'Remove'), ('update', 'Update'), ('donation', 'Donation'), ('expired', 'Expired')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='BloodBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('blood_group', models.CharField(choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('AB+', 'AB+'), ('AB-', 'AB-'), ('O+', 'O+'), ('O-', 'O-')], max_length=3)),
+                ('units', models.PositiveIntegerField()),
+                ('units_remaining', models.PositiveIntegerField()),
+                ('collected_on', models.DateField(default=datetime.date.today)),
+                ('expires_on', models.DateField()),
+                ('status', models.CharField(choices=[('available', 'Available'), ('depleted', 'Depleted'), ('expired', 'Expired')], default='available', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('blood_bank', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='batches', to='bloodbanks.bloodbank')),
+            ],
+            options={
+                'verbose_name': 'Blood Batch',
+                'verbose_name_plural': 'Blood Batches',
+                'indexes': [models.Index(fields=['blood_bank', 'blood_group', 'expires_on'], name='bloodbanks_batch_fefo_idx'), models.Index(condition=models.Q(('status', 'available')), fields=['expires_on'], name='bloodbanks_batch_expiry_idx')],
+            },
+        ),
+        migrations.RunPython(create_legacy_batches, migrations.RunPython.noop),
+    ]
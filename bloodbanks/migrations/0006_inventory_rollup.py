@@ -0,0 +1,66 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:49
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+from accounts.utils import encode_geohash
+
+
+ROLLUP_PRECISION = 4
+
+
+def build_rollup(apps, schema_editor):
+    BloodBank = apps.get_model('bloodbanks', 'BloodBank')
+    BloodInventory = apps.get_model('bloodbanks', 'BloodInventory')
+    InventoryRollup = apps.get_model('bloodbanks', 'InventoryRollup')
+
+    banks = list(BloodBank.objects.select_related('user'))
+    for bank in banks:
+        if bank.user.latitude is not None and bank.user.longitude is not None:
+            bank.geo_cell = encode_geohash(bank.user.latitude, bank.user.longitude, ROLLUP_PRECISION)
+    BloodBank.objects.bulk_update(banks, ['geo_cell'], batch_size=1000)
+
+    totals = BloodInventory.objects.exclude(blood_bank__geo_cell='').values(
+        'blood_bank__geo_cell', 'blood_group'
+    ).annotate(units=Sum('units')).filter(units__gt=0).order_by()
+    InventoryRollup.objects.bulk_create(
+        [
+            InventoryRollup(
+                cell=total['blood_bank__geo_cell'],
+                blood_group=total['blood_group'],
+                units=total['units'],
+            )
+            for total in totals
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bloodbanks', '0005_bloodbatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bloodbank',
+            name='geo_cell',
+            field=models.CharField(blank=True, db_index=True, max_length=12),
+        ),
+        migrations.CreateModel(
+            name='InventoryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cell', models.CharField(max_length=12)),
+                ('blood_group', models.CharField(choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('AB+', 'AB+'), ('AB-', 'AB-'), ('O+', 'O+'), ('O-', 'O-')], max_length=3)),
+                ('units', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Inventory Rollup',
+                'verbose_name_plural': 'Inventory Rollups',
+                'unique_together': {('cell', 'blood_group')},
+            },
+        ),
+        migrations.RunPython(build_rollup, migrations.RunPython.noop),
+    ]
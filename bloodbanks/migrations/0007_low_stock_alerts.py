@@ -0,0 +1,75 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+DEFAULT_LOW_STOCK_THRESHOLD = 10
+
+
+def open_existing_alerts(apps, schema_editor):
+    """Stock already below the default threshold starts with an open alert"""
+    BloodInventory = apps.get_model('bloodbanks', 'BloodInventory')
+    LowStockAlert = apps.get_model('bloodbanks', 'LowStockAlert')
+
+    LowStockAlert.objects.bulk_create(
+        [
+            LowStockAlert(
+                blood_bank_id=inventory.blood_bank_id,
+                blood_group=inventory.blood_group,
+                units=inventory.units,
+                threshold=DEFAULT_LOW_STOCK_THRESHOLD,
+            )
+            for inventory in BloodInventory.objects.filter(
+                units__lt=DEFAULT_LOW_STOCK_THRESHOLD
+            ).iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bloodbanks', '0006_inventory_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LowStockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('blood_group', models.CharField(choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('AB+', 'AB+'), ('AB-', 'AB-'), ('O+', 'O+'), ('O-', 'O-')], max_length=3)),
+                ('units', models.PositiveIntegerField()),
+                ('threshold', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+                ('blood_bank', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='low_stock_alerts', to='bloodbanks.bloodbank')),
+            ],
+            options={
+                'verbose_name': 'Low Stock Alert',
+                'verbose_name_plural': 'Low Stock Alerts',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LowStockThreshold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('blood_group', models.CharField(choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('AB+', 'AB+'), ('AB-', 'AB-'), ('O+', 'O+'), ('O-', 'O-')], max_length=3)),
+                ('threshold', models.PositiveIntegerField(default=10)),
+                ('blood_bank', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='low_stock_thresholds', to='bloodbanks.bloodbank')),
+            ],
+            options={
+                'verbose_name': 'Low Stock Threshold',
+                'verbose_name_plural': 'Low Stock Thresholds',
+                'unique_together': {('blood_bank', 'blood_group')},
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='lowstockalert',
+            constraint=models.UniqueConstraint(condition=models.Q(('resolved_at__isnull', True)), fields=('blood_bank', 'blood_group'), name='bloodbanks_one_open_low_stock_alert'),
+        ),
+        migrations.RunPython(open_existing_alerts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bloodbanks', '0007_low_stock_alerts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='inventorytransaction',
+            name='reason',
+            field=models.CharField(choices=[('opening', 'Opening balance'), ('add', 'Add'), ('remove', 'Remove'), ('update', 'Update'), ('donation', 'Donation'), ('expired', 'Expired'), ('import', 'Import')], max_length=20),
+        ),
+    ]
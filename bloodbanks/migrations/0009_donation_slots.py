@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bloodbanks', '0008_inventorytransaction_import_reason'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OpeningHours',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('opens_at', models.TimeField()),
+                ('closes_at', models.TimeField()),
+                ('slot_minutes', models.PositiveIntegerField(default=30)),
+                ('capacity', models.PositiveIntegerField(default=4, help_text='Donors per slot')),
+                ('blood_bank', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='opening_hours', to='bloodbanks.bloodbank')),
+            ],
+            options={
+                'verbose_name': 'Opening Hours',
+                'verbose_name_plural': 'Opening Hours',
+                'ordering': ['weekday'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DonationSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('starts_at', models.DateTimeField()),
+                ('ends_at', models.DateTimeField()),
+                ('capacity', models.PositiveIntegerField(default=4)),
+                ('booked', models.PositiveIntegerField(default=0)),
+                ('blood_bank', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='donation_slots', to='bloodbanks.bloodbank')),
+            ],
+            options={
+                'verbose_name': 'Donation Slot',
+                'verbose_name_plural': 'Donation Slots',
+                'ordering': ['starts_at'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='openinghours',
+            constraint=models.CheckConstraint(check=models.Q(('opens_at__lt', models.F('closes_at'))), name='bloodbanks_opening_hours_open_before_close'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='openinghours',
+            unique_together={('blood_bank', 'weekday')},
+        ),
+        migrations.AddConstraint(
+            model_name='donationslot',
+            constraint=models.UniqueConstraint(fields=('blood_bank', 'starts_at'), name='bloodbanks_one_slot_per_start'),
+        ),
+        migrations.AddConstraint(
+            model_name='donationslot',
+            constraint=models.CheckConstraint(check=models.Q(('booked__lte', models.F('capacity'))), name='bloodbanks_slot_within_capacity'),
+        ),
+    ]
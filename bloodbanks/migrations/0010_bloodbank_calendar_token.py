@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:20
+
+import secrets
+
+from django.db import migrations, models
+import bloodbanks.models
+
+
+def fill_calendar_tokens(apps, schema_editor):
+    """Give every existing bank its own feed token"""
+    BloodBank = apps.get_model('bloodbanks', 'BloodBank')
+    banks = list(BloodBank.objects.only('pk'))
+    for bank in banks:
+        bank.calendar_token = secrets.token_urlsafe(24)
+    BloodBank.objects.bulk_update(banks, ['calendar_token'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bloodbanks', '0009_donation_slots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bloodbank',
+            name='calendar_token',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(fill_calendar_tokens, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='bloodbank',
+            name='calendar_token',
+            field=models.CharField(default=bloodbanks.models.new_calendar_token, editable=False, max_length=64, unique=True),
+        ),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations
+from django.db.models import Exists, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+DEFAULT_LOW_STOCK_THRESHOLD = 10
+
+
+def open_missing_alerts(apps, schema_editor):
+    """Stock below its threshold without an open alert gets one"""
+    BloodInventory = apps.get_model('bloodbanks', 'BloodInventory')
+    LowStockAlert = apps.get_model('bloodbanks', 'LowStockAlert')
+    LowStockThreshold = apps.get_model('bloodbanks', 'LowStockThreshold')
+
+    threshold = LowStockThreshold.objects.filter(
+        blood_bank=OuterRef('blood_bank'), blood_group=OuterRef('blood_group')
+    ).values('threshold')[:1]
+    open_alerts = LowStockAlert.objects.filter(
+        blood_bank=OuterRef('blood_bank'), blood_group=OuterRef('blood_group'),
+        resolved_at__isnull=True,
+    )
+
+    low_stock = BloodInventory.objects.annotate(
+        threshold=Coalesce(Subquery(threshold), Value(DEFAULT_LOW_STOCK_THRESHOLD))
+    ).filter(units__lt=F('threshold')).exclude(Exists(open_alerts))
+
+    LowStockAlert.objects.bulk_create(
+        [
+            LowStockAlert(
+                blood_bank_id=inventory.blood_bank_id,
+                blood_group=inventory.blood_group,
+                units=inventory.units,
+                threshold=inventory.threshold,
+            )
+            for inventory in low_stock.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bloodbanks', '0010_bloodbank_calendar_token'),
+    ]
+
+    operations = [
+        migrations.RunPython(open_missing_alerts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,81 @@
+from datetime import datetime, time, timedelta
+
+from django.db import migrations
+from django.utils import timezone
+
+
+SLOT_DAYS_AHEAD = 14
+DEFAULT_OPEN_WEEKDAYS = range(6)
+DEFAULT_OPENS_AT = time(9)
+DEFAULT_CLOSES_AT = time(17)
+DEFAULT_SLOT_MINUTES = 30
+DEFAULT_SLOT_CAPACITY = 4
+
+
+def open_default_hours(apps, schema_editor):
+    """Banks without opening hours get the defaults and their first slots"""
+    BloodBank = apps.get_model('bloodbanks', 'BloodBank')
+    DonationSlot = apps.get_model('bloodbanks', 'DonationSlot')
+    OpeningHours = apps.get_model('bloodbanks', 'OpeningHours')
+
+    bank_ids = list(
+        BloodBank.objects.filter(opening_hours__isnull=True).values_list('pk', flat=True)
+    )
+    if not bank_ids:
+        return
+
+    OpeningHours.objects.bulk_create(
+        [
+            OpeningHours(
+                blood_bank_id=bank_id,
+                weekday=weekday,
+                opens_at=DEFAULT_OPENS_AT,
+                closes_at=DEFAULT_CLOSES_AT,
+                slot_minutes=DEFAULT_SLOT_MINUTES,
+                capacity=DEFAULT_SLOT_CAPACITY,
+            )
+            for bank_id in bank_ids
+            for weekday in DEFAULT_OPEN_WEEKDAYS
+        ],
+        batch_size=1000,
+    )
+
+    # Every bank has the same hours, so the slot times are worked out once
+    times = []
+    length = timedelta(minutes=DEFAULT_SLOT_MINUTES)
+    today = timezone.localdate()
+    for offset in range(SLOT_DAYS_AHEAD):
+        day = today + timedelta(days=offset)
+        if day.weekday() not in DEFAULT_OPEN_WEEKDAYS:
+            continue
+        start = timezone.make_aware(datetime.combine(day, DEFAULT_OPENS_AT))
+        close = timezone.make_aware(datetime.combine(day, DEFAULT_CLOSES_AT))
+        while start + length <= close:
+            times.append((start, start + length))
+            start += length
+
+    DonationSlot.objects.bulk_create(
+        [
+            DonationSlot(
+                blood_bank_id=bank_id,
+                starts_at=starts_at,
+                ends_at=ends_at,
+                capacity=DEFAULT_SLOT_CAPACITY,
+            )
+            for bank_id in bank_ids
+            for starts_at, ends_at in times
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bloodbanks', '0011_open_missing_low_stock_alerts'),
+    ]
+
+    operations = [
+        migrations.RunPython(open_default_hours, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bloodbanks', '0012_default_opening_hours'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bloodbank',
+            name='dashboard_version',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
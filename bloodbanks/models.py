@@ -184,10 +184,31 @@ Blood Bank models: BloodBank and BloodInventory
 #         return self.units < threshold
 
 
+import secrets
+from datetime import date, timedelta
+
 from django.db import models
+from django.db.models import F, Q, Sum
+from django.utils import timezone
 from accounts.models import User
 
 
+# Storage life of a unit of whole blood (CPDA-1), in days
+SHELF_LIFE_DAYS = 35
+
+# Units below which a blood group is low on stock, unless the bank sets its own
+DEFAULT_LOW_STOCK_THRESHOLD = 10
+
+# Length of a donation slot and donors booked into it, unless the bank sets its own
+DEFAULT_SLOT_MINUTES = 30
+DEFAULT_SLOT_CAPACITY = 4
+
+
+def new_calendar_token():
+    """Secret for a blood bank's calendar feed URL"""
+    return secrets.token_urlsafe(24)
+
+
 class BloodBank(models.Model):
     """
     Extended profile for Blood Banks
@@ -232,6 +253,21 @@ class BloodBank(models.Model):
         null=True
     )
 
+    # Geohash cell of the bank's location, kept by bloodbanks.rollup
+    geo_cell = models.CharField(max_length=12, blank=True, db_index=True)
+
+    # Secret part of the bank's iCalendar feed URL (see bloodbanks.ical)
+    calendar_token = models.CharField(
+        max_length=64,
+        unique=True,
+        default=new_calendar_token,
+        editable=False
+    )
+
+    # Bumped by every write the dashboard figures depend on; part of
+    # their cache key (see bloodbanks.stats)
+    dashboard_version = models.PositiveBigIntegerField(default=0, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -242,6 +278,16 @@ class BloodBank(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # dashboard_version only moves by UPDATE; saving a copy loaded
+        # before a bump must not write the old value back
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'dashboard_version'
+            ]
+        super().save(*args, **kwargs)
+
     # -------------------- EXISTING LOGIC (UNCHANGED) --------------------
 
     def get_distance_from(self, latitude, longitude):
@@ -261,12 +307,12 @@ class BloodBank(models.Model):
         )
 
     def get_total_units(self):
-        """Get total blood units in inventory"""
-        return sum(inv.units for inv in self.inventory.all())
+        """Get total unexpired blood units held in batches"""
+        return self.batches.live().aggregate(total=Sum('units_remaining'))['total'] or 0
 
-    def get_low_stock_alerts(self, threshold=10):
-        """Get blood groups with low stock"""
-        return self.inventory.filter(units__lt=threshold)
+    def get_low_stock_alerts(self):
+        """Get the open low-stock alerts"""
+        return self.low_stock_alerts.filter(resolved_at__isnull=True).order_by('blood_group')
 
 
 class BloodInventory(models.Model):
@@ -305,8 +351,384 @@ class BloodInventory(models.Model):
         unique_together = ['blood_bank', 'blood_group']
 
     def __str__(self):
-        return f"{self.blood_bank.name} - {self.bood_group}: {self.units} units"
+        return f"{self.blood_bank.name} - {self.blood_group}: {self.units} units"
 
     def is_low_stock(self, threshold=10):
         """Check if stock is low"""
         return self.units < threshold
+
+
+class BloodBatchQuerySet(models.QuerySet):
+    """
+    Lookups over blood batches
+    """
+
+    def live(self, on=None):
+        """Batches with units left that have not expired by the given date"""
+        on = on or date.today()
+        return self.filter(status=BloodBatch.AVAILABLE, expires_on__gte=on)
+
+    def past_expiry(self, on=None):
+        """Batches still marked available whose expiry date has passed"""
+        on = on or date.today()
+        return self.filter(status=BloodBatch.AVAILABLE, expires_on__lt=on)
+
+
+class BloodBatch(models.Model):
+    """
+    Units of one blood group collected together, with their expiry date
+
+    BloodInventory.units is kept equal to the units remaining in a
+    bank's available batches by bloodbanks.services.
+    """
+
+    AVAILABLE = 'available'
+    DEPLETED = 'depleted'
+    EXPIRED = 'expired'
+
+    STATUS_CHOICES = [
+        (AVAILABLE, 'Available'),
+        (DEPLETED, 'Depleted'),
+        (EXPIRED, 'Expired'),
+    ]
+
+    blood_bank = models.ForeignKey(
+        BloodBank,
+        on_delete=models.CASCADE,
+        related_name='batches'
+    )
+
+    blood_group = models.CharField(
+        max_length=3,
+        choices=BloodInventory.BLOOD_GROUP_CHOICES
+    )
+
+    units = models.PositiveIntegerField()
+    units_remaining = models.PositiveIntegerField()
+    collected_on = models.DateField(default=date.today)
+    expires_on = models.DateField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=AVAILABLE)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = BloodBatchQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Blood Batch'
+        verbose_name_plural = 'Blood Batches'
+        indexes = [
+            # First-expired-first-out consumption
+            models.Index(
+                fields=['blood_bank', 'blood_group', 'expires_on'],
+                name='bloodbanks_batch_fefo_idx'
+            ),
+            # Expiry sweeps only look at batches still in stock
+            models.Index(
+                fields=['expires_on'],
+                name='bloodbanks_batch_expiry_idx',
+                condition=Q(status='available')
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.blood_bank.name} - {self.blood_group}: {self.units_remaining}/{self.units} units, expires {self.expires_on}"
+
+    @staticmethod
+    def default_expiry(collected_on):
+        return collected_on + timedelta(days=SHELF_LIFE_DAYS)
+
+
+class InventoryTransaction(models.Model):
+    """
+    Append-only ledger of inventory changes
+
+    Written by the inventory service for every add, remove, update and
+    completed donation; rows are never edited or deleted.
+    """
+
+    REASON_CHOICES = [
+        ('opening', 'Opening balance'),
+        ('add', 'Add'),
+        ('remove', 'Remove'),
+        ('update', 'Update'),
+        ('donation', 'Donation'),
+        ('expired', 'Expired'),
+        ('import', 'Import'),
+    ]
+
+    blood_bank = models.ForeignKey(
+        BloodBank,
+        on_delete=models.CASCADE,
+        related_name='inventory_transactions'
+    )
+
+    blood_group = models.CharField(
+        max_length=3,
+        choices=BloodInventory.BLOOD_GROUP_CHOICES
+    )
+
+    delta = models.IntegerField()
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Inventory Transaction'
+        verbose_name_plural = 'Inventory Transactions'
+        ordering = ['id']
+        indexes = [
+            models.Index(
+                fields=['blood_bank', 'created_at'],
+                name='bloodbanks_txn_bank_time_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.blood_bank.name} - {self.blood_group}: {self.delta:+d} ({self.reason})"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Inventory transactions are append-only")
+        super().save(*args, **kwargs)
+
+
+class InventorySnapshot(models.Model):
+    """
+    Stock of one blood group at a point in the ledger
+
+    ledger_position is the id of the last InventoryTransaction the
+    snapshot includes; later stock is the snapshot plus the deltas after it.
+    """
+
+    blood_bank = models.ForeignKey(
+        BloodBank,
+        on_delete=models.CASCADE,
+        related_name='inventory_snapshots'
+    )
+
+    blood_group = models.CharField(
+        max_length=3,
+        choices=BloodInventory.BLOOD_GROUP_CHOICES
+    )
+
+    units = models.PositiveIntegerField()
+    ledger_position = models.BigIntegerField()
+    taken_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Inventory Snapshot'
+        verbose_name_plural = 'Inventory Snapshots'
+        unique_together = ['blood_bank', 'blood_group', 'ledger_position']
+        indexes = [
+            models.Index(
+                fields=['blood_bank', 'taken_at'],
+                name='bloodbanks_snap_bank_time_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.blood_bank.name} - {self.blood_group}: {self.units} units at {self.taken_at}"
+
+
+class InventoryRollup(models.Model):
+    """
+    Units of one blood group held by all blood banks in a geohash cell
+
+    Maintained incrementally by bloodbanks.rollup from inventory changes.
+    """
+
+    cell = models.CharField(max_length=12)
+
+    blood_group = models.CharField(
+        max_length=3,
+        choices=BloodInventory.BLOOD_GROUP_CHOICES
+    )
+
+    units = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Inventory Rollup'
+        verbose_name_plural = 'Inventory Rollups'
+        unique_together = ['cell', 'blood_group']
+
+    def __str__(self):
+        return f"{self.cell} - {self.blood_group}: {self.units} units"
+
+
+class LowStockThreshold(models.Model):
+    """
+    Units below which a blood bank considers a blood group low on stock
+    """
+
+    blood_bank = models.ForeignKey(
+        BloodBank,
+        on_delete=models.CASCADE,
+        related_name='low_stock_thresholds'
+    )
+
+    blood_group = models.CharField(
+        max_length=3,
+        choices=BloodInventory.BLOOD_GROUP_CHOICES
+    )
+
+    threshold = models.PositiveIntegerField(default=DEFAULT_LOW_STOCK_THRESHOLD)
+
+    class Meta:
+        verbose_name = 'Low Stock Threshold'
+        verbose_name_plural = 'Low Stock Thresholds'
+        unique_together = ['blood_bank', 'blood_group']
+
+    def __str__(self):
+        return f"{self.blood_bank.name} - {self.blood_group}: below {self.threshold} units"
+
+
+class LowStockAlert(models.Model):
+    """
+    A blood group's stock falling below its threshold
+
+    Raised by bloodbanks.alerts when an inventory change crosses the
+    threshold and resolved once stock is back at or above it.
+    """
+
+    blood_bank = models.ForeignKey(
+        BloodBank,
+        on_delete=models.CASCADE,
+        related_name='low_stock_alerts'
+    )
+
+    blood_group = models.CharField(
+        max_length=3,
+        choices=BloodInventory.BLOOD_GROUP_CHOICES
+    )
+
+    units = models.PositiveIntegerField()
+    threshold = models.PositiveIntegerField()
+
+    created_at = models.DateTimeField(default=timezone.now)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Low Stock Alert'
+        verbose_name_plural = 'Low Stock Alerts'
+        ordering = ['-created_at']
+        constraints = [
+            # At most one open alert per blood group
+            models.UniqueConstraint(
+                fields=['blood_bank', 'blood_group'],
+                condition=Q(resolved_at__isnull=True),
+                name='bloodbanks_one_open_low_stock_alert'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.blood_bank.name} - {self.blood_group}: {self.units} units (below {self.threshold})"
+
+    @property
+    def is_open(self):
+        return self.resolved_at is None
+
+
+class OpeningHours(models.Model):
+    """
+    A blood bank's opening hours on one weekday
+
+    bloodbanks.slots cuts them into DonationSlots of slot_minutes, each
+    taking up to capacity donors.
+    """
+
+    WEEKDAY_CHOICES = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    ]
+
+    blood_bank = models.ForeignKey(
+        BloodBank,
+        on_delete=models.CASCADE,
+        related_name='opening_hours'
+    )
+
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    opens_at = models.TimeField()
+    closes_at = models.TimeField()
+
+    slot_minutes = models.PositiveIntegerField(default=DEFAULT_SLOT_MINUTES)
+    capacity = models.PositiveIntegerField(
+        default=DEFAULT_SLOT_CAPACITY,
+        help_text='Donors per slot'
+    )
+
+    class Meta:
+        verbose_name = 'Opening Hours'
+        verbose_name_plural = 'Opening Hours'
+        ordering = ['weekday']
+        unique_together = ['blood_bank', 'weekday']
+        constraints = [
+            models.CheckConstraint(
+                check=Q(opens_at__lt=F('closes_at')),
+                name='bloodbanks_opening_hours_open_before_close'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.blood_bank.name} - {self.get_weekday_display()}: {self.opens_at:%H:%M}-{self.closes_at:%H:%M}"
+
+
+class DonationSlotQuerySet(models.QuerySet):
+
+    def open(self, now=None):
+        """Future slots with room left"""
+        return self.filter(
+            starts_at__gt=now or timezone.now(),
+            booked__lt=F('capacity')
+        )
+
+
+class DonationSlot(models.Model):
+    """
+    A time window in which a blood bank takes up to `capacity` donors
+
+    `booked` counts the active bookings; bloodbanks.slots claims and
+    releases places with conditional UPDATEs so it never exceeds capacity.
+    """
+
+    blood_bank = models.ForeignKey(
+        BloodBank,
+        on_delete=models.CASCADE,
+        related_name='donation_slots'
+    )
+
+    starts_at = models.DateTimeField()
+    ends_at = models.DateTimeField()
+
+    capacity = models.PositiveIntegerField(default=DEFAULT_SLOT_CAPACITY)
+    booked = models.PositiveIntegerField(default=0)
+
+    objects = DonationSlotQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Donation Slot'
+        verbose_name_plural = 'Donation Slots'
+        ordering = ['starts_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['blood_bank', 'starts_at'],
+                name='bloodbanks_one_slot_per_start'
+            ),
+            # Last line of defence against overbooking
+            models.CheckConstraint(
+                check=Q(booked__lte=F('capacity')),
+                name='bloodbanks_slot_within_capacity'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.blood_bank.name} - {timezone.localtime(self.starts_at):%d %b %Y %H:%M} ({self.booked}/{self.capacity})"
+
+    @property
+    def remaining(self):
+        return self.capacity - self.booked
+
@@ -0,0 +1,95 @@
+"""
+Keyset (seek) pagination of donation schedules
+
+Pages are cut on (scheduled_date, id) instead of with OFFSET: the cursor
+holds the key of the last row shown and the next page starts right after
+it, so any page is one seek into the (blood_bank, status, scheduled_date)
+index, however deep into the listing it is.
+"""
+import base64
+
+from django.db.models import Q
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import BloodInventory
+from .stats import day_bounds
+
+
+PAGE_SIZE = 50
+
+
+def encode_cursor(schedule):
+    """Opaque cursor for the rows after `schedule`"""
+    key = f'{schedule.scheduled_date.isoformat()}|{schedule.pk}'
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(scheduled_date, id) of a cursor; raises ValueError if malformed"""
+    try:
+        key = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        scheduled_date, pk = key.split('|')
+        scheduled_date = parse_datetime(scheduled_date)
+        pk = int(pk)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+    if scheduled_date is None:
+        raise ValueError('Invalid cursor')
+    return scheduled_date, pk
+
+
+def filter_schedules(queryset, params):
+    """
+    Apply the listing filters: date_from and date_to (YYYY-MM-DD, both
+    inclusive) and the donor's blood_group. Raises ValueError on a bad
+    value.
+    """
+    date_from = params.get('date_from')
+    if date_from:
+        day = parse_date(date_from)
+        if day is None:
+            raise ValueError('Invalid date_from')
+        queryset = queryset.filter(scheduled_date__gte=day_bounds(day)[0])
+
+    date_to = params.get('date_to')
+    if date_to:
+        day = parse_date(date_to)
+        if day is None:
+            raise ValueError('Invalid date_to')
+        queryset = queryset.filter(scheduled_date__lt=day_bounds(day)[1])
+
+    blood_group = params.get('blood_group')
+    if blood_group:
+        if blood_group not in dict(BloodInventory.BLOOD_GROUP_CHOICES):
+            raise ValueError('Invalid blood_group')
+        queryset = queryset.filter(donor__blood_group=blood_group)
+
+    return queryset
+
+
+def page(queryset, cursor=None, descending=False, page_size=PAGE_SIZE):
+    """
+    One page of schedules ordered by (scheduled_date, id)
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    if descending:
+        ordering = ['-scheduled_date', '-id']
+    else:
+        ordering = ['scheduled_date', 'id']
+    queryset = queryset.order_by(*ordering)
+
+    if cursor:
+        scheduled_date, pk = decode_cursor(cursor)
+        if descending:
+            after = Q(scheduled_date__lt=scheduled_date) | Q(scheduled_date=scheduled_date, id__lt=pk)
+        else:
+            after = Q(scheduled_date__gt=scheduled_date) | Q(scheduled_date=scheduled_date, id__gt=pk)
+        queryset = queryset.filter(after)
+
+    # One extra row tells whether there is a next page
+    rows = list(queryset[:page_size + 1])
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
@@ -0,0 +1,159 @@
+"""
+Blood stock rolled up per geohash cell
+
+InventoryRollup holds, for every cell and blood group, the units held by
+all blood banks located in that cell. Inventory changes apply their
+delta to the bank's cell in the same transaction (see
+bloodbanks.signals), and a bank moving shifts its whole stock between
+cells, so "is O- stocked anywhere near here?" is answered from a handful
+of rollup rows instead of the banks themselves.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Sum, Value, When
+
+from accounts.utils import decode_geohash, encode_geohash
+from .models import BloodBank, BloodInventory, InventoryRollup
+
+
+# Rollup cell precision (~39 km x 20 km)
+ROLLUP_PRECISION = 4
+
+
+def cell_for(latitude, longitude):
+    """Rollup cell of a location ('' when unknown)"""
+    if latitude is None or longitude is None:
+        return ''
+    return encode_geohash(latitude, longitude, ROLLUP_PRECISION)
+
+
+def apply(cell, blood_group, delta):
+    """Add delta units of blood_group to a cell's rollup"""
+    if not cell or not delta:
+        return
+
+    updated = InventoryRollup.objects.filter(
+        cell=cell, blood_group=blood_group
+    ).update(units=F('units') + delta)
+    if updated:
+        return
+
+    try:
+        with transaction.atomic():
+            InventoryRollup.objects.create(cell=cell, blood_group=blood_group, units=delta)
+    except IntegrityError:
+        # Created concurrently by another session
+        InventoryRollup.objects.filter(
+            cell=cell, blood_group=blood_group
+        ).update(units=F('units') + delta)
+
+
+def apply_many(cell, deltas_by_group):
+    """
+    apply() for several blood groups of one cell with two queries
+
+    The missing rows are inserted first, so the single UPDATE adding
+    every group's delta never races a concurrent insert.
+    """
+    deltas_by_group = {group: delta for group, delta in deltas_by_group.items() if delta}
+    if not cell or not deltas_by_group:
+        return
+
+    InventoryRollup.objects.bulk_create(
+        [InventoryRollup(cell=cell, blood_group=group, units=0) for group in deltas_by_group],
+        ignore_conflicts=True,
+    )
+    InventoryRollup.objects.filter(
+        cell=cell, blood_group__in=list(deltas_by_group)
+    ).update(units=F('units') + Case(
+        *[When(blood_group=group, then=Value(delta)) for group, delta in deltas_by_group.items()],
+        default=Value(0),
+    ))
+
+
+def move_bank(blood_bank_id, new_cell):
+    """Record a bank's new cell and shift its stock there from the old one"""
+    with transaction.atomic():
+        old_cell = BloodBank.objects.select_for_update().filter(
+            pk=blood_bank_id
+        ).values_list('geo_cell', flat=True).first()
+        if old_cell is None or old_cell == new_cell:
+            return
+
+        BloodBank.objects.filter(pk=blood_bank_id).update(geo_cell=new_cell)
+        stock = BloodInventory.objects.filter(
+            blood_bank_id=blood_bank_id, units__gt=0
+        ).values_list('blood_group', 'units')
+        for blood_group, units in stock:
+            apply(old_cell, blood_group, -units)
+            apply(new_cell, blood_group, units)
+
+
+def rebuild():
+    """Recompute every bank's cell and the whole rollup from inventory"""
+    with transaction.atomic():
+        banks = list(BloodBank.objects.select_related('user').only(
+            'geo_cell', 'user__latitude', 'user__longitude'
+        ))
+        for bank in banks:
+            bank.geo_cell = cell_for(bank.user.latitude, bank.user.longitude)
+        BloodBank.objects.bulk_update(banks, ['geo_cell'], batch_size=1000)
+
+        totals = BloodInventory.objects.exclude(blood_bank__geo_cell='').values(
+            'blood_bank__geo_cell', 'blood_group'
+        ).annotate(units=Sum('units')).filter(units__gt=0).order_by()
+
+        InventoryRollup.objects.all().delete()
+        InventoryRollup.objects.bulk_create(
+            [
+                InventoryRollup(
+                    cell=total['blood_bank__geo_cell'],
+                    blood_group=total['blood_group'],
+                    units=total['units'],
+                )
+                for total in totals
+            ],
+            batch_size=1000,
+        )
+        return InventoryRollup.objects.count()
+
+
+def stocked_cells(cells, blood_groups):
+    """The cells among `cells` holding any units of blood_groups"""
+    return set(
+        InventoryRollup.objects.filter(
+            cell__in=list(cells),
+            blood_group__in=list(blood_groups),
+            units__gt=0,
+        ).values_list('cell', flat=True).distinct()
+    )
+
+
+def heatmap(cells, blood_groups):
+    """
+    Units per stocked cell, for a map
+
+    Returns [{'cell', 'latitude', 'longitude', 'units', 'by_group'}]
+    with the coordinates of each cell's centre, most units first.
+    """
+    rows = InventoryRollup.objects.filter(
+        cell__in=list(cells),
+        blood_group__in=list(blood_groups),
+        units__gt=0,
+    ).values_list('cell', 'blood_group', 'units')
+
+    by_cell = {}
+    for cell, blood_group, units in rows:
+        by_cell.setdefault(cell, {})[blood_group] = units
+
+    result = []
+    for cell, by_group in by_cell.items():
+        latitude, longitude = decode_geohash(cell)
+        result.append({
+            'cell': cell,
+            'latitude': round(latitude, 5),
+            'longitude': round(longitude, 5),
+            'units': sum(by_group.values()),
+            'by_group': by_group,
+        })
+    result.sort(key=lambda item: -item['units'])
+    return result
@@ -0,0 +1,9 @@
+"""
+WebSocket routing for blood banks
+"""
+from django.urls import re_path
+from . import consumers
+
+websocket_urlpatterns = [
+    re_path(r'ws/bloodbank/alerts/$', consumers.LowStockAlertConsumer.as_asgi()),
+]
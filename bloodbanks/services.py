@@ -0,0 +1,461 @@
+"""
+Inventory service: every change to BloodInventory.units goes through here
+
+Changes are single UPDATE statements with F() expressions (or run under
+select_for_update when the old value is needed) inside
+transaction.atomic, so concurrent staff sessions and donation
+completions never overwrite each other's counts. Each change is also
+appended to the InventoryTransaction ledger in the same transaction.
+
+Stock is held in BloodBatch rows: additions create a batch, removals
+consume the live batches first-expired-first-out, and the counter on
+BloodInventory stays equal to the units left in available batches.
+Batch rows are only touched while the blood group's inventory row is
+locked, which serialises them with the counter updates.
+
+Every write sends one inventory_changed per blood bank, listing all the
+groups it changed, so receivers do their work once per bank.
+"""
+from collections import defaultdict
+from datetime import date
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import BloodBatch, BloodInventory, InventoryTransaction
+from .signals import inventory_changed
+
+
+class InsufficientStock(Exception):
+    """Raised when removing more units than a blood group has in stock"""
+
+    def __init__(self, blood_group, requested, available):
+        self.blood_group = blood_group
+        self.requested = requested
+        self.available = available
+        super().__init__(
+            f"Not enough {blood_group} units in inventory "
+            f"(requested {requested}, available {available})"
+        )
+
+
+def _locked_inventory(blood_bank, blood_group):
+    """Fetch (creating if needed) the inventory row, locked for update"""
+    try:
+        return BloodInventory.objects.select_for_update().get(
+            blood_bank=blood_bank, blood_group=blood_group
+        )
+    except BloodInventory.DoesNotExist:
+        pass
+
+    try:
+        with transaction.atomic():
+            return BloodInventory.objects.create(
+                blood_bank=blood_bank, blood_group=blood_group, units=0
+            )
+    except IntegrityError:
+        # Created concurrently by another session
+        return BloodInventory.objects.select_for_update().get(
+            blood_bank=blood_bank, blood_group=blood_group
+        )
+
+
+def _consume(batches, units):
+    """Take units from batches in the given order; returns the batches touched"""
+    touched = []
+    for batch in batches:
+        if units == 0:
+            break
+        taken = min(batch.units_remaining, units)
+        batch.units_remaining -= taken
+        if batch.units_remaining == 0:
+            batch.status = BloodBatch.DEPLETED
+        units -= taken
+        touched.append(batch)
+    return touched
+
+
+def _take_from_batches(blood_bank, blood_group, units, today):
+    """Consume units from the live batches, soonest expiry first"""
+    batches = list(
+        BloodBatch.objects.live(today).filter(
+            blood_bank=blood_bank, blood_group=blood_group
+        ).order_by('expires_on', 'id')
+    )
+    available = sum(batch.units_remaining for batch in batches)
+    if available < units:
+        raise InsufficientStock(blood_group, units, available)
+
+    BloodBatch.objects.bulk_update(_consume(batches, units), ['units_remaining', 'status'])
+
+
+def _reconcile_batches(blood_bank, units_by_group, today):
+    """
+    Make each group's live batches add up to its counted units
+
+    Batches past expiry are written off, a shortfall is taken from the
+    soonest-expiring batches and a surplus becomes a new batch collected
+    today.
+    """
+    groups = list(units_by_group)
+    BloodBatch.objects.past_expiry(today).filter(
+        blood_bank=blood_bank, blood_group__in=groups
+    ).update(status=BloodBatch.EXPIRED)
+
+    batches_by_group = defaultdict(list)
+    for batch in BloodBatch.objects.live(today).filter(
+        blood_bank=blood_bank, blood_group__in=groups
+    ).order_by('expires_on', 'id'):
+        batches_by_group[batch.blood_group].append(batch)
+
+    new_batches = []
+    touched = []
+    for blood_group, units in units_by_group.items():
+        batches = batches_by_group[blood_group]
+        live = sum(batch.units_remaining for batch in batches)
+        if units > live:
+            new_batches.append(BloodBatch(
+                blood_bank=blood_bank,
+                blood_group=blood_group,
+                units=units - live,
+                units_remaining=units - live,
+                collected_on=today,
+                expires_on=BloodBatch.default_expiry(today),
+            ))
+        elif units < live:
+            touched.extend(_consume(batches, live - units))
+
+    BloodBatch.objects.bulk_create(new_batches)
+    BloodBatch.objects.bulk_update(touched, ['units_remaining', 'status'])
+
+
+def _ledger_entry(inventory, previous_units, reason):
+    return InventoryTransaction(
+        blood_bank_id=inventory.blood_bank_id,
+        blood_group=inventory.blood_group,
+        delta=inventory.units - previous_units,
+        reason=reason,
+        created_at=inventory.last_updated,
+    )
+
+
+def _changed(blood_bank_id, changes, reason, record=True):
+    """Record and announce changes [(inventory, previous_units)] of one bank"""
+    if record:
+        InventoryTransaction.objects.bulk_create([
+            _ledger_entry(inventory, previous_units, reason)
+            for inventory, previous_units in changes
+            if inventory.units != previous_units
+        ])
+    inventory_changed.send(
+        sender=BloodInventory,
+        blood_bank_id=blood_bank_id,
+        changes=changes,
+        reason=reason,
+    )
+
+
+def add_units(blood_bank, blood_group, units, reason='add', collected_on=None, expires_on=None):
+    """
+    Add a batch of units to a blood group's stock; returns the updated row
+
+    collected_on defaults to today and expires_on to SHELF_LIFE_DAYS
+    after collection.
+    """
+    if units < 0:
+        raise ValueError("units must not be negative")
+
+    collected_on = collected_on or date.today()
+    expires_on = expires_on or BloodBatch.default_expiry(collected_on)
+
+    with transaction.atomic():
+        updated = BloodInventory.objects.filter(
+            blood_bank=blood_bank, blood_group=blood_group
+        ).update(units=F('units') + units, last_updated=timezone.now())
+
+        if not updated:
+            inventory = _locked_inventory(blood_bank, blood_group)
+            BloodInventory.objects.filter(pk=inventory.pk).update(
+                units=F('units') + units, last_updated=timezone.now()
+            )
+
+        if units:
+            BloodBatch.objects.create(
+                blood_bank=blood_bank,
+                blood_group=blood_group,
+                units=units,
+                units_remaining=units,
+                collected_on=collected_on,
+                expires_on=expires_on,
+            )
+
+        inventory = BloodInventory.objects.get(blood_bank=blood_bank, blood_group=blood_group)
+        _changed(inventory.blood_bank_id, [(inventory, inventory.units - units)], reason)
+        return inventory
+
+
+def remove_units(blood_bank, blood_group, units, reason='remove'):
+    """
+    Take units out of a blood group's stock; returns the updated row
+
+    The decrement only applies while enough unexpired stock is left,
+    otherwise InsufficientStock is raised and nothing changes. Units come
+    out of the batches that expire soonest.
+    """
+    if units < 0:
+        raise ValueError("units must not be negative")
+
+    with transaction.atomic():
+        updated = BloodInventory.objects.filter(
+            blood_bank=blood_bank, blood_group=blood_group, units__gte=units
+        ).update(units=F('units') - units, last_updated=timezone.now())
+
+        if not updated:
+            available = BloodInventory.objects.filter(
+                blood_bank=blood_bank, blood_group=blood_group
+            ).values_list('units', flat=True).first()
+            if available is None:
+                raise BloodInventory.DoesNotExist(f"No {blood_group} inventory for this blood bank")
+            raise InsufficientStock(blood_group, units, available)
+
+        _take_from_batches(blood_bank, blood_group, units, date.today())
+
+        inventory = BloodInventory.objects.get(blood_bank=blood_bank, blood_group=blood_group)
+        _changed(inventory.blood_bank_id, [(inventory, inventory.units + units)], reason)
+        return inventory
+
+
+def set_units(blood_bank, blood_group, units, reason='update'):
+    """Overwrite a blood group's stock with a counted value"""
+    if units < 0:
+        raise ValueError("units must not be negative")
+
+    with transaction.atomic():
+        inventory = _locked_inventory(blood_bank, blood_group)
+        previous_units = inventory.units
+        _reconcile_batches(blood_bank, {blood_group: units}, date.today())
+        BloodInventory.objects.filter(pk=inventory.pk).update(
+            units=units, last_updated=timezone.now()
+        )
+        inventory.refresh_from_db(fields=['units', 'last_updated'])
+        _changed(inventory.blood_bank_id, [(inventory, previous_units)], reason)
+        return inventory
+
+
+def _write_counts(blood_bank, units_by_group, previous, reason):
+    """
+    Upsert counted units for several groups and record the changes
+
+    previous maps blood group to units before the change (rows locked by
+    the caller). Returns the bank's full inventory, ordered by blood group.
+    """
+    BloodInventory.objects.bulk_create(
+        [
+            BloodInventory(blood_bank=blood_bank, blood_group=blood_group, units=units)
+            for blood_group, units in units_by_group.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['blood_bank', 'blood_group'],
+        update_fields=['units', 'last_updated'],
+    )
+
+    snapshot = list(BloodInventory.objects.filter(blood_bank=blood_bank).order_by('blood_group'))
+    changed = [
+        (inventory, previous.get(inventory.blood_group, 0))
+        for inventory in snapshot
+        if inventory.blood_group in units_by_group and (
+            inventory.blood_group not in previous
+            or previous[inventory.blood_group] != inventory.units
+        )
+    ]
+
+    if changed:
+        _changed(blood_bank.pk, changed, reason)
+
+    return snapshot
+
+
+def _check_units_by_group(units_by_group):
+    valid_groups = {group for group, _ in BloodInventory.BLOOD_GROUP_CHOICES}
+    for blood_group, units in units_by_group.items():
+        if blood_group not in valid_groups:
+            raise ValueError(f"Unknown blood group: {blood_group}")
+        if units < 0:
+            raise ValueError("units must not be negative")
+
+
+def bulk_add_units(blood_bank, units_by_group, reason='add', collected_on=None):
+    """
+    Add a batch of units to each of several blood groups at once
+
+    units_by_group maps blood group to units received. Missing inventory
+    rows are created first so every counter can be locked, then one bulk
+    insert adds the batches and one upsert writes the counters, whatever
+    the number of groups. Returns the bank's full inventory snapshot,
+    ordered by blood group.
+    """
+    _check_units_by_group(units_by_group)
+    units_by_group = {group: units for group, units in units_by_group.items() if units}
+    collected_on = collected_on or date.today()
+
+    with transaction.atomic():
+        BloodInventory.objects.bulk_create(
+            [
+                BloodInventory(blood_bank=blood_bank, blood_group=blood_group, units=0)
+                for blood_group in units_by_group
+            ],
+            ignore_conflicts=True,
+        )
+        previous = dict(
+            BloodInventory.objects.select_for_update().filter(
+                blood_bank=blood_bank,
+                blood_group__in=list(units_by_group)
+            ).values_list('blood_group', 'units')
+        )
+        BloodBatch.objects.bulk_create([
+            BloodBatch(
+                blood_bank=blood_bank,
+                blood_group=blood_group,
+                units=units,
+                units_remaining=units,
+                collected_on=collected_on,
+                expires_on=BloodBatch.default_expiry(collected_on),
+            )
+            for blood_group, units in units_by_group.items()
+        ])
+        return _write_counts(
+            blood_bank,
+            {blood_group: previous[blood_group] + units for blood_group, units in units_by_group.items()},
+            previous,
+            reason,
+        )
+
+
+def bulk_set_units(blood_bank, units_by_group, reason='update'):
+    """
+    Overwrite the stock of several blood groups at once
+
+    units_by_group maps blood group to counted units. All rows are
+    written by one upsert (bulk_create with update_conflicts) inside a
+    single transaction. Returns the bank's full inventory snapshot,
+    ordered by blood group.
+    """
+    _check_units_by_group(units_by_group)
+
+    with transaction.atomic():
+        previous = dict(
+            BloodInventory.objects.select_for_update().filter(
+                blood_bank=blood_bank,
+                blood_group__in=list(units_by_group)
+            ).values_list('blood_group', 'units')
+        )
+        _reconcile_batches(blood_bank, units_by_group, date.today())
+        return _write_counts(blood_bank, units_by_group, previous, reason)
+
+
+def import_stock(blood_bank, batches, reason='import', chunk_size=1000):
+    """
+    Replace a bank's stock with the batches of a stock file
+
+    batches is an iterable of dicts with blood_group, units, collected_on
+    and expires_on, consumed as it goes and written chunk_size rows per
+    bulk_create, so the file is never held in memory. The bank's current
+    available batches are written off, and every group's counter is set
+    to the unexpired units imported. Anything raised while reading the
+    batches rolls the whole import back. Returns {blood_group: units}.
+    """
+    today = date.today()
+
+    with transaction.atomic():
+        previous = dict(
+            BloodInventory.objects.select_for_update().filter(
+                blood_bank=blood_bank
+            ).values_list('blood_group', 'units')
+        )
+        BloodBatch.objects.filter(
+            blood_bank=blood_bank, status=BloodBatch.AVAILABLE
+        ).update(status=BloodBatch.DEPLETED)
+
+        totals = dict.fromkeys(previous, 0)
+        chunk = []
+        for row in batches:
+            expired = row['expires_on'] < today
+            chunk.append(BloodBatch(
+                blood_bank=blood_bank,
+                blood_group=row['blood_group'],
+                units=row['units'],
+                units_remaining=row['units'],
+                collected_on=row['collected_on'],
+                expires_on=row['expires_on'],
+                status=BloodBatch.EXPIRED if expired else BloodBatch.AVAILABLE,
+            ))
+            if not expired:
+                totals[row['blood_group']] = totals.get(row['blood_group'], 0) + row['units']
+
+            if len(chunk) >= chunk_size:
+                BloodBatch.objects.bulk_create(chunk)
+                chunk = []
+        BloodBatch.objects.bulk_create(chunk)
+
+        _write_counts(blood_bank, totals, previous, reason)
+        return totals
+
+
+def expire_batches(today=None, chunk_size=500):
+    """
+    Write off every batch whose expiry date has passed
+
+    Works through the affected blood banks chunk_size at a time. Each
+    chunk locks the banks' inventory rows, marks their expired batches
+    with one UPDATE and takes the expired units off the counters with
+    one bulk update. Returns (batches, units) expired.
+    """
+    today = today or date.today()
+    expired = BloodBatch.objects.past_expiry(today)
+    total_batches = total_units = 0
+
+    while True:
+        bank_ids = list(
+            expired.order_by('blood_bank_id').values_list('blood_bank_id', flat=True).distinct()[:chunk_size]
+        )
+        if not bank_ids:
+            return total_batches, total_units
+
+        with transaction.atomic():
+            inventory = {
+                (item.blood_bank_id, item.blood_group): item
+                for item in BloodInventory.objects.select_for_update().filter(blood_bank_id__in=bank_ids)
+            }
+            chunk = expired.filter(blood_bank_id__in=bank_ids)
+            totals = list(
+                chunk.values('blood_bank_id', 'blood_group').annotate(
+                    units=Sum('units_remaining'), batches=Count('id')
+                ).order_by()
+            )
+            chunk.update(status=BloodBatch.EXPIRED)
+
+            now = timezone.now()
+            changed = []
+            for total in totals:
+                total_batches += total['batches']
+                total_units += total['units']
+                item = inventory.get((total['blood_bank_id'], total['blood_group']))
+                if item is None or not total['units']:
+                    continue
+                previous_units = item.units
+                item.units = max(item.units - total['units'], 0)
+                item.last_updated = now
+                changed.append((item, previous_units))
+
+            BloodInventory.objects.bulk_update([item for item, _ in changed], ['units', 'last_updated'])
+            InventoryTransaction.objects.bulk_create([
+                _ledger_entry(item, previous_units, 'expired')
+                for item, previous_units in changed
+                if item.units != previous_units
+            ])
+            changed_by_bank = defaultdict(list)
+            for item, previous_units in changed:
+                changed_by_bank[item.blood_bank_id].append((item, previous_units))
+            for blood_bank_id, changes in changed_by_bank.items():
+                _changed(blood_bank_id, changes, 'expired', record=False)
@@ -0,0 +1,101 @@
+"""
+Signals for blood bank inventory
+"""
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import Signal, receiver
+
+from accounts.models import User
+from donors.models import DonationSchedule
+from . import alerts, rollup, slots, stats
+from .models import BloodBank, BloodInventory
+
+
+# Sent by bloodbanks.services once per blood bank for every stock write,
+# with blood_bank_id, changes ([(inventory, previous_units)]: each
+# updated BloodInventory row and its units before) and reason
+inventory_changed = Signal()
+
+
+# Receivers keeping bloodbanks.rollup current. They run inside the
+# transaction of the change that triggered them.
+
+def _bank_cell(blood_bank_id):
+    return BloodBank.objects.filter(pk=blood_bank_id).values_list('geo_cell', flat=True).first()
+
+
+@receiver(inventory_changed)
+def roll_up_stock_change(sender, blood_bank_id, changes, **kwargs):
+    rollup.apply_many(_bank_cell(blood_bank_id), {
+        inventory.blood_group: inventory.units - previous_units
+        for inventory, previous_units in changes
+    })
+
+
+@receiver(post_delete, sender=BloodInventory)
+def roll_up_inventory_deleted(sender, instance, **kwargs):
+    rollup.apply(_bank_cell(instance.blood_bank_id), instance.blood_group, -instance.units)
+
+
+@receiver(post_save, sender=BloodBank)
+def place_blood_bank(sender, instance, created, **kwargs):
+    """New blood banks start out in the cell of their user's location"""
+    if created and not instance.geo_cell:
+        instance.geo_cell = rollup.cell_for(instance.user.latitude, instance.user.longitude)
+        BloodBank.objects.filter(pk=instance.pk).update(geo_cell=instance.geo_cell)
+
+
+@receiver(post_save, sender=BloodBank)
+def open_default_hours(sender, instance, created, **kwargs):
+    """New blood banks take bookings in the default hours until they set theirs"""
+    if created:
+        slots.set_opening_hours(instance, slots.DEFAULT_OPENING_HOURS)
+
+
+@receiver(post_init, sender=User)
+def remember_rollup_location(sender, instance, **kwargs):
+    instance._rollup_location = (
+        instance.__dict__.get('latitude'), instance.__dict__.get('longitude')
+    )
+
+
+@receiver(post_save, sender=User)
+def blood_bank_moved(sender, instance, created, **kwargs):
+    """A blood bank's stock follows it to its new cell"""
+    location = (instance.latitude, instance.longitude)
+    previous, instance._rollup_location = instance._rollup_location, location
+    if created or instance.role != 'bloodbank' or location == previous:
+        return
+
+    blood_bank_id = BloodBank.objects.filter(user=instance).values_list('pk', flat=True).first()
+    if blood_bank_id is not None:
+        rollup.move_bank(blood_bank_id, rollup.cell_for(*location))
+
+
+# Receivers dropping cached dashboard figures
+
+@receiver(inventory_changed)
+def stock_changed(sender, blood_bank_id, **kwargs):
+    stats.invalidate(blood_bank_id)
+
+
+@receiver(post_delete, sender=BloodInventory)
+def inventory_deleted(sender, instance, **kwargs):
+    stats.invalidate(instance.blood_bank_id)
+
+
+@receiver(post_save, sender=DonationSchedule)
+@receiver(post_delete, sender=DonationSchedule)
+def schedule_changed(sender, instance, **kwargs):
+    stats.invalidate(instance.blood_bank_id)
+
+
+# Receivers raising and resolving low-stock alerts
+
+@receiver(inventory_changed)
+def check_low_stock(sender, blood_bank_id, changes, **kwargs):
+    alerts.check_stock(blood_bank_id, changes)
+
+
+@receiver(post_delete, sender=BloodInventory)
+def resolve_deleted_stock_alerts(sender, instance, **kwargs):
+    alerts.resolve_alerts(instance.blood_bank_id, {instance.blood_group: 0})
@@ -0,0 +1,165 @@
+"""
+Donation slots generated from blood bank opening hours
+
+generate() cuts each bank's weekly OpeningHours into DonationSlots for
+the days ahead. Banks start out with DEFAULT_OPENING_HOURS, and
+set_opening_hours() generates their slots straight away; the
+generate_donation_slots command, run daily, moves every bank's slots
+forward a day at a time. open_slots() only reads.
+
+A booking claims a place with one conditional UPDATE (booked <
+capacity), so concurrent bookings can never overfill a slot and no
+bookings are counted; cancelling releases the place the same way.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DEFAULT_SLOT_CAPACITY, DEFAULT_SLOT_MINUTES, DonationSlot, OpeningHours
+
+
+# Days ahead slots are generated and offered for
+SLOT_DAYS_AHEAD = 14
+
+# Hours every bank starts with, as in the opening hours form:
+# Monday to Saturday, 09:00 to 17:00
+DEFAULT_OPENING_HOURS = {
+    weekday: (time(9), time(17), DEFAULT_SLOT_MINUTES, DEFAULT_SLOT_CAPACITY)
+    for weekday in range(6)
+}
+
+
+def slot_times(hours, day):
+    """Aware (starts_at, ends_at) of each slot of `hours` on a date"""
+    start = timezone.make_aware(datetime.combine(day, hours.opens_at))
+    close = timezone.make_aware(datetime.combine(day, hours.closes_at))
+    length = timedelta(minutes=hours.slot_minutes)
+
+    while start + length <= close:
+        yield start, start + length
+        start += length
+
+
+def generate(blood_banks=None, start=None, days=SLOT_DAYS_AHEAD, batch_size=1000):
+    """
+    Create the missing slots of the next `days` days from opening hours
+
+    Existing slots are left alone, so it is safe to run repeatedly.
+    Returns the number of slots created.
+    """
+    start = start or timezone.localdate()
+    end = start + timedelta(days=days)
+
+    hours = OpeningHours.objects.all()
+    if blood_banks is not None:
+        hours = hours.filter(blood_bank__in=blood_banks)
+
+    by_bank = {}
+    for item in hours:
+        by_bank.setdefault(item.blood_bank_id, {})[item.weekday] = item
+    if not by_bank:
+        return 0
+
+    existing = set(
+        DonationSlot.objects.filter(
+            blood_bank_id__in=list(by_bank),
+            starts_at__gte=timezone.make_aware(datetime.combine(start, time.min)),
+        ).values_list('blood_bank_id', 'starts_at')
+    )
+
+    new_slots = []
+    for blood_bank_id, weekly in by_bank.items():
+        day = start
+        while day < end:
+            day_hours = weekly.get(day.weekday())
+            if day_hours is not None:
+                for starts_at, ends_at in slot_times(day_hours, day):
+                    if (blood_bank_id, starts_at) in existing:
+                        continue
+                    new_slots.append(DonationSlot(
+                        blood_bank_id=blood_bank_id,
+                        starts_at=starts_at,
+                        ends_at=ends_at,
+                        capacity=day_hours.capacity,
+                    ))
+            day += timedelta(days=1)
+
+    # Conflicts only come from a concurrent run creating the same slots
+    DonationSlot.objects.bulk_create(new_slots, batch_size=batch_size, ignore_conflicts=True)
+    return len(new_slots)
+
+
+def set_opening_hours(blood_bank, hours_by_weekday):
+    """
+    Replace a bank's opening hours and regenerate its future slots
+
+    hours_by_weekday maps weekday to (opens_at, closes_at, slot_minutes,
+    capacity); weekdays left out are closed. Future slots nobody booked
+    are dropped and generated again; booked ones are kept as they are.
+    """
+    with transaction.atomic():
+        OpeningHours.objects.filter(blood_bank=blood_bank).delete()
+        OpeningHours.objects.bulk_create([
+            OpeningHours(
+                blood_bank=blood_bank,
+                weekday=weekday,
+                opens_at=opens_at,
+                closes_at=closes_at,
+                slot_minutes=slot_minutes,
+                capacity=capacity,
+            )
+            for weekday, (opens_at, closes_at, slot_minutes, capacity) in hours_by_weekday.items()
+        ])
+
+        DonationSlot.objects.filter(
+            blood_bank=blood_bank, starts_at__gt=timezone.now(), booked=0
+        ).delete()
+        return generate([blood_bank])
+
+
+def open_slots(blood_banks, start=None, end=None):
+    """
+    {blood_bank_id: [slot, ...]} of the open slots of several banks
+
+    One query for all banks over [start, end), defaulting to now and
+    SLOT_DAYS_AHEAD days ahead.
+    """
+    start = start or timezone.now()
+    end = end or start + timedelta(days=SLOT_DAYS_AHEAD)
+
+    slots = DonationSlot.objects.open(start).filter(
+        blood_bank__in=blood_banks,
+        starts_at__lt=end,
+    ).order_by('blood_bank_id', 'starts_at')
+
+    result = {}
+    for slot in slots:
+        result.setdefault(slot.blood_bank_id, []).append(slot)
+    return result
+
+
+def claim(slot_id, now=None):
+    """
+    Take a place in a slot; returns the slot, or None when it is full,
+    past or gone
+
+    Run it in the same transaction as the booking so a failed booking
+    gives the place back.
+    """
+    claimed = DonationSlot.objects.open(now).filter(pk=slot_id).update(
+        booked=F('booked') + 1
+    )
+    if not claimed:
+        return None
+    return DonationSlot.objects.get(pk=slot_id)
+
+
+def release(slot_id):
+    """Give back a place taken by claim()"""
+    if slot_id is None:
+        return
+    DonationSlot.objects.filter(pk=slot_id, booked__gt=0).update(
+        booked=F('booked') - 1
+    )
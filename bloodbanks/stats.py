@@ -0,0 +1,129 @@
+"""
+Blood bank dashboard figures
+
+Everything the dashboard counts comes from two queries: the bank's
+inventory rows annotated with their live and soon-to-expire batch
+units and whether a low-stock alert is open, and one conditional
+aggregate over its scheduled donations using datetime ranges rather
+than __date lookups, so an index on scheduled_date stays usable.
+
+The result is cached per bank, day and BloodBank.dashboard_version.
+Inventory, schedule and alert writes bump the version in their own
+transaction (bloodbanks.signals), and the dashboard reads it with the
+bank it loads anyway, so every worker stops using older entries as soon
+as the write commits, whatever cache backend holds them.
+"""
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, Exists, F, Min, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from donors.models import DonationSchedule
+from .models import BloodBank, BloodBatch, BloodInventory, LowStockAlert
+
+
+DASHBOARD_CACHE_TIMEOUT = 300
+
+# Days ahead counted as "upcoming" and as "expiring soon"
+UPCOMING_DAYS = 7
+EXPIRY_WARNING_DAYS = 7
+
+KEY = 'bloodbank_dashboard:{blood_bank_id}:{version}:{day}'
+
+
+def day_bounds(day):
+    """Aware [start, end) datetimes of a local calendar day"""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def compute(blood_bank, now=None):
+    """Dashboard figures for a blood bank, straight from the database"""
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    day_start, day_end = day_bounds(today)
+
+    live_batches = BloodBatch.objects.live(today).filter(
+        blood_bank=OuterRef('blood_bank'),
+        blood_group=OuterRef('blood_group')
+    ).values('blood_group')
+    expiring_batches = live_batches.filter(
+        expires_on__lte=today + timedelta(days=EXPIRY_WARNING_DAYS)
+    )
+
+    inventory = list(
+        BloodInventory.objects.filter(blood_bank=blood_bank).annotate(
+            live_units=Coalesce(Subquery(
+                live_batches.annotate(total=Sum('units_remaining')).values('total')
+            ), 0),
+            expiring_units=Coalesce(Subquery(
+                expiring_batches.annotate(total=Sum('units_remaining')).values('total')
+            ), 0),
+            next_expiry=Subquery(
+                expiring_batches.annotate(first=Min('expires_on')).values('first')
+            ),
+            low_stock=Exists(LowStockAlert.objects.filter(
+                blood_bank=OuterRef('blood_bank'),
+                blood_group=OuterRef('blood_group'),
+                resolved_at__isnull=True
+            )),
+        ).order_by('blood_group').values(
+            'blood_group', 'units', 'live_units', 'expiring_units', 'next_expiry', 'low_stock'
+        )
+    )
+
+    upcoming_end = now + timedelta(days=UPCOMING_DAYS)
+    schedule = DonationSchedule.objects.filter(
+        blood_bank=blood_bank,
+        status='scheduled',
+        scheduled_date__gte=day_start,
+        scheduled_date__lte=max(day_end, upcoming_end),
+    ).aggregate(
+        today=Count('id', filter=Q(scheduled_date__lt=day_end)),
+        upcoming=Count('id', filter=Q(scheduled_date__gte=now, scheduled_date__lte=upcoming_end)),
+    )
+
+    return {
+        'total_units': sum(item['live_units'] for item in inventory),
+        'inventory': inventory,
+        'low_stock': [item for item in inventory if item['low_stock']],
+        'expiring': [item for item in inventory if item['expiring_units']],
+        'today_count': schedule['today'],
+        'upcoming_count': schedule['upcoming'],
+    }
+
+
+def get_dashboard_stats(blood_bank):
+    """
+    Dashboard figures for a blood bank, cached until the next write
+
+    blood_bank should be loaded by the current request, as the key uses
+    its dashboard_version.
+    """
+    key = KEY.format(
+        blood_bank_id=blood_bank.pk,
+        version=blood_bank.dashboard_version,
+        day=timezone.localdate().isoformat(),
+    )
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute(blood_bank)
+        cache.set(key, stats, DASHBOARD_CACHE_TIMEOUT)
+    return stats
+
+
+def invalidate(blood_bank_id):
+    """Expire a bank's cached figures when the current transaction commits"""
+    if blood_bank_id is not None:
+        invalidate_many([blood_bank_id])
+
+
+def invalidate_many(blood_bank_ids):
+    """invalidate() for several banks with one UPDATE"""
+    blood_bank_ids = set(blood_bank_ids)
+    if blood_bank_ids:
+        BloodBank.objects.filter(pk__in=blood_bank_ids).update(
+            dashboard_version=F('dashboard_version') + 1
+        )
@@ -0,0 +1,710 @@
+import base64
+import io
+import threading
+import time
+from datetime import date, timedelta
+
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.contrib.messages import get_messages
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from donors.models import DonationSchedule
+from . import alerts, ledger, pagination, rollup, services as inventory_service, slots, stats
+from .consumers import LowStockAlertConsumer
+from .models import BloodBank, BloodBatch, BloodInventory, DonationSlot, InventoryRollup, InventoryTransaction
+
+
+class ConcurrentInventoryTests(TransactionTestCase):
+    """Concurrent stock changes keep the counter, batches and ledger equal"""
+
+    WORKERS = 4
+    CHANGES_PER_WORKER = 15
+
+    def setUp(self):
+        user = User.objects.create_user(
+            'bank', 'bank@example.com', role='bloodbank', latitude=15, longitude=75
+        )
+        self.blood_bank = user.blood_bank_profile
+        inventory_service.add_units(self.blood_bank, 'A+', 20)
+
+    def run_change(self, change, units):
+        """Apply one change, retrying while another writer holds the database"""
+        while True:
+            try:
+                change(self.blood_bank, 'A+', units)
+                return units if change is inventory_service.add_units else -units
+            except inventory_service.InsufficientStock:
+                return 0
+            except OperationalError:
+                # SQLite takes one writer at a time; the transaction was rolled back
+                time.sleep(0.001)
+
+    def test_concurrent_adds_and_removes(self):
+        start = threading.Barrier(self.WORKERS)
+        deltas = [[] for _ in range(self.WORKERS)]
+
+        def worker(number):
+            try:
+                start.wait()
+                for step in range(self.CHANGES_PER_WORKER):
+                    if (number + step) % 2:
+                        deltas[number].append(self.run_change(inventory_service.add_units, 3))
+                    else:
+                        deltas[number].append(self.run_change(inventory_service.remove_units, 4))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(number,)) for number in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        expected = 20 + sum(sum(worker_deltas) for worker_deltas in deltas)
+        counter = BloodInventory.objects.get(blood_bank=self.blood_bank, blood_group='A+').units
+        batches = BloodBatch.objects.live().filter(
+            blood_bank=self.blood_bank, blood_group='A+'
+        ).aggregate(total=Sum('units_remaining'))['total'] or 0
+        ledger = InventoryTransaction.objects.filter(
+            blood_bank=self.blood_bank, blood_group='A+'
+        ).aggregate(total=Sum('delta'))['total']
+
+        self.assertEqual(counter, expected)
+        self.assertEqual(batches, expected)
+        self.assertEqual(ledger, expected)
+
+
+class ManageInventoryTests(TestCase):
+    """manage_inventory rejects bad input with a message, not a write"""
+
+    def setUp(self):
+        user = User.objects.create_user(
+            'bank', 'bank@example.com', 'secret', role='bloodbank', latitude=15, longitude=75
+        )
+        self.blood_bank = user.blood_bank_profile
+        self.client.force_login(user)
+
+    def post(self, **data):
+        response = self.client.post(reverse('bloodbanks:manage_inventory'), data)
+        self.assertRedirects(response, reverse('bloodbanks:manage_inventory'))
+        return [str(message) for message in get_messages(response.wsgi_request)]
+
+    def test_unknown_blood_group_is_rejected(self):
+        messages = self.post(action='add', blood_group='Z+', units='3')
+
+        self.assertEqual(messages, ['Choose a valid blood group'])
+        self.assertFalse(BloodInventory.objects.filter(blood_bank=self.blood_bank).exists())
+
+    def test_units_that_are_not_a_number_are_rejected(self):
+        messages = self.post(action='add', blood_group='A+', units='three')
+
+        self.assertEqual(messages, ['Units must be a whole number of zero or more'])
+        self.assertFalse(BloodInventory.objects.filter(blood_bank=self.blood_bank).exists())
+
+    def test_valid_change_is_applied(self):
+        messages = self.post(action='add', blood_group='A+', units='3')
+
+        self.assertEqual(messages, ['Added 3 units of A+'])
+        self.assertEqual(
+            BloodInventory.objects.get(blood_bank=self.blood_bank, blood_group='A+').units, 3
+        )
+
+
+class BulkSetUnitsTests(TestCase):
+    """bulk_set_units upserts every group it is given and nothing else"""
+
+    def setUp(self):
+        user = User.objects.create_user(
+            'bank', 'bank@example.com', role='bloodbank', latitude=15, longitude=75
+        )
+        self.blood_bank = user.blood_bank_profile
+        inventory_service.add_units(self.blood_bank, 'A+', 10)
+        inventory_service.add_units(self.blood_bank, 'B+', 4)
+
+    def units(self):
+        return dict(
+            BloodInventory.objects.filter(blood_bank=self.blood_bank).values_list('blood_group', 'units')
+        )
+
+    def live_units(self, blood_group):
+        return BloodBatch.objects.live().filter(
+            blood_bank=self.blood_bank, blood_group=blood_group
+        ).aggregate(total=Sum('units_remaining'))['total'] or 0
+
+    def test_updates_existing_and_creates_missing_groups(self):
+        snapshot = inventory_service.bulk_set_units(
+            self.blood_bank, {'A+': 6, 'B+': 4, 'O-': 3}
+        )
+
+        self.assertEqual(self.units(), {'A+': 6, 'B+': 4, 'O-': 3})
+        self.assertEqual([item.blood_group for item in snapshot], ['A+', 'B+', 'O-'])
+        self.assertEqual(self.live_units('A+'), 6)
+        self.assertEqual(self.live_units('O-'), 3)
+        # Unchanged groups leave no ledger entry
+        self.assertEqual(
+            list(InventoryTransaction.objects.filter(reason='update').order_by('blood_group').values_list(
+                'blood_group', 'delta'
+            )),
+            [('A+', -4), ('O-', 3)],
+        )
+
+    def test_query_count_does_not_grow_with_groups(self):
+        # Every count rises and stays at or above the default threshold,
+        # so both calls take the same paths and no alerts change
+        with self.assertNumQueries(17):
+            inventory_service.bulk_set_units(self.blood_bank, {'A+': 12, 'O-': 15})
+        with self.assertNumQueries(17):
+            inventory_service.bulk_set_units(
+                self.blood_bank, {'A+': 14, 'A-': 12, 'AB+': 13, 'AB-': 14, 'O+': 15, 'O-': 16}
+            )
+
+    def test_unknown_group_writes_nothing(self):
+        with self.assertRaises(ValueError):
+            inventory_service.bulk_set_units(self.blood_bank, {'A+': 6, 'Z+': 3})
+
+        self.assertEqual(self.units(), {'A+': 10, 'B+': 4})
+
+
+class LedgerTests(TestCase):
+    """stock_on replays the ledger tail on top of the latest snapshot"""
+
+    def setUp(self):
+        user = User.objects.create_user(
+            'bank', 'bank@example.com', role='bloodbank', latitude=15, longitude=75
+        )
+        self.blood_bank = user.blood_bank_profile
+
+    def expected(self, units=None):
+        """Every blood group, at zero unless given in units"""
+        stock = {group: 0 for group, _ in BloodInventory.BLOOD_GROUP_CHOICES}
+        stock.update(units or {})
+        return stock
+
+    def test_stock_on_matches_history_around_snapshots(self):
+        checkpoints = [(timezone.now(), self.expected())]
+
+        inventory_service.add_units(self.blood_bank, 'A+', 10)
+        checkpoints.append((timezone.now(), self.expected({'A+': 10})))
+
+        ledger.take_snapshot(self.blood_bank)
+        inventory_service.remove_units(self.blood_bank, 'A+', 3)
+        inventory_service.add_units(self.blood_bank, 'B-', 5)
+        checkpoints.append((timezone.now(), self.expected({'A+': 7, 'B-': 5})))
+
+        ledger.take_snapshot(self.blood_bank)
+        inventory_service.remove_units(self.blood_bank, 'B-', 2)
+        checkpoints.append((timezone.now(), self.expected({'A+': 7, 'B-': 3})))
+
+        for at, stock in checkpoints:
+            with self.subTest(at=at):
+                self.assertEqual(ledger.stock_on(self.blood_bank, at), stock)
+
+    def test_entries_covered_by_a_snapshot_are_not_replayed(self):
+        inventory_service.add_units(self.blood_bank, 'A+', 10)
+        inventory_service.remove_units(self.blood_bank, 'A+', 4)
+        snapshot = ledger.take_snapshot(self.blood_bank)
+        InventoryTransaction.objects.filter(pk__lte=snapshot[0].ledger_position).delete()
+
+        inventory_service.add_units(self.blood_bank, 'O+', 2)
+
+        self.assertEqual(
+            ledger.stock_on(self.blood_bank, timezone.now()), self.expected({'A+': 6, 'O+': 2})
+        )
+
+    def test_no_snapshot_without_new_entries(self):
+        inventory_service.add_units(self.blood_bank, 'A+', 10)
+
+        self.assertEqual(len(ledger.take_snapshot(self.blood_bank)), 1)
+        self.assertEqual(ledger.take_snapshot(self.blood_bank), [])
+
+
+class BatchStockTests(TestCase):
+    """Removals take the soonest-expiring batches and never overdraw"""
+
+    def setUp(self):
+        user = User.objects.create_user(
+            'bank', 'bank@example.com', role='bloodbank', latitude=15, longitude=75
+        )
+        self.blood_bank = user.blood_bank_profile
+        self.today = date.today()
+
+    def add(self, units, expires_in_days):
+        inventory_service.add_units(
+            self.blood_bank, 'A+', units,
+            collected_on=self.today - timedelta(days=30),
+            expires_on=self.today + timedelta(days=expires_in_days),
+        )
+
+    def remaining(self):
+        return list(
+            BloodBatch.objects.filter(blood_bank=self.blood_bank).order_by(
+                'expires_on'
+            ).values_list('units_remaining', 'status')
+        )
+
+    def counter(self):
+        return BloodInventory.objects.get(blood_bank=self.blood_bank, blood_group='A+').units
+
+    def test_removal_takes_soonest_expiring_first(self):
+        self.add(3, expires_in_days=5)
+        self.add(4, expires_in_days=2)
+        self.add(5, expires_in_days=10)
+
+        inventory_service.remove_units(self.blood_bank, 'A+', 6)
+
+        self.assertEqual(self.remaining(), [
+            (0, BloodBatch.DEPLETED), (1, BloodBatch.AVAILABLE), (5, BloodBatch.AVAILABLE),
+        ])
+        self.assertEqual(self.counter(), 6)
+
+    def test_removing_more_than_the_counter_changes_nothing(self):
+        self.add(3, expires_in_days=5)
+
+        with self.assertRaises(inventory_service.InsufficientStock) as raised:
+            inventory_service.remove_units(self.blood_bank, 'A+', 4)
+
+        self.assertEqual((raised.exception.requested, raised.exception.available), (4, 3))
+        self.assertEqual(self.counter(), 3)
+        self.assertEqual(self.remaining(), [(3, BloodBatch.AVAILABLE)])
+        self.assertEqual(InventoryTransaction.objects.filter(reason='remove').count(), 0)
+
+    def test_expired_batches_are_not_available(self):
+        # Past expiry but not yet swept, so still on the counter
+        self.add(5, expires_in_days=-1)
+        self.add(2, expires_in_days=10)
+
+        with self.assertRaises(inventory_service.InsufficientStock) as raised:
+            inventory_service.remove_units(self.blood_bank, 'A+', 4)
+
+        self.assertEqual(raised.exception.available, 2)
+        self.assertEqual(self.counter(), 7)
+        self.assertEqual(self.remaining(), [(5, BloodBatch.AVAILABLE), (2, BloodBatch.AVAILABLE)])
+
+    def test_missing_group_is_reported(self):
+        with self.assertRaises(BloodInventory.DoesNotExist):
+            inventory_service.remove_units(self.blood_bank, 'A+', 1)
+
+
+class InventoryRollupTests(TestCase):
+    """The per-cell rollup follows stock changes and bank moves"""
+
+    def setUp(self):
+        self.banks = [
+            User.objects.create_user(
+                f'bank{number}', f'bank{number}@example.com', role='bloodbank',
+                latitude=15 + number / 100, longitude=75 + number / 100
+            )
+            for number in range(2)
+        ]
+        for user in self.banks:
+            inventory_service.add_units(user.blood_bank_profile, 'A+', 4)
+        inventory_service.add_units(self.banks[1].blood_bank_profile, 'O-', 3)
+        self.home = rollup.cell_for(15, 75)
+        self.away = rollup.cell_for(20, 80)
+
+    def rollup_rows(self):
+        return set(
+            InventoryRollup.objects.filter(units__gt=0).values_list('cell', 'blood_group', 'units')
+        )
+
+    def test_stock_changes_roll_up_into_the_bank_cell(self):
+        inventory_service.remove_units(self.banks[0].blood_bank_profile, 'A+', 1)
+
+        self.assertEqual(self.rollup_rows(), {(self.home, 'A+', 7), (self.home, 'O-', 3)})
+
+    def test_moving_a_bank_shifts_its_stock(self):
+        user = self.banks[1]
+        user.latitude, user.longitude = 20, 80
+        user.save()
+
+        self.assertEqual(self.rollup_rows(), {(self.home, 'A+', 4), (self.away, 'A+', 4), (self.away, 'O-', 3)})
+        self.assertEqual(BloodBank.objects.get(user=user).geo_cell, self.away)
+
+        # Moving again to the same cell shifts nothing
+        rollup.move_bank(user.blood_bank_profile.pk, self.away)
+        self.assertEqual(self.rollup_rows(), {(self.home, 'A+', 4), (self.away, 'A+', 4), (self.away, 'O-', 3)})
+
+    def test_rebuild_recomputes_cells_and_totals(self):
+        # Drifted: a bank moved without signals and a wrong total
+        User.objects.filter(pk=self.banks[1].pk).update(latitude=20, longitude=80)
+        InventoryRollup.objects.filter(cell=self.home, blood_group='A+').update(units=99)
+
+        self.assertEqual(rollup.rebuild(), 3)
+        self.assertEqual(self.rollup_rows(), {(self.home, 'A+', 4), (self.away, 'A+', 4), (self.away, 'O-', 3)})
+        self.assertEqual(BloodBank.objects.get(user=self.banks[1]).geo_cell, self.away)
+
+
+class DashboardStatsCacheTests(TestCase):
+    """Cached dashboard figures are keyed by the bank's dashboard_version"""
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(
+            'bank', 'bank@example.com', role='bloodbank', latitude=15, longitude=75
+        )
+        self.blood_bank = user.blood_bank_profile
+        inventory_service.add_units(self.blood_bank, 'A+', 20)
+
+    def dashboard_stats(self):
+        # As the dashboard view does, with the bank loaded per request
+        return stats.get_dashboard_stats(BloodBank.objects.get(pk=self.blood_bank.pk))
+
+    def test_repeat_reads_come_from_the_cache(self):
+        self.dashboard_stats()
+
+        with self.assertNumQueries(1):
+            figures = self.dashboard_stats()
+        self.assertEqual(figures['total_units'], 20)
+
+    def test_write_expires_the_cached_figures(self):
+        self.dashboard_stats()
+        inventory_service.remove_units(self.blood_bank, 'A+', 5)
+
+        self.assertEqual(self.dashboard_stats()['total_units'], 15)
+
+    def test_saving_an_old_copy_keeps_the_version(self):
+        stale = BloodBank.objects.get(pk=self.blood_bank.pk)
+        self.dashboard_stats()
+        inventory_service.remove_units(self.blood_bank, 'A+', 5)
+
+        stale.name = 'Renamed'
+        stale.save()
+
+        self.assertEqual(self.dashboard_stats()['total_units'], 15)
+
+
+class LowStockAlertTests(TestCase):
+    """Alerts opened or resolved outside a stock change reach the dashboard"""
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(
+            'bank', 'bank@example.com', role='bloodbank', latitude=15, longitude=75
+        )
+        self.blood_bank = user.blood_bank_profile
+        inventory_service.add_units(self.blood_bank, 'A+', 20)
+
+    def low_stock_groups(self):
+        figures = stats.get_dashboard_stats(BloodBank.objects.get(pk=self.blood_bank.pk))
+        return [item['blood_group'] for item in figures['low_stock']]
+
+    def test_threshold_changes_update_cached_badges(self):
+        self.assertEqual(self.low_stock_groups(), [])
+
+        alerts.set_thresholds(self.blood_bank, {'A+': 25})
+        self.assertEqual(self.low_stock_groups(), ['A+'])
+
+        alerts.set_thresholds(self.blood_bank, {'A+': 5})
+        self.assertEqual(self.low_stock_groups(), [])
+
+    def test_catch_up_updates_cached_badges(self):
+        self.assertEqual(self.low_stock_groups(), [])
+
+        # Written without going through the inventory service
+        BloodInventory.objects.filter(blood_bank=self.blood_bank).update(units=2)
+
+        self.assertEqual(alerts.open_missing_alerts(), 1)
+        self.assertEqual(self.low_stock_groups(), ['A+'])
+
+
+class LowStockAlertConsumerTests(TransactionTestCase):
+    """Alert events reach the bank's connected dashboards"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'bank', 'bank@example.com', role='bloodbank', latitude=15, longitude=75
+        )
+        self.blood_bank = self.user.blood_bank_profile
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(LowStockAlertConsumer.as_asgi(), '/ws/bloodbank/alerts/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    async def test_alert_events_are_pushed(self):
+        communicator, connected = await self.connect(self.user)
+        self.assertTrue(connected)
+
+        await database_sync_to_async(inventory_service.add_units)(self.blood_bank, 'A+', 3)
+        event = await communicator.receive_json_from()
+        self.assertEqual((event['status'], event['blood_group'], event['units']), ('open', 'A+', 3))
+
+        await database_sync_to_async(inventory_service.add_units)(self.blood_bank, 'A+', 20)
+        event = await communicator.receive_json_from()
+        self.assertEqual((event['status'], event['units']), ('resolved', 23))
+
+        await communicator.disconnect()
+
+    async def test_other_banks_alerts_are_not_pushed(self):
+        other = await database_sync_to_async(User.objects.create_user)(
+            'other', 'other@example.com', role='bloodbank', latitude=15, longitude=75
+        )
+        communicator, connected = await self.connect(self.user)
+        self.assertTrue(connected)
+
+        await database_sync_to_async(inventory_service.add_units)(other.blood_bank_profile, 'A+', 3)
+        self.assertTrue(await communicator.receive_nothing())
+
+        await communicator.disconnect()
+
+    async def test_other_roles_are_refused(self):
+        donor = await database_sync_to_async(User.objects.create_user)(
+            'donor', 'donor@example.com', role='donor', latitude=15, longitude=75
+        )
+        communicator, connected = await self.connect(donor)
+
+        self.assertFalse(connected)
+
+
+class ImportStockTests(TestCase):
+    """Bad stock files are reported and change nothing"""
+
+    def setUp(self):
+        user = User.objects.create_user(
+            'bank', 'bank@example.com', 'secret', role='bloodbank', latitude=15, longitude=75
+        )
+        self.blood_bank = user.blood_bank_profile
+        inventory_service.add_units(self.blood_bank, 'A+', 20)
+        self.client.force_login(user)
+
+    def upload(self, content):
+        response = self.client.post(reverse('bloodbanks:import_stock'), {
+            'stock_file': SimpleUploadedFile('stock.csv', content, content_type='text/csv'),
+        })
+        self.assertRedirects(response, reverse('bloodbanks:manage_inventory'))
+        return [str(message) for message in get_messages(response.wsgi_request)]
+
+    def assertUnchanged(self):
+        self.assertEqual(
+            BloodInventory.objects.get(blood_bank=self.blood_bank, blood_group='A+').units, 20
+        )
+        self.assertEqual(BloodBatch.objects.live().filter(blood_bank=self.blood_bank).count(), 1)
+
+    def test_over_long_field_is_reported(self):
+        content = b'blood_group,units\nA+,5\nB+,"' + b'9' * 200000 + b'"\n'
+
+        messages = self.upload(content)
+
+        self.assertEqual(messages, [
+            'Import failed, nothing was changed. '
+            'Line 3: not valid CSV (field larger than field limit (131072))'
+        ])
+        self.assertUnchanged()
+
+    def test_bad_row_is_reported(self):
+        messages = self.upload(b'blood_group,units\nA+,5\nZ+,3\n')
+
+        self.assertEqual(messages, ["Import failed, nothing was changed. Line 3: unknown blood group 'Z+'"])
+        self.assertUnchanged()
+
+    def test_valid_file_replaces_stock(self):
+        messages = self.upload(b'blood_group,units\nA+,5\nB+,3\n')
+
+        self.assertEqual(messages, ['Imported stock: 8 units in date'])
+        self.assertEqual(
+            dict(BloodInventory.objects.filter(blood_bank=self.blood_bank).values_list('blood_group', 'units')),
+            {'A+': 5, 'B+': 3},
+        )
+
+
+class DonationSlotTests(TestCase):
+    """Slots are generated by writes and the daily command, never by reads"""
+
+    def setUp(self):
+        user = User.objects.create_user(
+            'bank', 'bank@example.com', role='bloodbank', latitude=15, longitude=75
+        )
+        self.blood_bank = user.blood_bank_profile
+
+    def test_new_bank_gets_bookable_slots(self):
+        self.assertTrue(slots.open_slots([self.blood_bank]).get(self.blood_bank.pk))
+
+    def test_open_slots_only_reads(self):
+        DonationSlot.objects.all().delete()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(slots.open_slots([self.blood_bank]), {})
+
+    def test_command_fills_missing_slots_once(self):
+        DonationSlot.objects.all().delete()
+
+        call_command('generate_donation_slots', stdout=io.StringIO())
+        created = DonationSlot.objects.count()
+        call_command('generate_donation_slots', stdout=io.StringIO())
+
+        self.assertGreater(created, 0)
+        self.assertEqual(DonationSlot.objects.count(), created)
+
+
+class SchedulePaginationTests(TestCase):
+    """Keyset cursors walk a listing once, in order, and reject tampering"""
+
+    # One page more than the API serves, two bookings per scheduled time
+    ROWS = pagination.PAGE_SIZE + 3
+
+    def setUp(self):
+        user = User.objects.create_user(
+            'bank', 'bank@example.com', 'secret', role='bloodbank', latitude=15, longitude=75
+        )
+        self.blood_bank = user.blood_bank_profile
+        self.client.force_login(user)
+        donor = User.objects.create_user(
+            'donor', 'donor@example.com', role='donor', latitude=15, longitude=75
+        ).donor_profile
+
+        start = timezone.now() - timedelta(days=30)
+        # Completed bookings, so one donor can hold them all
+        DonationSchedule.objects.bulk_create([
+            DonationSchedule(
+                donor=donor,
+                blood_bank=self.blood_bank,
+                scheduled_date=start + timedelta(hours=number // 2),
+                status='completed',
+            )
+            for number in range(self.ROWS)
+        ])
+        self.schedules = DonationSchedule.objects.filter(blood_bank=self.blood_bank)
+
+    def walk(self, descending):
+        """Ids of every page, following next cursors from the first"""
+        ids, cursor = [], None
+        while True:
+            rows, cursor = pagination.page(self.schedules, cursor, descending=descending, page_size=4)
+            ids.extend(row.pk for row in rows)
+            if cursor is None:
+                return ids
+
+    def test_cursors_walk_every_row_once_in_order(self):
+        for descending, ordering in ((False, ['scheduled_date', 'id']), (True, ['-scheduled_date', '-id'])):
+            with self.subTest(descending=descending):
+                self.assertEqual(
+                    self.walk(descending),
+                    list(self.schedules.order_by(*ordering).values_list('pk', flat=True)),
+                )
+
+    def test_cursor_round_trips(self):
+        schedule = self.schedules.first()
+
+        self.assertEqual(
+            pagination.decode_cursor(pagination.encode_cursor(schedule)),
+            (schedule.scheduled_date, schedule.pk),
+        )
+
+    def api(self, **params):
+        return self.client.get(
+            reverse('bloodbanks:scheduled_donors_api'), {'status': 'completed', **params}
+        )
+
+    def test_api_pages_follow_next_cursor(self):
+        first = self.api().json()
+        second = self.api(after=first['next']).json()
+
+        self.assertEqual(len(first['results']), pagination.PAGE_SIZE)
+        self.assertIsNone(second['next'])
+        self.assertEqual(
+            [row['id'] for row in first['results'] + second['results']],
+            list(self.schedules.order_by('-scheduled_date', '-id').values_list('pk', flat=True)),
+        )
+
+    def test_tampered_cursor_is_rejected(self):
+        def encoded(key):
+            return base64.urlsafe_b64encode(key.encode()).decode().rstrip('=')
+
+        for cursor in (
+            'not a cursor!',
+            encoded('no separator'),
+            encoded('2026-01-01T00:00:00+00:00|one'),
+            encoded('yesterday|1'),
+            encoded('2026-01-01T00:00:00+00:00|1|2'),
+            base64.urlsafe_b64encode(b'\xff\xfe|1').decode(),
+        ):
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(ValueError):
+                    pagination.decode_cursor(cursor)
+
+                response = self.api(after=cursor)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'success': False, 'message': 'Invalid cursor'})
+
+
+class CalendarFeedTests(TestCase):
+    """calendar_feed answers unchanged polls with a 304 after one query"""
+
+    def setUp(self):
+        user = User.objects.create_user(
+            'bank', 'bank@example.com', role='bloodbank', latitude=15, longitude=75
+        )
+        self.blood_bank = user.blood_bank_profile
+        donor = User.objects.create_user(
+            'donor', 'donor@example.com', role='donor', latitude=15, longitude=75
+        ).donor_profile
+        # Only the row matters here, not the booking rules save() applies
+        self.booking, = DonationSchedule.objects.bulk_create([
+            DonationSchedule(
+                donor=donor,
+                blood_bank=self.blood_bank,
+                scheduled_date=timezone.now() + timedelta(days=1),
+                status='scheduled',
+            )
+        ])
+        self.url = reverse('bloodbanks:calendar_feed', args=[self.blood_bank.calendar_token])
+
+    def fetch(self, **headers):
+        return self.client.get(self.url, **headers)
+
+    def test_feed_lists_bookings_with_validators(self):
+        response = self.fetch()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'UID:donation-{self.booking.pk}@lifelink', b''.join(response.streaming_content).decode())
+        self.assertTrue(response['ETag'])
+        self.assertTrue(response['Last-Modified'])
+
+    def test_matching_etag_gets_304(self):
+        etag = self.fetch()['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.fetch(HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_unmodified_since_gets_304(self):
+        last_modified = self.fetch()['Last-Modified']
+
+        with self.assertNumQueries(1):
+            response = self.fetch(HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_changed_booking_gets_full_feed(self):
+        first = self.fetch()
+        DonationSchedule.objects.filter(pk=self.booking.pk).update(
+            notes='Bring ID', updated_at=timezone.now() + timedelta(minutes=1)
+        )
+
+        for headers in (
+            {'HTTP_IF_NONE_MATCH': first['ETag']},
+            {'HTTP_IF_MODIFIED_SINCE': first['Last-Modified']},
+        ):
+            with self.subTest(headers=headers):
+                response = self.fetch(**headers)
+
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], first['ETag'])
+                self.assertIn('Bring ID', b''.join(response.streaming_content).decode())
+
+    def test_unknown_token_is_not_found(self):
+        response = self.client.get(reverse('bloodbanks:calendar_feed', args=['unknown']))
+
+        self.assertEqual(response.status_code, 404)
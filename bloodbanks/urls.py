@@ -9,8 +9,18 @@ app_name = 'bloodbanks'
 urlpatterns = [
     path('dashboard/', views.dashboard, name='dashboard'),
     path('inventory/', views.manage_inventory, name='manage_inventory'),
+    path('inventory/bulk/', views.bulk_update_inventory, name='bulk_update_inventory'),
+    path('inventory/thresholds/', views.update_thresholds, name='update_thresholds'),
+    path('inventory/import/', views.import_stock, name='import_stock'),
+    path('export/<slug:kind>.csv', views.export_csv, name='export_csv'),
+    path('api/inventory/', views.inventory_api, name='inventory_api'),
+    path('slots/', views.donation_slots, name='donation_slots'),
     path('scheduled-donors/', views.scheduled_donors, name='scheduled_donors'),
+    path('api/scheduled-donors/', views.scheduled_donors_api, name='scheduled_donors_api'),
     path('mark-completed/<int:schedule_id>/', views.mark_completed, name='mark_completed'),
+    path('mark-completed/', views.complete_donations, name='complete_donations'),
+    path('calendar/reset/', views.reset_calendar_token, name='reset_calendar_token'),
+    path('calendar/<str:token>.ics', views.calendar_feed, name='calendar_feed'),
     path('profile/', views.profile, name='profile'),
 
 
@@ -1,11 +1,26 @@
 """
 Blood Bank views: Dashboard, Inventory, Scheduled Donors
 """
+import json
+
 from django.shortcuts import render, redirect
+from django.urls import reverse
 from django.contrib import messages
+from django.db.models import Exists, OuterRef
+from django.http import Http404, JsonResponse
 from django.utils import timezone
+from django.utils.dateformat import format as date_format
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime, parse_time
+from django.utils.http import http_date
+from django.views.decorators.http import require_http_methods, require_POST, require_safe
 from accounts.decorators import bloodbank_required
-from .models import BloodBank, BloodInventory
+from . import alerts, csv_io, ical, ledger, pagination, slots, stats, services as inventory_service
+from .models import (
+    DEFAULT_SLOT_CAPACITY, DEFAULT_SLOT_MINUTES,
+    BloodBank, BloodInventory, DonationSlot, LowStockAlert, OpeningHours, new_calendar_token,
+)
+from donors import services as donation_service
 from donors.models import DonationSchedule
 
 
@@ -22,37 +37,32 @@ def dashboard(request):
             contact_number=''
         )
     
-    # Inventory statistics
-    total_units = blood_bank.get_total_units()
-    low_stock_alerts = blood_bank.get_low_stock_alerts()
-    
+    # Inventory and schedule figures (cached per bank)
+    dashboard_stats = stats.get_dashboard_stats(blood_bank)
+
     # Today's donations
-    today = timezone.now().date()
+    day_start, day_end = stats.day_bounds(timezone.localdate())
     today_donations = DonationSchedule.objects.filter(
         blood_bank=blood_bank,
-        scheduled_date__date=today,
+        scheduled_date__gte=day_start,
+        scheduled_date__lt=day_end,
         status='scheduled'
-    ).select_related('donor', 'donor__user')
+    ).select_related('donor', 'donor__user').order_by('scheduled_date')
     
     # Upcoming scheduled donors (next 7 days)
-    next_week = timezone.now() + timezone.timedelta(days=7)
+    next_week = timezone.now() + timezone.timedelta(days=stats.UPCOMING_DAYS)
     upcoming_donations = DonationSchedule.objects.filter(
         blood_bank=blood_bank,
         scheduled_date__gte=timezone.now(),
         scheduled_date__lte=next_week,
         status='scheduled'
-    ).select_related('donor', 'donor__user')[:10]
-    
-    # Get all inventory items
-    inventory_items = BloodInventory.objects.filter(blood_bank=blood_bank).order_by('blood_group')
+    ).select_related('donor', 'donor__user').order_by('scheduled_date')[:10]
     
     context = {
         'blood_bank': blood_bank,
-        'total_units': total_units,
-        'low_stock_alerts': low_stock_alerts,
+        'stats': dashboard_stats,
         'today_donations': today_donations,
         'upcoming_donations': upcoming_donations,
-        'inventory_items': inventory_items,
     }
     
     return render(request, 'bloodbanks/dashboard.html', context)
@@ -66,80 +76,396 @@ def manage_inventory(request):
     if request.method == 'POST':
         action = request.POST.get('action')
         blood_group = request.POST.get('blood_group')
-        units = int(request.POST.get('units', 0))
+        if blood_group not in dict(BloodInventory.BLOOD_GROUP_CHOICES):
+            messages.error(request, 'Choose a valid blood group')
+            return redirect('bloodbanks:manage_inventory')
+
+        try:
+            units = int(request.POST.get('units', 0))
+        except ValueError:
+            messages.error(request, 'Units must be a whole number of zero or more')
+            return redirect('bloodbanks:manage_inventory')
+
+        if units < 0:
+            messages.error(request, 'Units must be a whole number of zero or more')
         
-        if action == 'add':
-            inventory, created = BloodInventory.objects.get_or_create(
-                blood_bank=blood_bank,
-                blood_group=blood_group,
-                defaults={'units': 0}
-            )
-            inventory.units += units
-            inventory.save()
+        elif action == 'add':
+            inventory_service.add_units(blood_bank, blood_group, units)
             messages.success(request, f'Added {units} units of {blood_group}')
         
         elif action == 'remove':
             try:
-                inventory = BloodInventory.objects.get(blood_bank=blood_bank, blood_group=blood_group)
-                if inventory.units >= units:
-                    inventory.units -= units
-                    inventory.save()
-                    messages.success(request, f'Removed {units} units of {blood_group}')
-                else:
-                    messages.error(request, 'Not enough units in inventory')
+                inventory_service.remove_units(blood_bank, blood_group, units)
+                messages.success(request, f'Removed {units} units of {blood_group}')
+            except inventory_service.InsufficientStock:
+                messages.error(request, 'Not enough units in inventory')
             except BloodInventory.DoesNotExist:
                 messages.error(request, 'Inventory item not found')
         
         elif action == 'update':
-            inventory, created = BloodInventory.objects.get_or_create(
-                blood_bank=blood_bank,
-                blood_group=blood_group,
-                defaults={'units': units}
-            )
-            if not created:
-                inventory.units = units
-                inventory.save()
+            inventory_service.set_units(blood_bank, blood_group, units)
             messages.success(request, f'Updated {blood_group} inventory to {units} units')
         
         return redirect('bloodbanks:manage_inventory')
     
-    # Get all inventory items
-    inventory_items = BloodInventory.objects.filter(blood_bank=blood_bank).order_by('blood_group')
+    # Get all inventory items, flagged when a low-stock alert is open
+    inventory_items = BloodInventory.objects.filter(blood_bank=blood_bank).annotate(
+        low_stock=Exists(LowStockAlert.objects.filter(
+            blood_bank=OuterRef('blood_bank'),
+            blood_group=OuterRef('blood_group'),
+            resolved_at__isnull=True
+        ))
+    ).order_by('blood_group')
     
     context = {
         'blood_bank': blood_bank,
         'inventory_items': inventory_items,
+        'blood_groups': [group for group, _ in BloodInventory.BLOOD_GROUP_CHOICES],
+        'thresholds': alerts.thresholds_for(blood_bank).items(),
     }
     
     return render(request, 'bloodbanks/manage_inventory.html', context)
 
 
+def _parse_bulk_units(data):
+    """
+    Read {blood_group: units} from form or JSON data, skipping blanks
+
+    Units are digit strings (forms) or JSON integers. Raises ValueError
+    on a non-object, unknown groups or units that are not whole numbers
+    of zero or more.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Expected an object of blood group to units")
+
+    valid_groups = {group for group, _ in BloodInventory.BLOOD_GROUP_CHOICES}
+    unknown = set(data) - valid_groups
+    if unknown:
+        raise ValueError(f"Unknown blood group: {', '.join(sorted(unknown))}")
+
+    units_by_group = {}
+    for blood_group, _ in BloodInventory.BLOOD_GROUP_CHOICES:
+        value = data.get(blood_group)
+        if value is None or value == '':
+            continue
+        if isinstance(value, str) and value.strip().isdecimal():
+            units = int(value)
+        elif isinstance(value, int) and not isinstance(value, bool) and value >= 0:
+            units = value
+        else:
+            raise ValueError(f"Units for {blood_group} must be a whole number of zero or more")
+        units_by_group[blood_group] = units
+
+    return units_by_group
+
+
+def _inventory_snapshot(inventory_items):
+    return [
+        {
+            'blood_group': item.blood_group,
+            'units': item.units,
+            'last_updated': item.last_updated.isoformat(),
+        }
+        for item in inventory_items
+    ]
+
+
 @bloodbank_required
-def scheduled_donors(request):
-    """View all scheduled donors"""
+@require_POST
+def bulk_update_inventory(request):
+    """Set the stock of every blood group from one form submission"""
     blood_bank = BloodBank.objects.get(user=request.user)
-    
-    # Get all scheduled donations
-    scheduled_donations = DonationSchedule.objects.filter(
+
+    data = {
+        blood_group: request.POST.get(f'units_{blood_group}')
+        for blood_group, _ in BloodInventory.BLOOD_GROUP_CHOICES
+    }
+    try:
+        units_by_group = _parse_bulk_units(data)
+    except ValueError:
+        messages.error(request, 'Units must be whole numbers of zero or more')
+        return redirect('bloodbanks:manage_inventory')
+
+    if units_by_group:
+        inventory_service.bulk_set_units(blood_bank, units_by_group)
+        messages.success(request, f'Updated {len(units_by_group)} blood groups')
+    else:
+        messages.info(request, 'No units entered')
+
+    return redirect('bloodbanks:manage_inventory')
+
+
+@bloodbank_required
+@require_POST
+def update_thresholds(request):
+    """Save the low-stock threshold of every blood group"""
+    blood_bank = BloodBank.objects.get(user=request.user)
+
+    data = {
+        blood_group: request.POST.get(f'threshold_{blood_group}')
+        for blood_group, _ in BloodInventory.BLOOD_GROUP_CHOICES
+    }
+    try:
+        thresholds = _parse_bulk_units(data)
+    except ValueError:
+        messages.error(request, 'Thresholds must be whole numbers of zero or more')
+        return redirect('bloodbanks:manage_inventory')
+
+    if thresholds:
+        alerts.set_thresholds(blood_bank, thresholds)
+        messages.success(request, 'Low stock thresholds updated')
+
+    return redirect('bloodbanks:manage_inventory')
+
+
+def _parse_opening_hours(data):
+    """
+    {weekday: (opens_at, closes_at, slot_minutes, capacity)} from the
+    hours form; weekdays not marked open are left out. Raises ValueError
+    on a bad or empty window.
+    """
+    hours = {}
+    for weekday, _ in OpeningHours.WEEKDAY_CHOICES:
+        if not data.get(f'open_{weekday}'):
+            continue
+        opens_at = parse_time(data.get(f'opens_at_{weekday}') or '')
+        closes_at = parse_time(data.get(f'closes_at_{weekday}') or '')
+        slot_minutes = int(data.get(f'slot_minutes_{weekday}') or '')
+        capacity = int(data.get(f'capacity_{weekday}') or '')
+        if opens_at is None or closes_at is None or opens_at >= closes_at:
+            raise ValueError(weekday)
+        if slot_minutes < 5 or capacity < 1:
+            raise ValueError(weekday)
+        hours[weekday] = (opens_at, closes_at, slot_minutes, capacity)
+    return hours
+
+
+@bloodbank_required
+@require_http_methods(["GET", "POST"])
+def donation_slots(request):
+    """Weekly opening hours and the fill of upcoming donation slots"""
+    blood_bank = BloodBank.objects.get(user=request.user)
+
+    if request.method == 'POST':
+        try:
+            hours = _parse_opening_hours(request.POST)
+        except ValueError:
+            messages.error(
+                request,
+                'Each open day needs an opening time before its closing time, '
+                'slots of at least 5 minutes and room for at least 1 donor'
+            )
+            return redirect('bloodbanks:donation_slots')
+
+        created = slots.set_opening_hours(blood_bank, hours)
+        messages.success(request, f'Opening hours saved, {created} slots open for booking')
+        return redirect('bloodbanks:donation_slots')
+
+    current = {item.weekday: item for item in blood_bank.opening_hours.all()}
+    weekdays = [
+        {'weekday': weekday, 'name': name, 'hours': current.get(weekday)}
+        for weekday, name in OpeningHours.WEEKDAY_CHOICES
+    ]
+
+    now = timezone.now()
+    upcoming_slots = DonationSlot.objects.filter(
         blood_bank=blood_bank,
-        status='scheduled'
-    ).select_related('donor', 'donor__user').order_by('scheduled_date')
-    
-    # Get completed donations
-    completed_donations = DonationSchedule.objects.filter(
+        starts_at__gte=now,
+        starts_at__lt=now + timezone.timedelta(days=stats.UPCOMING_DAYS),
+    )
+
+    context = {
+        'blood_bank': blood_bank,
+        'weekdays': weekdays,
+        'default_slot_minutes': DEFAULT_SLOT_MINUTES,
+        'default_capacity': DEFAULT_SLOT_CAPACITY,
+        'upcoming_slots': upcoming_slots,
+    }
+    return render(request, 'bloodbanks/donation_slots.html', context)
+
+
+EXPORTS = {
+    'stock': csv_io.export_stock,
+    'inventory': csv_io.export_inventory,
+    'ledger': csv_io.export_ledger,
+    'donations': csv_io.export_donations,
+}
+
+
+@bloodbank_required
+def export_csv(request, kind):
+    """Stream stock, inventory, ledger or donation history as CSV"""
+    if kind not in EXPORTS:
+        raise Http404('Unknown export')
+    blood_bank = BloodBank.objects.get(user=request.user)
+    return EXPORTS[kind](blood_bank)
+
+
+@bloodbank_required
+@require_POST
+def import_stock(request):
+    """Replace the bank's stock with the batches of an uploaded CSV"""
+    blood_bank = BloodBank.objects.get(user=request.user)
+
+    stock_file = request.FILES.get('stock_file')
+    if stock_file is None:
+        messages.error(request, 'Please choose a CSV file to import')
+        return redirect('bloodbanks:manage_inventory')
+
+    try:
+        totals = inventory_service.import_stock(blood_bank, csv_io.read_stock_csv(stock_file))
+    except csv_io.StockImportError as e:
+        messages.error(request, f'Import failed, nothing was changed. {e}')
+    except UnicodeDecodeError:
+        messages.error(request, 'Import failed, nothing was changed. The file is not UTF-8 text.')
+    else:
+        messages.success(request, f'Imported stock: {sum(totals.values())} units in date')
+
+    return redirect('bloodbanks:manage_inventory')
+
+
+@bloodbank_required
+@require_http_methods(["GET", "POST"])
+def inventory_api(request):
+    """
+    JSON inventory snapshot
+
+    GET returns the current stock, or with ?at=<ISO datetime> the stock
+    held at that moment according to the inventory ledger. POST takes
+    {"units": {"A+": 12, ...}} (any subset of groups), applies it in one
+    transaction and returns the new snapshot.
+    """
+    blood_bank = BloodBank.objects.get(user=request.user)
+
+    if request.method == 'GET' and request.GET.get('at'):
+        try:
+            at = parse_datetime(request.GET['at'])
+        except ValueError:
+            at = None
+        if at is None:
+            return JsonResponse({'success': False, 'message': 'Invalid datetime'}, status=400)
+        if timezone.is_naive(at):
+            at = timezone.make_aware(at)
+
+        return JsonResponse({
+            'success': True,
+            'at': at.isoformat(),
+            'inventory': [
+                {'blood_group': blood_group, 'units': units}
+                for blood_group, units in ledger.stock_on(blood_bank, at).items()
+            ],
+        })
+
+    if request.method == 'POST':
+        try:
+            payload = json.loads(request.body or '{}')
+            if not isinstance(payload, dict):
+                raise ValueError("Expected a JSON object")
+            units = payload.get('units')
+            units_by_group = _parse_bulk_units({} if units is None else units)
+        except ValueError as e:
+            return JsonResponse({'success': False, 'message': str(e)}, status=400)
+
+        inventory_items = inventory_service.bulk_set_units(blood_bank, units_by_group)
+    else:
+        inventory_items = BloodInventory.objects.filter(blood_bank=blood_bank).order_by('blood_group')
+
+    return JsonResponse({
+        'success': True,
+        'inventory': _inventory_snapshot(inventory_items),
+    })
+
+
+# Listed schedule statuses and whether they are shown newest first
+SCHEDULE_LISTS = {
+    'scheduled': False,
+    'completed': True,
+}
+
+
+def _schedule_page(blood_bank, status, params):
+    """One keyset page of a bank's schedules; raises ValueError on bad filters"""
+    schedules = DonationSchedule.objects.filter(
         blood_bank=blood_bank,
-        status='completed'
-    ).select_related('donor', 'donor__user').order_by('-scheduled_date')[:20]
-    
+        status=status
+    ).select_related('donor', 'donor__user')
+    schedules = pagination.filter_schedules(schedules, params)
+    return pagination.page(schedules, params.get('after'), descending=SCHEDULE_LISTS[status])
+
+
+@bloodbank_required
+def scheduled_donors(request):
+    """View scheduled and completed donors, a page at a time"""
+    blood_bank = BloodBank.objects.get(user=request.user)
+
+    filters = {
+        key: request.GET.get(key, '')
+        for key in ('date_from', 'date_to', 'blood_group')
+    }
+    try:
+        scheduled_donations, scheduled_next = _schedule_page(blood_bank, 'scheduled', filters)
+        completed_donations, completed_next = _schedule_page(blood_bank, 'completed', filters)
+    except ValueError:
+        messages.error(request, 'Invalid filter, showing all donations')
+        return redirect('bloodbanks:scheduled_donors')
+
     context = {
         'blood_bank': blood_bank,
         'scheduled_donations': scheduled_donations,
+        'scheduled_next': scheduled_next,
         'completed_donations': completed_donations,
+        'completed_next': completed_next,
+        'filters': filters,
+        'blood_groups': [choice[0] for choice in BloodInventory.BLOOD_GROUP_CHOICES],
+        'calendar_url': request.build_absolute_uri(
+            reverse('bloodbanks:calendar_feed', args=[blood_bank.calendar_token])
+        ),
     }
-    
+
     return render(request, 'bloodbanks/scheduled_donors.html', context)
 
 
+@bloodbank_required
+def scheduled_donors_api(request):
+    """
+    JSON page of scheduled or completed donors, for infinite scroll
+
+    Takes ?status=scheduled|completed, the cursor of the previous page as
+    ?after= and the same filters as the listing page.
+    """
+    blood_bank = BloodBank.objects.get(user=request.user)
+
+    status = request.GET.get('status', 'scheduled')
+    if status not in SCHEDULE_LISTS:
+        return JsonResponse({'success': False, 'message': 'Invalid status'}, status=400)
+
+    try:
+        donations, next_cursor = _schedule_page(blood_bank, status, request.GET)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+
+    return JsonResponse({
+        'success': True,
+        'results': [
+            {
+                'id': donation.id,
+                'donor': donation.donor.user.username,
+                'donor_user_id': donation.donor.user_id,
+                'blood_group': donation.donor.blood_group,
+                'age': donation.donor.age,
+                'phone_number': donation.donor.phone_number,
+                'scheduled_date': donation.scheduled_date.isoformat(),
+                'scheduled_display': date_format(
+                    timezone.localtime(donation.scheduled_date), 'F d, Y g:i A'
+                ),
+                'status': donation.status,
+            }
+            for donation in donations
+        ],
+        'next': next_cursor,
+    })
+
+
 @bloodbank_required
 def mark_completed(request, schedule_id):
     """Mark a donation as completed"""
@@ -152,6 +478,65 @@ def mark_completed(request, schedule_id):
     
     return redirect('bloodbanks:scheduled_donors')
 
+
+@bloodbank_required
+@require_POST
+def complete_donations(request):
+    """Mark all selected donations as completed, e.g. after a blood drive"""
+    blood_bank = BloodBank.objects.get(user=request.user)
+
+    try:
+        schedule_ids = [int(pk) for pk in request.POST.getlist('schedule_ids')]
+    except ValueError:
+        schedule_ids = []
+    if not schedule_ids:
+        messages.error(request, 'Select at least one donation to complete')
+        return redirect('bloodbanks:scheduled_donors')
+
+    completed = donation_service.complete_donations(schedule_ids, blood_bank=blood_bank)
+    messages.success(request, f'{completed} donation{"s" if completed != 1 else ""} marked as completed!')
+
+    return redirect('bloodbanks:scheduled_donors')
+
+
+@require_safe
+def calendar_feed(request, token):
+    """
+    iCalendar feed of a bank's bookings, for calendar apps
+
+    Public but unguessable: the token in the URL identifies the bank.
+    Polls with a matching If-None-Match / If-Modified-Since get a 304
+    after a single query.
+    """
+    state = ical.feed_state(token)
+    if state is None:
+        raise Http404('Unknown calendar')
+
+    etag = ical.etag(state)
+    last_modified = state['last_modified'] and int(state['last_modified'].timestamp())
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = ical.feed_response(state)
+
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@bloodbank_required
+@require_POST
+def reset_calendar_token(request):
+    """Give the bank a new calendar feed URL, cutting off the old one"""
+    blood_bank = BloodBank.objects.get(user=request.user)
+    blood_bank.calendar_token = new_calendar_token()
+    blood_bank.save(update_fields=['calendar_token', 'updated_at'])
+    messages.success(request, 'Calendar link reset. Subscribe again with the new link.')
+    return redirect('bloodbanks:scheduled_donors')
+
+
 @bloodbank_required
 def profile(request):
     """
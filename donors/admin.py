@@ -2,6 +2,7 @@
 Admin configuration for donors app
 """
 from django.contrib import admin
+from . import services
 from .models import DonorProfile, DonationSchedule
 
 
@@ -17,4 +18,10 @@ class DonationScheduleAdmin(admin.ModelAdmin):
     list_display = ('donor', 'blood_bank', 'scheduled_date', 'status', 'created_at')
     list_filter = ('status', 'scheduled_date')
     search_fields = ('donor__user__username', 'blood_bank__user__username')
+    actions = ['mark_completed']
+
+    @admin.action(description='Mark selected donations as completed')
+    def mark_completed(self, request, queryset):
+        completed = services.complete_donations(queryset.values_list('pk', flat=True))
+        self.message_user(request, f'{completed} donation(s) marked as completed.')
 
@@ -5,3 +5,5 @@ class DonorsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'donors'
 
+    def ready(self):
+        import donors.signals  # noqa
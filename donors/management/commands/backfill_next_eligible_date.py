@@ -0,0 +1,43 @@
+"""
+Recompute DonorProfile.next_eligible_date from last_donation_date
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from donors.models import DonorProfile
+
+
+class Command(BaseCommand):
+    help = 'Fill in next_eligible_date for donors whose stored value is missing or stale'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        batch = []
+        updated = 0
+
+        donors = DonorProfile.objects.only(
+            'pk', 'last_donation_date', 'next_eligible_date'
+        ).order_by('pk').iterator(chunk_size=batch_size)
+
+        for donor in donors:
+            expected = DonorProfile.compute_next_eligible_date(donor.last_donation_date)
+            if donor.next_eligible_date != expected:
+                donor.next_eligible_date = expected
+                batch.append(donor)
+
+            if len(batch) >= batch_size:
+                updated += self._flush(batch)
+                batch = []
+
+        if batch:
+            updated += self._flush(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Updated next_eligible_date for {updated} donors.'))
+
+    def _flush(self, batch):
+        with transaction.atomic():
+            DonorProfile.objects.bulk_update(batch, ['next_eligible_date'])
+        return len(batch)
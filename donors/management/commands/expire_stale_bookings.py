@@ -0,0 +1,33 @@
+"""
+Expire scheduled donations left open past their date
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from donors import services
+
+
+class Command(BaseCommand):
+    help = "Move bookings still 'scheduled' after their date to 'expired'"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours', type=int, default=services.STALE_BOOKING_GRACE_HOURS,
+            help='Hours past its scheduled time a booking is left open'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Bookings expired per UPDATE'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        expired = services.expire_stale_bookings(
+            grace_hours=options['grace_hours'], batch_size=options['batch_size']
+        )
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Expired {expired} stale bookings in {elapsed:.2f}s.'
+        ))
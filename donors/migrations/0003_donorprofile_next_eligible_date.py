@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:37
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def backfill_next_eligible_date(apps, schema_editor):
+    DonorProfile = apps.get_model('donors', 'DonorProfile')
+    donors = list(DonorProfile.objects.filter(last_donation_date__isnull=False))
+    for donor in donors:
+        donor.next_eligible_date = donor.last_donation_date + timedelta(days=90)
+    DonorProfile.objects.bulk_update(donors, ['next_eligible_date'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donors', '0002_donorprofile_address_donorprofile_gender_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='donorprofile',
+            name='next_eligible_date',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(backfill_next_eligible_date, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donors', '0003_donorprofile_next_eligible_date'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='donationschedule',
+            index=models.Index(fields=['donor', 'status', 'scheduled_date'], name='donors_sched_donor_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donationschedule',
+            index=models.Index(fields=['blood_bank', 'status', 'scheduled_date'], name='donors_sched_bank_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donationschedule',
+            index=models.Index(condition=models.Q(('status', 'scheduled')), fields=['scheduled_date'], name='donors_sched_open_date_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:57
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def cancel_duplicate_bookings(apps, schema_editor):
+    """Keep each donor's latest active booking and cancel the rest"""
+    DonationSchedule = apps.get_model('donors', 'DonationSchedule')
+
+    duplicates = DonationSchedule.objects.filter(status='scheduled').values(
+        'donor_id'
+    ).annotate(count=Count('id'), keep=Max('id')).filter(count__gt=1).order_by()
+
+    for duplicate in duplicates:
+        DonationSchedule.objects.filter(
+            donor_id=duplicate['donor_id'], status='scheduled'
+        ).exclude(pk=duplicate['keep']).update(status='cancelled')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donors', '0004_donationschedule_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(cancel_duplicate_bookings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='donationschedule',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'scheduled')), fields=('donor',), name='donors_one_active_booking_per_donor'),
+        ),
+    ]
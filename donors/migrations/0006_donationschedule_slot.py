@@ -0,0 +1,20 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bloodbanks', '0009_donation_slots'),
+        ('donors', '0005_one_active_booking_per_donor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='donationschedule',
+            name='slot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bookings', to='bloodbanks.donationslot'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donors', '0006_donationschedule_slot'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='donationschedule',
+            name='status',
+            field=models.CharField(choices=[('scheduled', 'Scheduled'), ('completed', 'Completed'), ('cancelled', 'Cancelled'), ('expired', 'Expired')], default='scheduled', max_length=20),
+        ),
+    ]
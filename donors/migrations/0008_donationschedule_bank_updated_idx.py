@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donors', '0007_donationschedule_expired_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='donationschedule',
+            index=models.Index(fields=['blood_bank', 'updated_at'], name='donors_sched_bank_updated_idx'),
+        ),
+    ]
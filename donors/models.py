@@ -2,14 +2,71 @@
 Donor models: DonorProfile and DonationSchedule
 """
 from django.db import models
+from django.db.models import Case, Q, Value, When
+from django.utils import timezone
 from django.core.exceptions import ValidationError
 from accounts.models import User
-from bloodbanks.models import BloodBank
+from bloodbanks.models import BloodBank, DonationSlot
 from datetime import date, timedelta
 
-import uuid
 
+# Eligibility rules shared by DonorProfile.is_eligible and the queryset
+MIN_DONOR_AGE = 18
+MAX_DONOR_AGE = 65
+DONATION_GAP_DAYS = 90
 
+# Red cell compatibility: recipient blood group -> donor groups it can
+# receive, the recipient's own group first
+COMPATIBLE_DONOR_GROUPS = {
+    'O-': ['O-'],
+    'O+': ['O+', 'O-'],
+    'A-': ['A-', 'O-'],
+    'A+': ['A+', 'A-', 'O+', 'O-'],
+    'B-': ['B-', 'O-'],
+    'B+': ['B+', 'B-', 'O+', 'O-'],
+    'AB-': ['AB-', 'A-', 'B-', 'O-'],
+    'AB+': ['AB+', 'AB-', 'A+', 'A-', 'B+', 'B-', 'O+', 'O-'],
+}
+
+
+class DonorProfileQuerySet(models.QuerySet):
+    """
+    Eligibility rules of DonorProfile.is_eligible expressed in SQL
+    """
+
+    @staticmethod
+    def eligibility_q(on=None, require_availability=True):
+        """Q object matching donors eligible to donate on the given date"""
+        on = on or date.today()
+        condition = Q(
+            age__gte=MIN_DONOR_AGE,
+            age__lte=MAX_DONOR_AGE,
+        ) & (
+            Q(next_eligible_date__isnull=True)
+            | Q(next_eligible_date__lte=on)
+        )
+        if require_availability:
+            condition &= Q(availability=True)
+        return condition
+
+    def eligible(self, on=None, require_availability=True):
+        """
+        Donors eligible to donate on the given date (today by default)
+
+        With require_availability=False the availability toggle is
+        ignored and only the age and donation-gap rules apply.
+        """
+        return self.filter(self.eligibility_q(on, require_availability))
+
+    def with_eligibility(self, on=None):
+        """Annotate each donor with an `eligible` boolean"""
+        return self.annotate(
+            eligible=Case(
+                When(self.eligibility_q(on), then=Value(True)),
+                default=Value(False),
+                output_field=models.BooleanField(),
+            )
+        )
 
 
 class DonorProfile(models.Model):
@@ -75,10 +132,16 @@ class DonorProfile(models.Model):
     last_donation_date = models.DateField(null=True, blank=True)
     total_donations = models.PositiveIntegerField(default=0)
 
+    # Denormalized from last_donation_date (+ DONATION_GAP_DAYS) so the
+    # waiting-period rule is one indexed comparison
+    next_eligible_date = models.DateField(null=True, blank=True, db_index=True)
+
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = DonorProfileQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Donor Profile'
         verbose_name_plural = 'Donor Profiles'
@@ -87,7 +150,7 @@ class DonorProfile(models.Model):
         return f"{self.user.username} - {self.blood_group}"
 
     # ==========================
-    # ELIGIBILITY LOGIC (UNCHANGED)
+    # ELIGIBILITY LOGIC
     # ==========================
     def is_eligible(self):
         """
@@ -96,6 +159,8 @@ class DonorProfile(models.Model):
         - Must have availability ON
         - Must be at least 90 days since last donation (if any)
         - Age should be between 18-65
+
+        DonorProfile.objects.eligible() applies the same rules in SQL.
         """
 
         if not self.availability:
@@ -104,17 +169,29 @@ class DonorProfile(models.Model):
         if not self.age:
             return False, "Please update your age in profile"
 
-        if self.age < 18 or self.age > 65:
-            return False, "Age must be between 18-65 years"
+        if self.age < MIN_DONOR_AGE or self.age > MAX_DONOR_AGE:
+            return False, f"Age must be between {MIN_DONOR_AGE}-{MAX_DONOR_AGE} years"
 
-        if self.last_donation_date:
-            days_since_last_donation = (date.today() - self.last_donation_date).days
-            if days_since_last_donation < 90:
-                remaining_days = 90 - days_since_last_donation
-                return False, f"Must wait {remaining_days} more days before next donation"
+        if self.next_eligible_date and self.next_eligible_date > date.today():
+            remaining_days = (self.next_eligible_date - date.today()).days
+            return False, f"Must wait {remaining_days} more days before next donation"
 
         return True, "Eligible to donate"
 
+    @staticmethod
+    def compute_next_eligible_date(last_donation_date):
+        """First date a donor may donate again after last_donation_date"""
+        if not last_donation_date:
+            return None
+        return last_donation_date + timedelta(days=DONATION_GAP_DAYS)
+
+    def save(self, *args, **kwargs):
+        self.next_eligible_date = self.compute_next_eligible_date(self.last_donation_date)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'last_donation_date' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'next_eligible_date'}
+        super().save(*args, **kwargs)
+
     # ==========================
     # DISTANCE CALCULATION (UNCHANGED)
     # ==========================
@@ -218,6 +295,8 @@ class DonationSchedule(models.Model):
         ('scheduled', 'Scheduled'),
         ('completed', 'Completed'),
         ('cancelled', 'Cancelled'),
+        # Past due and never completed (see donors.services.expire_stale_bookings)
+        ('expired', 'Expired'),
     ]
 
     donor = models.ForeignKey(
@@ -233,6 +312,16 @@ class DonationSchedule(models.Model):
     )
 
     scheduled_date = models.DateTimeField()
+
+    # Capacity-limited slot the booking took a place in (see bloodbanks.slots)
+    slot = models.ForeignKey(
+        DonationSlot,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='bookings'
+    )
+
     status = models.CharField(
         max_length=20,
         choices=STATUS_CHOICES,
@@ -248,6 +337,38 @@ class DonationSchedule(models.Model):
         verbose_name = 'Donation Schedule'
         verbose_name_plural = 'Donation Schedules'
         ordering = ['-scheduled_date']
+        # Dashboards filter on equality columns first, then a
+        # scheduled_date range or ordering
+        indexes = [
+            models.Index(
+                fields=['donor', 'status', 'scheduled_date'],
+                name='donors_sched_donor_status_idx'
+            ),
+            models.Index(
+                fields=['blood_bank', 'status', 'scheduled_date'],
+                name='donors_sched_bank_status_idx'
+            ),
+            # Latest change per bank, for the calendar feed's ETag
+            models.Index(
+                fields=['blood_bank', 'updated_at'],
+                name='donors_sched_bank_updated_idx'
+            ),
+            # Sweeps over open bookings across all banks
+            models.Index(
+                fields=['scheduled_date'],
+                name='donors_sched_open_date_idx',
+                condition=Q(status='scheduled')
+            ),
+        ]
+        constraints = [
+            # A donor holds at most one active booking; enforced by the
+            # database so concurrent submits cannot both get through
+            models.UniqueConstraint(
+                fields=['donor'],
+                condition=Q(status='scheduled'),
+                name='donors_one_active_booking_per_donor'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.donor.user.username} -> {self.blood_bank.user.username} on {self.scheduled_date.date()}"
@@ -269,7 +390,9 @@ class DonationSchedule(models.Model):
             raise ValidationError("Scheduled date must be in the future")
 
     def save(self, *args, **kwargs):
-        self.full_clean()
+        # Constraints are left to the database: the insert itself raises
+        # IntegrityError for a second active booking, without a lookup
+        self.full_clean(validate_constraints=False)
         super().save(*args, **kwargs)
 
     # ==========================
@@ -280,41 +403,22 @@ class DonationSchedule(models.Model):
         Mark donation as completed.
         Existing logic preserved.
         Reward is generated ONLY once when status becomes 'completed'.
+
+        Donor stats, inventory and the reward are handled by
+        donors.services.complete_donations, shared with batch completion.
         """
 
         # Prevent duplicate completion
         if self.status == 'completed':
             return
 
-        # 1️⃣ Mark as completed
-        self.status = 'completed'
-        self.save()
-
-        # 2️⃣ Update donor stats (existing logic)
-        self.donor.last_donation_date = date.today()
-        self.donor.total_donations += 1
-        self.donor.save()
-
-        # 3️⃣ Add blood to inventory (existing logic)
-        from bloodbanks.models import BloodInventory
-        inventory, created = BloodInventory.objects.get_or_create(
-            blood_bank=self.blood_bank,
-            blood_group=self.donor.blood_group,
-            defaults={'units': 0}
-        )
-        inventory.units += 1
-        inventory.save()
-
-        # 4️⃣ 🎁 GENERATE REWARD (NEW LOGIC – SAFE)
-        from donors.models import DonationReward
-
-        if not hasattr(self, 'reward'):
-            DonationReward.objects.create(
-                donor=self.donor,
-                donation=self,
-                voucher_code=f"LIFELINK-{uuid.uuid4().hex[:8].upper()}",
-                description="₹100 Health Voucher – Thank you for donating blood!"
-            )
+        from donors.services import complete_donations
+        complete_donations([self.pk])
+
+        self.refresh_from_db(fields=['status', 'updated_at'])
+        self.donor.refresh_from_db(fields=['last_donation_date', 'next_eligible_date', 'total_donations'])
+
+
 class DonationReward(models.Model):
     """
     Reward generated only when donation is completed
@@ -343,6 +447,23 @@ class DonationReward(models.Model):
     def __str__(self):
         return f"Reward for {self.donor.user.username}"
 
+
+class DonorIndexVersion(models.Model):
+    """
+    Change counter of one blood group's donor spatial index, shared by
+    every worker so each can tell when its in-memory copy is stale
+    """
+
+    blood_group = models.CharField(
+        max_length=3,
+        choices=DonorProfile.BLOOD_GROUP_CHOICES,
+        unique=True
+    )
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.blood_group} index v{self.version}"
+
 # class DonorProfile(models.Model):
 #     user = models.OneToOneField(
 #         User,
@@ -0,0 +1,133 @@
+"""
+Donation completion and expiry in bulk
+
+complete_donations() completes any number of scheduled donations with a
+fixed number of queries: one UPDATE for the schedules, one for the
+donors, one bulk insert of rewards and one batched stock write per blood
+bank (bloodbanks.services.bulk_add_units), all in one transaction. DonationSchedule.mark_completed
+goes through it as well, so single and batch completion behave alike;
+receivers of donors.signals.donations_completed stand in for the
+post_save ones the UPDATEs skip.
+
+expire_stale_bookings() moves bookings left 'scheduled' past their date
+to 'expired' in batched UPDATEs.
+"""
+import uuid
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from bloodbanks import services as inventory_service, stats
+from bloodbanks.models import BloodBank
+from .models import DonationReward, DonationSchedule, DonorProfile
+from .signals import donations_completed
+
+
+REWARD_DESCRIPTION = "₹100 Health Voucher – Thank you for donating blood!"
+
+# Hours past its scheduled time a booking stays open for completion
+STALE_BOOKING_GRACE_HOURS = 24
+
+
+def complete_donations(schedule_ids, blood_bank=None):
+    """
+    Mark scheduled donations as completed; returns how many were
+
+    Only schedules still 'scheduled' (and of blood_bank, when given) are
+    completed; the rest of schedule_ids are ignored. Each donor's last
+    donation date, next eligible date and total are updated, every unit
+    goes into its bank's stock and every completed donation gets a reward.
+    """
+    today = date.today()
+    now = timezone.now()
+
+    with transaction.atomic():
+        schedules = DonationSchedule.objects.select_for_update(of=('self',)).filter(
+            pk__in=list(schedule_ids), status='scheduled'
+        )
+        if blood_bank is not None:
+            schedules = schedules.filter(blood_bank=blood_bank)
+        rows = list(schedules.values_list('pk', 'donor_id', 'blood_bank_id', 'donor__blood_group'))
+        if not rows:
+            return 0
+
+        pks = [pk for pk, _, _, _ in rows]
+        DonationSchedule.objects.filter(pk__in=pks).update(status='completed', updated_at=now)
+
+        # One active booking per donor, so each donor appears once
+        DonorProfile.objects.filter(pk__in=[donor_id for _, donor_id, _, _ in rows]).update(
+            last_donation_date=today,
+            next_eligible_date=DonorProfile.compute_next_eligible_date(today),
+            total_donations=F('total_donations') + 1,
+            updated_at=now,
+        )
+
+        units = defaultdict(Counter)
+        for _, _, blood_bank_id, blood_group in rows:
+            units[blood_bank_id][blood_group] += 1
+        banks = BloodBank.objects.in_bulk(list(units))
+        for blood_bank_id, units_by_group in units.items():
+            inventory_service.bulk_add_units(banks[blood_bank_id], units_by_group, reason='donation')
+
+        rewarded = set(
+            DonationReward.objects.filter(donation_id__in=pks).values_list('donation_id', flat=True)
+        )
+        DonationReward.objects.bulk_create([
+            DonationReward(
+                donor_id=donor_id,
+                donation_id=pk,
+                voucher_code=f"LIFELINK-{uuid.uuid4().hex[:8].upper()}",
+                description=REWARD_DESCRIPTION,
+            )
+            for pk, donor_id, _, _ in rows
+            if pk not in rewarded
+        ])
+
+        # The UPDATEs bypass the post_save receivers. Every bank here took
+        # in stock, so its inventory_changed already expired its dashboard
+        donations_completed.send(
+            sender=DonationSchedule,
+            donor_ids=[donor_id for _, donor_id, _, _ in rows],
+            blood_bank_ids=list(banks),
+        )
+
+    return len(rows)
+
+
+def expire_stale_bookings(now=None, grace_hours=STALE_BOOKING_GRACE_HOURS, batch_size=1000):
+    """
+    Expire bookings still 'scheduled' grace_hours after their time
+
+    Each batch takes the oldest stale bookings from the partial index on
+    open bookings' scheduled_date and expires them in one UPDATE, in its
+    own transaction. Expired rows leave that index, so every batch reads
+    from its start. Returns the number of bookings expired.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(hours=grace_hours)
+    expired = 0
+
+    while True:
+        with transaction.atomic():
+            batch = list(
+                DonationSchedule.objects.filter(
+                    status='scheduled', scheduled_date__lt=cutoff
+                ).order_by('scheduled_date').values_list('pk', 'blood_bank_id')[:batch_size]
+            )
+            if not batch:
+                break
+
+            expired += DonationSchedule.objects.filter(
+                pk__in=[pk for pk, _ in batch], status='scheduled'
+            ).update(status='expired', updated_at=now)
+
+            # The UPDATE bypasses the post_save receivers
+            stats.invalidate_many(blood_bank_id for _, blood_bank_id in batch)
+
+        if len(batch) < batch_size:
+            break
+
+    return expired
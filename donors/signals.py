@@ -0,0 +1,70 @@
+"""
+Signals keeping the donor spatial index in sync with the database
+"""
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import Signal, receiver
+
+from accounts.models import User
+from . import spatial_index
+from .models import DonorProfile
+
+
+# Sent by donors.services after completing donations with queryset
+# UPDATEs, which bypass post_save, with the donor_ids and blood_bank_ids
+# of the completed schedules
+donations_completed = Signal()
+
+
+@receiver(post_init, sender=User)
+def remember_user_location(sender, instance, **kwargs):
+    """Keep the loaded coordinates so saves can tell if they moved"""
+    instance._indexed_location = (
+        instance.__dict__.get('latitude'), instance.__dict__.get('longitude')
+    )
+
+
+@receiver(post_init, sender=DonorProfile)
+def remember_blood_group(sender, instance, **kwargs):
+    """Keep the loaded blood group so saves can tell if it changed"""
+    instance._indexed_blood_group = instance.__dict__.get('blood_group') if instance.pk else None
+
+
+@receiver(post_save, sender=User)
+def reindex_moved_donor(sender, instance, created, update_fields=None, **kwargs):
+    """Move a donor in the index when their location changes"""
+    location = (instance.latitude, instance.longitude)
+    previous, instance._indexed_location = instance._indexed_location, location
+
+    # New donors are indexed when their DonorProfile is created
+    if created or instance.role != 'donor' or location == previous:
+        return
+    if update_fields is not None and not {'latitude', 'longitude'} & set(update_fields):
+        return
+
+    blood_group = DonorProfile.objects.filter(
+        user=instance
+    ).values_list('blood_group', flat=True).first()
+    if blood_group:
+        spatial_index.update_donor(instance.pk, blood_group, *location)
+
+
+@receiver(post_save, sender=DonorProfile)
+def reindex_donor_profile(sender, instance, created, **kwargs):
+    """Index new donors and move donors whose blood group changed"""
+    previous, instance._indexed_blood_group = instance._indexed_blood_group, instance.blood_group
+    if not created and previous == instance.blood_group:
+        return
+
+    if previous and previous != instance.blood_group:
+        spatial_index.remove_donor(instance.user_id, previous)
+
+    user = instance.user
+    spatial_index.update_donor(
+        instance.user_id, instance.blood_group, user.latitude, user.longitude
+    )
+
+
+@receiver(post_delete, sender=DonorProfile)
+def unindex_donor_profile(sender, instance, **kwargs):
+    """Drop deleted donors from the index"""
+    spatial_index.remove_donor(instance.user_id, instance.blood_group)
@@ -0,0 +1,350 @@
+"""
+Process-local spatial index of donor locations, one KD-tree per blood group
+
+Donor coordinates are projected onto the unit sphere, where straight-line
+(chord) distance grows monotonically with great-circle distance, so radius
+and k-nearest queries on a 3-d tree give exact haversine answers.
+
+Each worker builds its trees lazily on first use and keeps them current
+from model signals. Every change also bumps the group's DonorIndexVersion
+row in the database, so changes made by other workers are seen too:
+sync() reads the versions of the groups about to be searched in one
+query and rebuilds any local copy built at an older version. Callers
+sync once per request before calling within() or nearest().
+"""
+import heapq
+import math
+import threading
+from functools import partial
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+
+from accounts.utils import EARTH_RADIUS_KM
+
+
+# Points per leaf before the tree stops splitting
+LEAF_SIZE = 16
+
+# Pending changes tolerated (as a share of the tree) before a rebuild
+REBUILD_RATIO = 0.1
+
+
+def to_unit_vector(latitude, longitude):
+    """Project decimal-degree coordinates onto the unit sphere"""
+    lat = math.radians(float(latitude))
+    lon = math.radians(float(longitude))
+    cos_lat = math.cos(lat)
+    return (cos_lat * math.cos(lon), cos_lat * math.sin(lon), math.sin(lat))
+
+
+def km_to_chord(distance_km):
+    """Convert a great-circle distance to a chord length on the unit sphere"""
+    angle = min(distance_km / EARTH_RADIUS_KM, math.pi)
+    return 2 * math.sin(angle / 2)
+
+
+def chord_to_km(chord):
+    """Convert a chord length on the unit sphere to a great-circle distance"""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1.0))
+
+
+def _squared_distance(a, b):
+    return (a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2 + (a[2] - b[2]) ** 2
+
+
+class KDTree:
+    """
+    Static 3-d tree stored as an implicitly balanced array
+
+    The median of every index range is the splitting node, so no node
+    objects are allocated; leaves hold up to LEAF_SIZE unsorted points.
+    """
+
+    def __init__(self, items):
+        # items: list of (key, (x, y, z))
+        self._items = list(items)
+        self._build(0, len(self._items), 0)
+
+    def __len__(self):
+        return len(self._items)
+
+    def keys(self):
+        return [key for key, _ in self._items]
+
+    def _build(self, lo, hi, depth):
+        if hi - lo <= LEAF_SIZE:
+            return
+        axis = depth % 3
+        self._items[lo:hi] = sorted(self._items[lo:hi], key=lambda item: item[1][axis])
+        mid = (lo + hi) // 2
+        self._build(lo, mid, depth + 1)
+        self._build(mid + 1, hi, depth + 1)
+
+    def query_radius(self, point, radius):
+        """Return [(key, squared_chord)] for points within radius of point"""
+        items = self._items
+        limit = radius * radius
+        found = []
+        stack = [(0, len(items), 0)]
+
+        while stack:
+            lo, hi, depth = stack.pop()
+            if hi - lo <= LEAF_SIZE:
+                for key, other in items[lo:hi]:
+                    distance = _squared_distance(point, other)
+                    if distance <= limit:
+                        found.append((key, distance))
+                continue
+
+            mid = (lo + hi) // 2
+            key, other = items[mid]
+            distance = _squared_distance(point, other)
+            if distance <= limit:
+                found.append((key, distance))
+
+            axis = depth % 3
+            diff = point[axis] - other[axis]
+            near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+            stack.append((near[0], near[1], depth + 1))
+            if diff * diff <= limit:
+                stack.append((far[0], far[1], depth + 1))
+
+        return found
+
+    def query_nearest(self, point, k, radius=None):
+        """Return up to k [(key, squared_chord)] nearest to point, unsorted"""
+        items = self._items
+        limit = math.inf if radius is None else radius * radius
+        heap = []  # max-heap on distance via negation
+        stack = [(0, len(items), 0, 0.0)]
+
+        def consider(key, other):
+            distance = _squared_distance(point, other)
+            if distance > limit:
+                return
+            if len(heap) < k:
+                heapq.heappush(heap, (-distance, key))
+            elif distance < -heap[0][0]:
+                heapq.heapreplace(heap, (-distance, key))
+
+        def bound():
+            return -heap[0][0] if len(heap) == k else limit
+
+        while stack:
+            lo, hi, depth, plane_distance = stack.pop()
+            if plane_distance > bound():
+                continue
+            if hi - lo <= LEAF_SIZE:
+                for key, other in items[lo:hi]:
+                    consider(key, other)
+                continue
+
+            mid = (lo + hi) // 2
+            key, other = items[mid]
+            consider(key, other)
+
+            axis = depth % 3
+            diff = point[axis] - other[axis]
+            near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+            # Far side first so the near side is explored (and tightens the bound) first
+            stack.append((far[0], far[1], depth + 1, diff * diff))
+            stack.append((near[0], near[1], depth + 1, plane_distance))
+
+        return [(key, -distance) for distance, key in heap]
+
+
+class DonorLocationIndex:
+    """
+    KD-tree for one blood group plus a small overlay of pending changes
+
+    Updates land in the overlay (added points and tombstoned tree keys);
+    once it grows past REBUILD_RATIO of the tree the tree is rebuilt.
+    """
+
+    def __init__(self, items, version):
+        self.version = version
+        self._tree = KDTree(items)
+        self._tree_keys = set(self._tree.keys())
+        self._added = {}
+        self._removed = set()
+
+    def __len__(self):
+        return len(self._tree_keys) - len(self._removed) + len(self._added)
+
+    def update(self, key, point):
+        """Insert, move (point given) or remove (point None) a donor"""
+        if key in self._tree_keys:
+            self._removed.add(key)
+        self._added.pop(key, None)
+        if point is not None:
+            self._added[key] = point
+
+        if len(self._added) + len(self._removed) > max(LEAF_SIZE, len(self._tree) * REBUILD_RATIO):
+            self._rebuild()
+
+    def _rebuild(self):
+        items = [
+            (key, point) for key, point in self._tree._items
+            if key not in self._removed and key not in self._added
+        ]
+        items.extend(self._added.items())
+        self._tree = KDTree(items)
+        self._tree_keys = set(self._tree.keys())
+        self._added = {}
+        self._removed = set()
+
+    def _overlay(self, point, limit):
+        for key, other in self._added.items():
+            distance = _squared_distance(point, other)
+            if distance <= limit:
+                yield key, distance
+
+    def within(self, point, radius):
+        found = [
+            (key, distance) for key, distance in self._tree.query_radius(point, radius)
+            if key not in self._removed
+        ]
+        found.extend(self._overlay(point, radius * radius))
+        return sorted(found, key=lambda item: item[1])
+
+    def nearest(self, point, k, radius=None):
+        # Ask the tree for extra neighbours to make up for tombstoned keys
+        found = [
+            (key, distance)
+            for key, distance in self._tree.query_nearest(point, k + len(self._removed), radius)
+            if key not in self._removed
+        ]
+        found.extend(self._overlay(point, math.inf if radius is None else radius * radius))
+        return sorted(found, key=lambda item: item[1])[:k]
+
+
+_indexes = {}
+_lock = threading.RLock()
+
+
+def _current_versions(blood_groups):
+    from .models import DonorIndexVersion
+
+    versions = dict(
+        DonorIndexVersion.objects.filter(
+            blood_group__in=blood_groups
+        ).values_list('blood_group', 'version')
+    )
+    return {group: versions.get(group, 0) for group in blood_groups}
+
+
+def _bump_version(blood_group):
+    from .models import DonorIndexVersion
+
+    versions = DonorIndexVersion.objects.filter(blood_group=blood_group)
+    with transaction.atomic():
+        if not versions.update(version=F('version') + 1):
+            try:
+                with transaction.atomic():
+                    DonorIndexVersion.objects.create(blood_group=blood_group, version=1)
+                return 1
+            except IntegrityError:
+                # Another worker created the row first
+                versions.update(version=F('version') + 1)
+        # The row stays locked until commit, so this is our increment
+        return versions.values_list('version', flat=True).get()
+
+
+def _load(blood_group, version):
+    from .models import DonorProfile
+
+    rows = DonorProfile.objects.filter(
+        blood_group=blood_group,
+        user__latitude__isnull=False,
+        user__longitude__isnull=False,
+    ).annotate(
+        _lat=Cast('user__latitude', FloatField()),
+        _lon=Cast('user__longitude', FloatField()),
+    ).values_list('user_id', '_lat', '_lon')
+
+    return DonorLocationIndex(
+        [(user_id, to_unit_vector(lat, lon)) for user_id, lat, lon in rows],
+        version
+    )
+
+
+def sync(blood_groups):
+    """Rebuild the local index of any of blood_groups changed elsewhere"""
+    versions = _current_versions(blood_groups)
+    with _lock:
+        for blood_group, version in versions.items():
+            index = _indexes.get(blood_group)
+            if index is None or index.version != version:
+                _indexes[blood_group] = _load(blood_group, version)
+
+
+def _get_index(blood_group):
+    with _lock:
+        if blood_group not in _indexes:
+            sync([blood_group])
+        return _indexes[blood_group]
+
+
+def within(blood_group, latitude, longitude, max_distance_km):
+    """
+    Donors of blood_group within max_distance_km of the coordinates
+
+    Returns [(user_id, distance_km)], nearest first.
+    """
+    point = to_unit_vector(latitude, longitude)
+    index = _get_index(blood_group)
+    with _lock:
+        found = index.within(point, km_to_chord(max_distance_km))
+    return [(key, chord_to_km(math.sqrt(distance))) for key, distance in found]
+
+
+def nearest(blood_group, latitude, longitude, k, max_distance_km=None):
+    """
+    The k donors of blood_group nearest to the coordinates, optionally
+    capped at max_distance_km
+
+    Returns [(user_id, distance_km)], nearest first.
+    """
+    point = to_unit_vector(latitude, longitude)
+    radius = None if max_distance_km is None else km_to_chord(max_distance_km)
+    index = _get_index(blood_group)
+    with _lock:
+        found = index.nearest(point, k, radius)
+    return [(key, chord_to_km(math.sqrt(distance))) for key, distance in found]
+
+
+def _patch(blood_group, user_id, point, version):
+    with _lock:
+        index = _indexes.get(blood_group)
+        if index is not None and index.version == version - 1:
+            index.update(user_id, point)
+            index.version = version
+
+
+def update_donor(user_id, blood_group, latitude, longitude):
+    """
+    Record a donor's new location or blood group (None removes the donor)
+
+    Bumps the group's version in the transaction making the change, so
+    other workers notice once it commits, and on commit patches the local
+    copy in place when it was current up to this change.
+    """
+    point = None
+    if latitude is not None and longitude is not None:
+        point = to_unit_vector(latitude, longitude)
+
+    version = _bump_version(blood_group)
+    transaction.on_commit(partial(_patch, blood_group, user_id, point, version))
+
+
+def remove_donor(user_id, blood_group):
+    """Drop a donor from a blood group's index"""
+    update_donor(user_id, blood_group, None, None)
+
+
+def reset():
+    """Discard every local index; they are rebuilt on next use"""
+    with _lock:
+        _indexes.clear()
@@ -0,0 +1,395 @@
+import io
+import threading
+from datetime import date, timedelta
+from itertools import product
+from unittest import skipUnless
+
+from django.contrib.messages import get_messages
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import Client, TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from bloodbanks import services as inventory_service
+from bloodbanks.models import BloodBank, BloodInventory, DonationSlot, InventoryTransaction
+from bloodbanks.stats import day_bounds
+from . import spatial_index as donor_locations
+from .models import (
+    DONATION_GAP_DAYS, MAX_DONOR_AGE, MIN_DONOR_AGE, DonationReward, DonationSchedule, DonorProfile,
+)
+from .services import complete_donations
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Reads SQLite EXPLAIN QUERY PLAN output')
+class DonationScheduleIndexTests(TestCase):
+    """Dashboard and sweep queries seek the DonationSchedule indexes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        bank_user = User.objects.create_user(
+            'bank', 'bank@example.com', role='bloodbank', latitude=15, longitude=75
+        )
+        cls.blood_bank = bank_user.blood_bank_profile
+
+        now = timezone.now()
+        donors = [
+            User.objects.create_user(
+                f'donor{number}', f'donor{number}@example.com', role='donor',
+                latitude=15, longitude=75
+            ).donor_profile
+            for number in range(4)
+        ]
+        # Only the rows matter here, not the booking rules save() applies
+        DonationSchedule.objects.bulk_create([
+            DonationSchedule(
+                donor=donor,
+                blood_bank=cls.blood_bank,
+                scheduled_date=now + timedelta(days=number - 2),
+                status='scheduled' if number % 2 else 'completed',
+            )
+            for number, donor in enumerate(donors)
+        ])
+        cls.donor = donors[0]
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {index_name}', plan)
+        self.assertNotIn('USE TEMP B-TREE', plan)
+
+    def test_bank_day_listing_uses_bank_status_index(self):
+        day_start, day_end = day_bounds(timezone.localdate())
+        self.assertUsesIndex(
+            DonationSchedule.objects.filter(
+                blood_bank=self.blood_bank,
+                scheduled_date__gte=day_start,
+                scheduled_date__lt=day_end,
+                status='scheduled',
+            ).order_by('scheduled_date'),
+            'donors_sched_bank_status_idx',
+        )
+
+    def test_bank_completed_listing_uses_bank_status_index(self):
+        self.assertUsesIndex(
+            DonationSchedule.objects.filter(
+                blood_bank=self.blood_bank, status='completed'
+            ).order_by('-scheduled_date'),
+            'donors_sched_bank_status_idx',
+        )
+
+    def test_donor_history_uses_donor_status_index(self):
+        self.assertUsesIndex(
+            DonationSchedule.objects.filter(
+                donor=self.donor, status='completed'
+            ).order_by('-scheduled_date')[:5],
+            'donors_sched_donor_status_idx',
+        )
+
+    def test_stale_booking_sweep_uses_open_date_index(self):
+        self.assertUsesIndex(
+            DonationSchedule.objects.filter(
+                status='scheduled', scheduled_date__lt=timezone.now()
+            ).order_by('scheduled_date').values_list('pk', 'blood_bank_id')[:1000],
+            'donors_sched_open_date_idx',
+        )
+
+
+class EligibilityParityTests(TestCase):
+    """The SQL eligibility rules agree with DonorProfile.is_eligible()"""
+
+    @classmethod
+    def setUpTestData(cls):
+        today = date.today()
+        ages = [None, 0, MIN_DONOR_AGE - 1, MIN_DONOR_AGE, MAX_DONOR_AGE, MAX_DONOR_AGE + 1]
+        last_donations = [
+            None,
+            today,
+            today - timedelta(days=DONATION_GAP_DAYS - 1),
+            today - timedelta(days=DONATION_GAP_DAYS),
+            today - timedelta(days=DONATION_GAP_DAYS + 1),
+        ]
+        for number, (age, last_donation, availability) in enumerate(
+            product(ages, last_donations, [True, False])
+        ):
+            profile = User.objects.create_user(
+                f'donor{number}', f'donor{number}@example.com', role='donor'
+            ).donor_profile
+            profile.age = age
+            profile.last_donation_date = last_donation
+            profile.availability = availability
+            profile.save()
+
+        cls.profiles = list(DonorProfile.objects.all())
+
+    def test_eligible_matches_is_eligible(self):
+        expected = {profile.pk for profile in self.profiles if profile.is_eligible()[0]}
+
+        self.assertTrue(expected)
+        self.assertEqual(set(DonorProfile.objects.eligible().values_list('pk', flat=True)), expected)
+
+    def test_with_eligibility_matches_is_eligible(self):
+        annotated = dict(DonorProfile.objects.with_eligibility().values_list('pk', 'eligible'))
+
+        for profile in self.profiles:
+            with self.subTest(
+                age=profile.age,
+                last_donation=profile.last_donation_date,
+                availability=profile.availability,
+            ):
+                self.assertEqual(annotated[profile.pk], profile.is_eligible()[0])
+
+    def test_eligible_without_availability_ignores_the_toggle(self):
+        expected = set()
+        for profile in self.profiles:
+            profile.availability = True
+            if profile.is_eligible()[0]:
+                expected.add(profile.pk)
+
+        self.assertEqual(
+            set(DonorProfile.objects.eligible(require_availability=False).values_list('pk', flat=True)),
+            expected,
+        )
+
+
+class DonorIndexVersionTests(TestCase):
+    """Local donor indexes pick up changes recorded by other workers"""
+
+    def setUp(self):
+        donor_locations.reset()
+        # The donor index is updated on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.donor = User.objects.create_user(
+                'donor', 'donor@example.com', role='donor', latitude=15, longitude=75
+            )
+
+    def nearby(self):
+        return [user_id for user_id, _ in donor_locations.within('O+', 15, 75, 5)]
+
+    def test_sync_rebuilds_index_changed_by_another_worker(self):
+        donor_locations.sync(['O+'])
+        self.assertEqual(self.nearby(), [self.donor.pk])
+
+        # Another worker moves the donor and bumps the shared version;
+        # this worker's copy is not patched
+        User.objects.filter(pk=self.donor.pk).update(latitude=20, longitude=80)
+        donor_locations._bump_version('O+')
+        self.assertEqual(self.nearby(), [self.donor.pk])
+
+        donor_locations.sync(['O+'])
+        self.assertEqual(self.nearby(), [])
+
+    def test_local_change_patches_index_without_rebuild(self):
+        donor_locations.sync(['O+'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.donor.latitude = 20
+            self.donor.longitude = 80
+            self.donor.save()
+
+        with self.assertNumQueries(1):
+            donor_locations.sync(['O+'])
+        self.assertEqual(self.nearby(), [])
+
+
+class BookingTestMixin:
+
+    def create_donor_and_bank(self):
+        self.donor_user = User.objects.create_user(
+            'donor', 'donor@example.com', 'secret', role='donor', latitude=15, longitude=75
+        )
+        profile = self.donor_user.donor_profile
+        profile.age = 30
+        profile.save()
+        # New banks get the default opening hours and their slots
+        bank_user = User.objects.create_user(
+            'bank', 'bank@example.com', role='bloodbank', latitude=15.01, longitude=75.01
+        )
+        self.slots = list(
+            DonationSlot.objects.open().filter(blood_bank=bank_user.blood_bank_profile)[:4]
+        )
+
+    def book(self, client, slot):
+        response = client.post(reverse('donors:schedule_donation'), {'slot': slot.pk})
+        return [str(message) for message in get_messages(response.wsgi_request)]
+
+    def places_taken(self):
+        return DonationSlot.objects.aggregate(total=Sum('booked'))['total']
+
+
+class OneActiveBookingTests(BookingTestMixin, TestCase):
+    """schedule_donation turns a second active booking away"""
+
+    def setUp(self):
+        self.create_donor_and_bank()
+        self.client.force_login(self.donor_user)
+
+    def test_second_booking_is_rejected_and_its_place_given_back(self):
+        self.book(self.client, self.slots[0])
+        messages = self.book(self.client, self.slots[1])
+
+        self.assertEqual(
+            messages[-1],
+            "You already have an active scheduled donation. "
+            "Please cancel it before scheduling a new one."
+        )
+        self.assertEqual(DonationSchedule.objects.filter(status='scheduled').count(), 1)
+        self.assertEqual(self.places_taken(), 1)
+
+
+class ConcurrentBookingTests(BookingTestMixin, TransactionTestCase):
+    """Concurrent submits by one donor leave exactly one active booking"""
+
+    WORKERS = 4
+
+    def setUp(self):
+        self.create_donor_and_bank()
+
+    def test_concurrent_bookings(self):
+        clients = [Client() for _ in range(self.WORKERS)]
+        for client in clients:
+            client.force_login(self.donor_user)
+        start = threading.Barrier(self.WORKERS)
+
+        def worker(number):
+            try:
+                start.wait()
+                self.book(clients[number], self.slots[number])
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(number,)) for number in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Losing submits either hit the constraint or, on SQLite, the
+        # write lock; both roll their claimed place back
+        self.assertEqual(DonationSchedule.objects.filter(status='scheduled').count(), 1)
+        self.assertEqual(self.places_taken(), 1)
+
+
+class CompleteDonationsTests(TestCase):
+    """complete_donations runs a fixed number of queries per blood bank"""
+
+    BLOOD_GROUPS = ['A+', 'B+', 'O-']
+
+    def setUp(self):
+        bank_user = User.objects.create_user(
+            'bank', 'bank@example.com', role='bloodbank', latitude=15, longitude=75
+        )
+        self.blood_bank = bank_user.blood_bank_profile
+        # Stocked above the alert thresholds, so no alerts open
+        inventory_service.bulk_add_units(
+            self.blood_bank, {blood_group: 20 for blood_group in self.BLOOD_GROUPS}
+        )
+        self.donors = 0
+
+    def schedule(self, count):
+        """`count` scheduled donations spread over BLOOD_GROUPS"""
+        profiles = []
+        for _ in range(count):
+            self.donors += 1
+            profile = User.objects.create_user(
+                f'donor{self.donors}', f'donor{self.donors}@example.com', role='donor',
+                latitude=15, longitude=75
+            ).donor_profile
+            profile.blood_group = self.BLOOD_GROUPS[self.donors % len(self.BLOOD_GROUPS)]
+            profile.save()
+            profiles.append(profile)
+        # Only the rows matter here, not the booking rules save() applies
+        return [
+            schedule.pk for schedule in DonationSchedule.objects.bulk_create([
+                DonationSchedule(
+                    donor=profile,
+                    blood_bank=self.blood_bank,
+                    scheduled_date=timezone.now(),
+                    status='scheduled',
+                )
+                for profile in profiles
+            ])
+        ]
+
+    def test_query_count_does_not_grow_with_donations(self):
+        for count in (3, 12, 30):
+            schedule_ids = self.schedule(count)
+
+            with self.assertNumQueries(26):
+                self.assertEqual(complete_donations(schedule_ids), count)
+
+    def test_stock_ledger_and_rewards_are_recorded(self):
+        schedule_ids = self.schedule(7)
+
+        complete_donations(schedule_ids)
+
+        self.assertEqual(
+            dict(BloodInventory.objects.filter(blood_bank=self.blood_bank).values_list('blood_group', 'units')),
+            {'A+': 22, 'B+': 23, 'O-': 22},
+        )
+        self.assertEqual(
+            dict(InventoryTransaction.objects.filter(reason='donation').values_list('blood_group', 'delta')),
+            {'A+': 2, 'B+': 3, 'O-': 2},
+        )
+        self.assertEqual(DonationReward.objects.count(), 7)
+        self.assertEqual(
+            DonorProfile.objects.filter(total_donations=1, last_donation_date=date.today()).count(), 7
+        )
+        # Completing again changes nothing
+        self.assertEqual(complete_donations(schedule_ids), 0)
+
+
+class ExpireStaleBookingsTests(TestCase):
+    """The expire_stale_bookings command expires only open bookings past the grace period"""
+
+    def setUp(self):
+        bank_user = User.objects.create_user(
+            'bank', 'bank@example.com', role='bloodbank', latitude=15, longitude=75
+        )
+        self.blood_bank = bank_user.blood_bank_profile
+        now = timezone.now()
+        cases = [
+            ('stale', 'scheduled', now - timedelta(days=2)),
+            ('recent', 'scheduled', now - timedelta(hours=1)),
+            ('upcoming', 'scheduled', now + timedelta(days=1)),
+            ('done', 'completed', now - timedelta(days=2)),
+        ]
+        # Only the rows matter here, not the booking rules save() applies
+        schedules = DonationSchedule.objects.bulk_create([
+            DonationSchedule(
+                donor=User.objects.create_user(
+                    name, f'{name}@example.com', role='donor', latitude=15, longitude=75
+                ).donor_profile,
+                blood_bank=self.blood_bank,
+                scheduled_date=scheduled_date,
+                status=status,
+            )
+            for name, status, scheduled_date in cases
+        ])
+        self.schedules = {name: schedule.pk for (name, _, _), schedule in zip(cases, schedules)}
+
+    def statuses(self):
+        status_by_pk = dict(DonationSchedule.objects.values_list('pk', 'status'))
+        return {name: status_by_pk[pk] for name, pk in self.schedules.items()}
+
+    def dashboard_version(self):
+        return BloodBank.objects.get(pk=self.blood_bank.pk).dashboard_version
+
+    def test_expires_stale_bookings_in_batches(self):
+        version = self.dashboard_version()
+        out = io.StringIO()
+
+        call_command('expire_stale_bookings', '--batch-size', '1', stdout=out)
+
+        self.assertIn('Expired 1 stale bookings', out.getvalue())
+        self.assertEqual(self.statuses(), {
+            'stale': 'expired', 'recent': 'scheduled', 'upcoming': 'scheduled', 'done': 'completed',
+        })
+        self.assertGreater(self.dashboard_version(), version)
+
+    def test_grace_hours_option(self):
+        call_command('expire_stale_bookings', '--grace-hours', '0', stdout=io.StringIO())
+
+        self.assertEqual(self.statuses(), {
+            'stale': 'expired', 'recent': 'expired', 'upcoming': 'scheduled', 'done': 'completed',
+        })
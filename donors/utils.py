@@ -0,0 +1,65 @@
+"""
+Donor search helpers
+"""
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+
+from accounts.utils import bounding_box_filter, haversine_distances
+from .models import DonorProfile
+
+
+# Search radii (km) tried in turn until enough donors are found
+SEARCH_RINGS_KM = (5, 10, 25, 50, 100, 250, 500)
+
+
+def nearest_eligible_donors(latitude, longitude, blood_group, limit=10, rings_km=SEARCH_RINGS_KM):
+    """
+    Find the `limit` nearest eligible donors of a blood group
+
+    The search widens ring by ring and stops as soon as `limit` donors lie
+    within the current radius. Each ring only reads the rows between its
+    bounding box and the previous one; candidates already read but still
+    beyond the radius are carried over to the next ring.
+
+    Returns (results, radius_km) where results is a list of
+    (donor_profile, distance_km) nearest first, and radius_km is the
+    last radius searched.
+    """
+    # The role filter lets the rings seek the (role, latitude, longitude) index
+    eligible_donors = DonorProfile.objects.eligible().filter(
+        blood_group=blood_group, user__role='donor'
+    )
+
+    hits = {}
+    pending = {}
+    previous_box = None
+    radius = None
+
+    for radius in rings_km:
+        box = bounding_box_filter(latitude, longitude, radius, prefix='user__')
+        ring = eligible_donors.filter(box)
+        if previous_box is not None:
+            ring = ring.exclude(previous_box)
+        previous_box = box
+
+        rows = list(ring.annotate(
+            _lat=Cast('user__latitude', FloatField()),
+            _lon=Cast('user__longitude', FloatField()),
+        ).values_list('pk', '_lat', '_lon'))
+
+        if rows:
+            pks, latitudes, longitudes = zip(*rows)
+            distances = haversine_distances(latitude, longitude, latitudes, longitudes)
+            pending.update(zip(pks, distances.tolist()))
+
+        for pk, distance in list(pending.items()):
+            if distance <= radius:
+                hits[pk] = pending.pop(pk)
+
+        if len(hits) >= limit:
+            break
+
+    nearest = sorted(hits.items(), key=lambda item: item[1])[:limit]
+    profiles = DonorProfile.objects.select_related('user').in_bulk([pk for pk, _ in nearest])
+
+    return [(profiles[pk], round(distance, 2)) for pk, distance in nearest if pk in profiles], radius
@@ -2,15 +2,15 @@
 Donor views: Dashboard, Profile, Scheduling
 """
 
-from datetime import datetime
-
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 
 from accounts.decorators import donor_required
 from accounts.models import User
 from .models import DonorProfile, DonationSchedule
+from bloodbanks import slots
 from bloodbanks.models import BloodBank
 from accounts.utils import get_nearby_users
 
@@ -199,38 +199,12 @@ def schedule_donation(request):
 
     donor_profile = DonorProfile.objects.get(user=request.user)
 
+    # Covers the 90-day gap through the indexed next_eligible_date
     eligible, eligibility_message = donor_profile.is_eligible()
     if not eligible:
         messages.error(request, eligibility_message)
         return redirect('donors:dashboard')
 
-    # ❌ BLOCK if already has an active scheduled donation
-    if DonationSchedule.objects.filter(
-        donor=donor_profile,
-        status='scheduled'
-    ).exists():
-        messages.error(
-            request,
-            "You already have an active scheduled donation. "
-            "Please cancel it before scheduling a new one."
-        )
-        return redirect('donors:dashboard')
-
-    # ❌ BLOCK if last completed donation < 90 days
-    last_completed = DonationSchedule.objects.filter(
-        donor=donor_profile,
-        status='completed'
-    ).order_by('-scheduled_date').first()
-
-    if last_completed:
-        days_passed = (timezone.now().date() - last_completed.scheduled_date.date()).days
-        if days_passed < 90:
-            messages.error(
-                request,
-                f"You can schedule your next donation after {90 - days_passed} days."
-            )
-            return redirect('donors:dashboard')
-
     # Get nearby blood banks
     blood_bank_users = User.objects.filter(role='bloodbank')
     nearby_blood_bank_users = get_nearby_users(
@@ -250,40 +224,43 @@ def schedule_donation(request):
         except BloodBank.DoesNotExist:
             continue
 
+    # Open slots of all nearby banks in one query, grouped by local day
+    open_slots = slots.open_slots([item['blood_bank'] for item in blood_banks])
+    for item in blood_banks:
+        days = {}
+        for slot in open_slots.get(item['blood_bank'].pk, []):
+            days.setdefault(timezone.localdate(slot.starts_at), []).append(slot)
+        item['slot_days'] = list(days.items())
+
     if request.method == 'POST':
-        blood_bank_id = request.POST.get('blood_bank')
-        scheduled_date_str = request.POST.get('scheduled_date')
+        slot_id = request.POST.get('slot')
 
-        if not scheduled_date_str:
-            messages.error(request, "Please select date and time.")
+        if not slot_id:
+            messages.error(request, "Please select a time slot.")
             return redirect('donors:schedule_donation')
 
         try:
-            scheduled_naive = datetime.strptime(
-                scheduled_date_str, "%Y-%m-%dT%H:%M"
-            )
-
-            scheduled_datetime = timezone.make_aware(
-                scheduled_naive,
-                timezone.get_current_timezone()
-            )
-
-            if scheduled_datetime < timezone.now():
-                messages.error(
-                    request,
-                    "You cannot schedule a donation in the past."
+            # ❌ BLOCK if already has an active scheduled donation: the
+            # one-active-booking constraint rejects the insert, and the
+            # claimed place is given back with the rollback
+            with transaction.atomic():
+                slot = slots.claim(slot_id)
+                if slot is None:
+                    messages.error(
+                        request,
+                        "That slot is no longer available. Please pick another one."
+                    )
+                    return redirect('donors:schedule_donation')
+
+                DonationSchedule.objects.create(
+                    donor=donor_profile,
+                    blood_bank_id=slot.blood_bank_id,
+                    scheduled_date=slot.starts_at,
+                    slot=slot,
+                    status='scheduled'
                 )
-                return redirect('donors:schedule_donation')
-
-            blood_bank = BloodBank.objects.get(id=blood_bank_id)
-
-            DonationSchedule.objects.create(
-                donor=donor_profile,
-                blood_bank=blood_bank,
-                scheduled_date=scheduled_datetime,
-                status='scheduled'
-            )
 
+            scheduled_datetime = timezone.localtime(slot.starts_at)
             messages.success(
                 request,
                 f"Donation scheduled successfully for "
@@ -291,10 +268,15 @@ def schedule_donation(request):
             )
             return redirect('donors:dashboard')
 
-        except BloodBank.DoesNotExist:
-            messages.error(request, "Selected blood bank does not exist.")
+        except IntegrityError:
+            messages.error(
+                request,
+                "You already have an active scheduled donation. "
+                "Please cancel it before scheduling a new one."
+            )
+            return redirect('donors:dashboard')
         except ValueError:
-            messages.error(request, "Invalid date and time selected.")
+            messages.error(request, "Invalid time slot selected.")
         except Exception as e:
             messages.error(request, f"Error scheduling donation: {str(e)}")
 
@@ -323,8 +305,10 @@ def cancel_donation(request, schedule_id):
     )
 
     if schedule.status == 'scheduled':
-        schedule.status = 'cancelled'
-        schedule.save()
+        with transaction.atomic():
+            schedule.status = 'cancelled'
+            schedule.save()
+            slots.release(schedule.slot_id)
         messages.success(request, "Donation cancelled successfully.")
     else:
         messages.error(request, "Cannot cancel this donation.")
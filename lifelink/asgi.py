@@ -12,6 +12,7 @@ application = ProtocolTypeRouter({
     "websocket": AuthMiddlewareStack(
         URLRouter(
             __import__("chat.routing").routing.websocket_urlpatterns
+            + __import__("bloodbanks.routing").routing.websocket_urlpatterns
         )
     ),
 })
@@ -78,11 +78,27 @@ WSGI_APPLICATION = 'lifelink.wsgi.application'
 ASGI_APPLICATION = 'lifelink.asgi.application'
 
 # Django Channels Configuration
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
-    },
-}
+# Low-stock alerts and chat messages are sent from whichever process
+# handles the request to the process holding the WebSocket, so anything
+# beyond a single process needs the shared Redis layer (set REDIS_URL).
+# The in-memory layer only delivers within one process.
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [REDIS_URL],
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
 
 
 # Database
@@ -0,0 +1,184 @@
+"""
+Result cache for patient searches
+
+Entries are keyed by the geohash cell of the searcher's location, the
+blood group, a radius bucket and the search flags. Searches run from the
+cell centre at the bucket radius plus SEARCHER_MARGIN_KM, so every
+searcher in a cell shares one entry; on the way out distances are
+measured again from the searcher's own coordinates, and results are
+trimmed to the requested radius and put back in distance order.
+
+Invalidation is by generations of coarse "data cells": a key also
+carries the generations of every data cell its search area covers, and a
+change to a donor, a user location or blood bank stock gives the cell it
+happened in a new one. Only entries whose area includes that cell stop
+matching.
+
+Generations are SearchGeneration rows, read with one query per search,
+so a change made by any worker expires the entries of every worker even
+when the Django cache holding the entries is private to each process.
+The hit and miss counters live in the Django cache and are per process
+unless it is shared.
+"""
+import hashlib
+import uuid
+
+from django.core.cache import cache
+
+from accounts.utils import decode_geohash, encode_geohash, geohash_cells, haversine_distances
+from .models import SearchGeneration
+
+
+SEARCH_CACHE_TIMEOUT = 300
+
+# Precision of the searcher's cell (~1.2 km x 0.6 km)
+SEARCHER_PRECISION = 6
+
+# Widens searches from the cell centre to cover any point of the cell
+SEARCHER_MARGIN_KM = 1
+
+# Radii (km) searches are rounded up to; larger ones are capped at the last
+RADIUS_BUCKETS_KM = (5, 10, 25, 50, 100, 250, 500)
+
+# Data-cell precision per bucket: ~39 km cells for small searches,
+# ~156 km cells above 50 km to keep the number of counters read small
+DATA_PRECISIONS = (4, 3)
+FINE_BUCKET_LIMIT_KM = 50
+
+KEY_PREFIX = 'patient_search'
+HITS_KEY = f'{KEY_PREFIX}:hits'
+MISSES_KEY = f'{KEY_PREFIX}:misses'
+
+
+def radius_bucket(max_distance_km):
+    """Smallest bucket covering the requested radius, at most the largest"""
+    for bucket in RADIUS_BUCKETS_KM:
+        if max_distance_km <= bucket:
+            return bucket
+    return RADIUS_BUCKETS_KM[-1]
+
+
+def _data_precision(bucket):
+    return DATA_PRECISIONS[0] if bucket <= FINE_BUCKET_LIMIT_KM else DATA_PRECISIONS[1]
+
+
+def _incr(key):
+    if cache.add(key, 1, timeout=None):
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def invalidate_location(latitude, longitude):
+    """Expire cached searches whose area includes these coordinates"""
+    invalidate_locations([(latitude, longitude)])
+
+
+def invalidate_locations(locations):
+    """invalidate_location() for many (latitude, longitude), each cell once"""
+    data_cells = {
+        encode_geohash(latitude, longitude, precision)
+        for latitude, longitude in locations
+        if latitude is not None and longitude is not None
+        for precision in DATA_PRECISIONS
+    }
+    token = uuid.uuid4().hex
+    SearchGeneration.objects.bulk_create(
+        [SearchGeneration(cell=data_cell, token=token) for data_cell in sorted(data_cells)],
+        update_conflicts=True,
+        unique_fields=['cell'],
+        update_fields=['token'],
+    )
+
+
+def _remeasure(results, locate, latitude, longitude, max_distance):
+    """Results within max_distance of the coordinates, nearest first"""
+    if not results:
+        return []
+    points = [locate(result) for result in results]
+    distances = haversine_distances(
+        latitude, longitude,
+        [point.latitude for point in points],
+        [point.longitude for point in points],
+    )
+    remeasured = [
+        {**result, 'distance': round(distance, 2)}
+        for result, distance in zip(results, distances.tolist())
+        if distance <= max_distance
+    ]
+    remeasured.sort(key=lambda result: result['distance'])
+    return remeasured
+
+
+def get_search_results(latitude, longitude, blood_group, max_distance, max_results,
+                       availability_only, compatible, compute):
+    """
+    Return (donors_results, blood_banks_results) for a search, from the
+    cache when possible, each nearest first
+
+    compute(latitude, longitude, blood_group, radius, max_results,
+    availability_only, compatible) runs the search on a miss. With
+    max_results the nearest donors are those of the cell centre.
+    """
+    cell = encode_geohash(latitude, longitude, SEARCHER_PRECISION)
+    center_lat, center_lon = decode_geohash(cell)
+    bucket = radius_bucket(max_distance)
+    radius = bucket + SEARCHER_MARGIN_KM
+
+    data_cells = sorted(geohash_cells(center_lat, center_lon, radius, _data_precision(bucket)))
+    generations = dict(
+        SearchGeneration.objects.filter(cell__in=data_cells).values_list('cell', 'token')
+    )
+    fingerprint = hashlib.md5(
+        ','.join(
+            f'{data_cell}={generations.get(data_cell, 0)}'
+            for data_cell in data_cells
+        ).encode()
+    ).hexdigest()
+
+    key = ':'.join([
+        KEY_PREFIX, cell, blood_group, str(bucket), str(max_results or 0),
+        str(int(availability_only)), str(int(compatible)), fingerprint,
+    ])
+
+    results = cache.get(key)
+    if results is None:
+        _incr(MISSES_KEY)
+        results = compute(
+            center_lat, center_lon, blood_group, radius,
+            max_results, availability_only, compatible
+        )
+        cache.set(key, results, SEARCH_CACHE_TIMEOUT)
+    else:
+        _incr(HITS_KEY)
+
+    donors_results, blood_banks_results = results
+    return (
+        _remeasure(
+            donors_results, lambda result: result['donor'].user,
+            latitude, longitude, max_distance
+        ),
+        _remeasure(
+            blood_banks_results, lambda result: result['blood_bank'].user,
+            latitude, longitude, max_distance
+        ),
+    )
+
+
+def stats():
+    """Hit and miss counters since the last reset"""
+    counters = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = counters.get(HITS_KEY, 0)
+    misses = counters.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else 0.0,
+    }
+
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
@@ -57,3 +57,19 @@ class PatientProfile(models.Model):
 
     def __str__(self):
         return self.user.username
+
+
+class SearchGeneration(models.Model):
+    """
+    Current generation of one geohash data cell of the search cache
+
+    Rewritten with a fresh token whenever donors, user locations or stock
+    in the cell change; cached searches covering the cell carry the token
+    in their key, so every worker stops using them at once.
+    """
+
+    cell = models.CharField(max_length=12, unique=True)
+    token = models.CharField(max_length=32)
+
+    def __str__(self):
+        return f"{self.cell}: {self.token}"
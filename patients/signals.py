@@ -0,0 +1,111 @@
+"""
+Signals expiring cached patient searches when their inputs change
+
+The search generations are written in the transaction of the change, so
+they commit or roll back with it.
+"""
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from accounts.models import User
+from bloodbanks.models import BloodBank, BloodInventory
+from bloodbanks.signals import inventory_changed
+from donors.models import DonationSchedule, DonorProfile
+from donors.signals import donations_completed
+from . import cache as search_cache
+
+
+# DonorProfile fields that decide whether and how a donor shows up
+DONOR_SEARCH_FIELDS = ('availability', 'blood_group', 'age', 'next_eligible_date')
+
+
+def _invalidate(latitude, longitude):
+    if latitude is not None and longitude is not None:
+        search_cache.invalidate_location(latitude, longitude)
+
+
+def _invalidate_user(user_id):
+    location = User.objects.filter(pk=user_id).values_list('latitude', 'longitude').first()
+    if location:
+        _invalidate(*location)
+
+
+@receiver(post_init, sender=User)
+def remember_search_location(sender, instance, **kwargs):
+    instance._search_location = (
+        instance.__dict__.get('latitude'), instance.__dict__.get('longitude')
+    )
+
+
+@receiver(post_save, sender=User)
+def user_moved(sender, instance, created, **kwargs):
+    """A donor or blood bank moving changes results around both places"""
+    location = (instance.latitude, instance.longitude)
+    previous, instance._search_location = instance._search_location, location
+    if instance.role not in ('donor', 'bloodbank') or (location == previous and not created):
+        return
+    _invalidate(*previous)
+    _invalidate(*location)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    if instance.role in ('donor', 'bloodbank'):
+        _invalidate(instance.latitude, instance.longitude)
+
+
+@receiver(post_init, sender=DonorProfile)
+def remember_donor_state(sender, instance, **kwargs):
+    instance._search_state = tuple(instance.__dict__.get(field) for field in DONOR_SEARCH_FIELDS)
+
+
+@receiver(post_save, sender=DonorProfile)
+def donor_changed(sender, instance, created, **kwargs):
+    state = tuple(getattr(instance, field) for field in DONOR_SEARCH_FIELDS)
+    previous, instance._search_state = instance._search_state, state
+    if created or state != previous:
+        _invalidate_user(instance.user_id)
+
+
+@receiver(post_delete, sender=DonorProfile)
+def donor_deleted(sender, instance, **kwargs):
+    _invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=DonationSchedule)
+def donation_completed(sender, instance, **kwargs):
+    """Completion starts the donor's waiting period"""
+    if instance.status == 'completed':
+        _invalidate_user(
+            DonorProfile.objects.filter(pk=instance.donor_id).values_list('user_id', flat=True).first()
+        )
+
+
+@receiver(donations_completed)
+def donations_completed_in_bulk(sender, donor_ids, blood_bank_ids, **kwargs):
+    """Completed donors start waiting and their banks gain stock"""
+    locations = set(
+        User.objects.filter(
+            Q(donor_profile__in=donor_ids) | Q(blood_bank_profile__in=blood_bank_ids)
+        ).values_list('latitude', 'longitude')
+    )
+    search_cache.invalidate_locations(locations)
+
+
+def _invalidate_blood_bank(blood_bank_id):
+    location = BloodBank.objects.filter(
+        pk=blood_bank_id
+    ).values_list('user__latitude', 'user__longitude').first()
+    if location:
+        _invalidate(*location)
+
+
+@receiver(inventory_changed)
+def stock_changed(sender, blood_bank_id, **kwargs):
+    _invalidate_blood_bank(blood_bank_id)
+
+
+@receiver(post_delete, sender=BloodInventory)
+def inventory_deleted(sender, instance, **kwargs):
+    _invalidate_blood_bank(instance.blood_bank_id)
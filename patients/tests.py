@@ -0,0 +1,92 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from accounts.models import User
+from bloodbanks import services as inventory_service
+from donors import spatial_index as donor_locations
+
+
+class SearchQueryCountTests(TestCase):
+    """patients.views.search runs a fixed number of queries"""
+
+    def setUp(self):
+        # Versions and indexes left by earlier tests would not match the data
+        cache.clear()
+        donor_locations.reset()
+        self.patient = User.objects.create_user(
+            'patient', 'patient@example.com', 'secret', role='patient', latitude=15, longitude=75
+        )
+        self.client.force_login(self.patient)
+        self.added = 0
+
+    def add_results(self, count):
+        """Add `count` eligible A+ donors and stocked blood banks nearby"""
+        # The donor index is updated on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(count):
+                self.added += 1
+                offset = self.added / 1000
+                donor = User.objects.create_user(
+                    f'donor{self.added}', f'donor{self.added}@example.com', role='donor',
+                    latitude=15 + offset, longitude=75 + offset
+                )
+                profile = donor.donor_profile
+                profile.blood_group = 'A+'
+                profile.age = 30
+                profile.save()
+
+                bank_user = User.objects.create_user(
+                    f'bank{self.added}', f'bank{self.added}@example.com', role='bloodbank',
+                    latitude=15 - offset, longitude=75 - offset
+                )
+                inventory_service.add_units(bank_user.blood_bank_profile, 'A+', 5)
+
+    def search(self, **params):
+        return self.client.get(reverse('patients:search'), {'blood_group': 'A+', **params})
+
+    def test_query_count_does_not_grow_with_results(self):
+        for count in (1, 5, 20):
+            self.add_results(count)
+            # Loads the donor indexes, so only the search itself is counted
+            self.search(max_distance=5)
+
+            with self.assertNumQueries(10):
+                response = self.search(max_distance=50)
+
+            self.assertEqual(len(response.context['donors_results']), self.added)
+            self.assertEqual(len(response.context['blood_banks_results']), self.added)
+
+    def test_query_count_does_not_grow_in_compatibility_mode(self):
+        for count in (1, 5, 20):
+            self.add_results(count)
+            # Loads the donor indexes, so only the search itself is counted
+            self.search(max_distance=5, compatible='on')
+
+            with self.assertNumQueries(11):
+                response = self.search(max_distance=50, compatible='on')
+
+            self.assertEqual(len(response.context['donors_results']), self.added)
+            self.assertEqual(len(response.context['blood_banks_results']), self.added)
+
+    def test_cached_search_runs_no_search_queries(self):
+        self.add_results(5)
+        self.search()
+
+        # Session, user, the search cache generations and the profiles
+        # read by the base template
+        with self.assertNumQueries(5):
+            response = self.search()
+
+        self.assertEqual(len(response.context['donors_results']), 5)
+
+    def test_change_expires_cached_search(self):
+        self.add_results(2)
+        self.search()
+
+        # The new donor and bank land in data cells the cached search covers
+        self.add_results(1)
+        response = self.search()
+
+        self.assertEqual(len(response.context['donors_results']), 3)
+        self.assertEqual(len(response.context['blood_banks_results']), 3)
@@ -9,6 +9,10 @@ app_name = 'patients'
 urlpatterns = [
     path('dashboard/', views.dashboard, name='dashboard'),
     path('search/', views.search, name='search'),
+    path('nearest-donors/', views.nearest_donors, name='nearest_donors'),
+    path('api/nearest-donors/', views.nearest_donors_api, name='nearest_donors_api'),
+    path('api/stock-heatmap/', views.stock_heatmap, name='stock_heatmap'),
+    path('search-cache-stats/', views.search_cache_stats, name='search_cache_stats'),
     path('profile/', views.profile, name='profile'),
 ]
 
@@ -1,13 +1,24 @@
 """
 Patient views: Dashboard, Search for Donors and Blood Banks
 """
+from collections import defaultdict
+
 from django.shortcuts import render, redirect
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.http import JsonResponse
+from django.urls import reverse
 from accounts.decorators import patient_required
 from accounts.models import User
-from accounts.utils import get_nearby_users
-from donors.models import DonorProfile
-from bloodbanks.models import BloodBank, BloodInventory
+from accounts.utils import geohash_cells, get_nearby_users
+from donors import spatial_index as donor_locations
+from donors.models import COMPATIBLE_DONOR_GROUPS, DonorProfile
+from donors.utils import nearest_eligible_donors
+from bloodbanks import rollup as inventory_rollup
+from bloodbanks.models import BloodBatch, BloodInventory
+from . import cache as search_cache
 from .models import PatientProfile
 
 
@@ -18,80 +29,349 @@ def dashboard(request):
     return render(request, 'patients/dashboard.html', context)
 
 
+def _nearest_eligible(eligible_profiles, donor_groups, latitude, longitude, max_distance, max_results):
+    """
+    The max_results eligible donors nearest to a point
+
+    Ineligible donors can fill the nearest candidates from the index, so
+    the candidates per group are doubled until max_results eligible ones
+    lie within the distance every group has been searched to. Returns
+    [(profile, distance)], nearest first.
+    """
+    k = max_results
+    profiles_by_user = {}
+    checked = set()
+
+    while True:
+        candidates = []
+        covered = max_distance
+        complete = True
+        for group in donor_groups:
+            found = donor_locations.nearest(
+                group, latitude, longitude, k, max_distance_km=max_distance
+            )
+            # A full list may leave donors of the group past its last one
+            if len(found) == k:
+                complete = False
+                covered = min(covered, found[-1][1])
+            candidates += found
+        candidates.sort(key=lambda item: item[1])
+
+        unchecked = [user_id for user_id, _ in candidates if user_id not in checked]
+        profiles_by_user.update(
+            (profile.user_id, profile)
+            for profile in eligible_profiles.filter(user_id__in=unchecked)
+        )
+        checked.update(unchecked)
+
+        nearby_donors = [
+            (profiles_by_user[user_id], distance)
+            for user_id, distance in candidates
+            if user_id in profiles_by_user
+        ]
+        settled = sum(1 for _, distance in nearby_donors if distance <= covered)
+        if complete or settled >= max_results:
+            return nearby_donors[:max_results]
+        k *= 2
+
+
+def _search_results(latitude, longitude, blood_group, max_distance, max_results, availability_only, compatible):
+    """
+    Find donors and blood banks around a point
+
+    With compatible=True every donor group the recipient can receive from
+    is searched at once (one inventory query, and one profile query unless
+    ineligible donors crowd the nearest candidates). Both lists come back
+    nearest first.
+    """
+    donor_groups = [blood_group]
+    if compatible:
+        donor_groups = COMPATIBLE_DONOR_GROUPS.get(blood_group, donor_groups)
+
+    # Ineligible donors (age, 90-day gap and, unless the patient asks
+    # to see unavailable donors too, availability) are dropped in SQL
+    eligible_profiles = DonorProfile.objects.eligible(
+        require_availability=availability_only
+    ).filter(blood_group__in=donor_groups).select_related('user')
+
+    # Search donors: nearest-first candidates from the in-memory index,
+    # first brought up to date with changes made by other workers
+    donor_locations.sync(donor_groups)
+    if max_results:
+        nearby_donors = _nearest_eligible(
+            eligible_profiles, donor_groups, latitude, longitude, max_distance, max_results
+        )
+    else:
+        candidates = []
+        for group in donor_groups:
+            candidates += donor_locations.within(
+                group, latitude, longitude, max_distance
+            )
+        candidates.sort(key=lambda item: item[1])
+
+        profiles_by_user = {
+            profile.user_id: profile
+            for profile in eligible_profiles.filter(
+                user_id__in=[user_id for user_id, _ in candidates]
+            )
+        }
+        nearby_donors = [
+            (profiles_by_user[user_id], distance)
+            for user_id, distance in candidates
+            if user_id in profiles_by_user
+        ]
+
+    donors_results = []
+    for donor_profile, distance in nearby_donors:
+        donors_results.append({
+            'donor': donor_profile,
+            'distance': round(distance, 2),
+            'exact_match': donor_profile.blood_group == blood_group,
+            'eligible': donor_profile.availability,
+            'eligibility_msg': (
+                "Eligible to donate" if donor_profile.availability
+                else "Availability is turned OFF"
+            ),
+        })
+
+    # Search blood banks: profile joined in and the unexpired units of
+    # the requested group summed in a subquery, so no per-bank queries
+    live_batches = BloodBatch.objects.live()
+    available_units = live_batches.filter(
+        blood_bank=OuterRef('blood_bank_profile'),
+        blood_group=blood_group
+    ).values('blood_bank').annotate(total=Sum('units_remaining')).values('total')
+
+    # Only banks in rollup cells holding some of the searched groups are
+    # considered; when no cell in range has any, banks are not queried
+    stocked_cells = inventory_rollup.stocked_cells(
+        geohash_cells(latitude, longitude, max_distance, inventory_rollup.ROLLUP_PRECISION),
+        donor_groups
+    )
+
+    blood_bank_users = User.objects.filter(
+        role='bloodbank',
+        blood_bank_profile__geo_cell__in=stocked_cells
+    ).select_related('blood_bank_profile').annotate(
+        available_units=Coalesce(Subquery(available_units), 0)
+    )
+
+    origin = User(latitude=latitude, longitude=longitude)
+    nearby_banks = []
+    if stocked_cells:
+        nearby_banks = get_nearby_users(origin, blood_bank_users, max_distance_km=max_distance)
+
+    compatible_stock = defaultdict(list)
+    if compatible and nearby_banks:
+        # Stock of every compatible group, for all banks in one query
+        stock = live_batches.filter(
+            blood_bank__in=[bank_user.blood_bank_profile for bank_user in nearby_banks],
+            blood_group__in=donor_groups
+        ).values('blood_bank_id', 'blood_group').annotate(
+            units=Sum('units_remaining')
+        ).order_by('blood_group')
+        for item in stock:
+            compatible_stock[item['blood_bank_id']].append(
+                {'blood_group': item['blood_group'], 'units': item['units']}
+            )
+
+    blood_banks_results = []
+    for bank_user in nearby_banks:
+        bank_stock = compatible_stock.get(bank_user.blood_bank_profile.pk, [])
+        blood_banks_results.append({
+            'blood_bank': bank_user.blood_bank_profile,
+            'distance': bank_user.distance_km,
+            'available_units': bank_user.available_units,
+            'compatible_stock': bank_stock,
+            'compatible_units': sum(item['units'] for item in bank_stock),
+        })
+
+    return donors_results, blood_banks_results
+
+
+def _max_distance(params):
+    """Requested radius in km: 1 to 500, 50 when missing or malformed"""
+    try:
+        return max(1.0, min(float(params.get('max_distance', 50)), 500.0))
+    except ValueError:
+        return 50.0
+
+
 @patient_required
 def search(request):
-    """Search for donors and blood banks by blood group and distance"""
+    """
+    Search for donors and blood banks by blood group and distance
+
+    Runs a fixed number of queries however many results come back:
+    one for the donor profiles (more only when ineligible donors crowd
+    the nearest ones), one against the stock rollup and two (three in
+    compatibility mode) for the blood banks, skipped when no bank in
+    range has stock. Results are shared through patients.cache.
+    """
     if not request.user.latitude or not request.user.longitude:
         messages.warning(request, 'Please update your location to search for donors and blood banks.')
         return redirect('patients:dashboard')
     
     blood_group = request.GET.get('blood_group', '')
-    max_distance = float(request.GET.get('max_distance', 50))
+    max_distance = _max_distance(request.GET)
+    max_results = request.GET.get('max_results', '')
     availability_only = request.GET.get('availability_only') == 'on'
+    compatible = request.GET.get('compatible') == 'on'
     
     donors_results = []
     blood_banks_results = []
     
     if blood_group:
-        # Search donors
-        donor_profiles = DonorProfile.objects.filter(blood_group=blood_group)
-        
-        if availability_only:
-            donor_profiles = donor_profiles.filter(availability=True)
-        
-        donor_users = User.objects.filter(
-            id__in=donor_profiles.values_list('user_id', flat=True)
+        donors_results, blood_banks_results = search_cache.get_search_results(
+            request.user.latitude,
+            request.user.longitude,
+            blood_group,
+            max_distance,
+            int(max_results) if max_results.isdigit() else None,
+            availability_only,
+            compatible,
+            compute=_search_results
         )
-        
-        nearby_donors = get_nearby_users(request.user, donor_users, max_distance_km=max_distance)
-        
-        for user in nearby_donors:
-            try:
-                donor_profile = DonorProfile.objects.get(user=user)
-                eligible, eligibility_msg = donor_profile.is_eligible()
-                
-                donors_results.append({
-                    'donor': donor_profile,
-                    'distance': user.distance_km,
-                    'eligible': eligible,
-                    'eligibility_msg': eligibility_msg,
-                })
-            except DonorProfile.DoesNotExist:
-                continue
-        
-        # Search blood banks
-        blood_bank_users = User.objects.filter(role='bloodbank')
-        nearby_blood_banks = get_nearby_users(request.user, blood_bank_users, max_distance_km=max_distance)
-        
-        for user in nearby_blood_banks:
-            try:
-                blood_bank = BloodBank.objects.get(user=user)
-                try:
-                    inventory = BloodInventory.objects.get(
-                        blood_bank=blood_bank,
-                        blood_group=blood_group
-                    )
-                    available_units = inventory.units
-                except BloodInventory.DoesNotExist:
-                    available_units = 0
-                
-                blood_banks_results.append({
-                    'blood_bank': blood_bank,
-                    'distance': user.distance_km,
-                    'available_units': available_units,
-                })
-            except BloodBank.DoesNotExist:
-                continue
+
+        if compatible:
+            # Stable sorts keep distance order within each rank
+            donors_results.sort(key=lambda result: not result['exact_match'])
+            blood_banks_results.sort(key=lambda result: (
+                result['available_units'] == 0,
+                result['compatible_units'] == 0,
+            ))
     
     context = {
         'blood_group': blood_group,
         'max_distance': max_distance,
+        'max_results': max_results,
         'availability_only': availability_only,
+        'compatible': compatible,
         'donors_results': donors_results,
         'blood_banks_results': blood_banks_results,
     }
     
     return render(request, 'patients/search.html', context)
+
+
+def _nearest_donors_query(request):
+    """Parse blood group and limit and run the expanding-radius search"""
+    blood_group = request.GET.get('blood_group', '')
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), 50))
+    except ValueError:
+        limit = 10
+
+    results, radius = [], None
+    if blood_group:
+        results, radius = nearest_eligible_donors(
+            request.user.latitude,
+            request.user.longitude,
+            blood_group,
+            limit=limit
+        )
+    return blood_group, limit, results, radius
+
+
+@patient_required
+def nearest_donors(request):
+    """Nearest eligible donors of a blood group, sorted by distance"""
+    if not request.user.latitude or not request.user.longitude:
+        messages.warning(request, 'Please update your location to search for donors and blood banks.')
+        return redirect('patients:dashboard')
+
+    blood_group, limit, results, radius = _nearest_donors_query(request)
+
+    context = {
+        'blood_group': blood_group,
+        'limit': limit,
+        'radius': radius,
+        'donors_results': [
+            {'donor': donor, 'distance': distance}
+            for donor, distance in results
+        ],
+    }
+
+    return render(request, 'patients/nearest_donors.html', context)
+
+
+@patient_required
+def nearest_donors_api(request):
+    """JSON variant of nearest_donors"""
+    if not request.user.latitude or not request.user.longitude:
+        return JsonResponse({
+            'success': False,
+            'message': 'Please update your location to search for donors.'
+        }, status=400)
+
+    blood_group, limit, results, radius = _nearest_donors_query(request)
+    if not blood_group:
+        return JsonResponse({
+            'success': False,
+            'message': 'blood_group is required'
+        }, status=400)
+
+    return JsonResponse({
+        'success': True,
+        'blood_group': blood_group,
+        'limit': limit,
+        'radius_km': radius,
+        'donors': [
+            {
+                'id': donor.id,
+                'username': donor.user.username,
+                'blood_group': donor.blood_group,
+                'age': donor.age,
+                'total_donations': donor.total_donations,
+                'distance_km': distance,
+                'chat_url': reverse('chat:chat_room', args=[donor.user_id]),
+            }
+            for donor, distance in results
+        ],
+    })
+
+
+@patient_required
+def stock_heatmap(request):
+    """
+    Blood stock around the patient per rollup cell, as JSON
+
+    Query parameters: blood_group (all groups when omitted), compatible
+    ("on" to include every group the patient's group can receive from)
+    and max_distance in km (default 50, at most 500).
+    """
+    if not request.user.latitude or not request.user.longitude:
+        return JsonResponse({'success': False, 'message': 'Please update your location first'}, status=400)
+
+    blood_group = request.GET.get('blood_group', '')
+    max_distance = _max_distance(request.GET)
+
+    if not blood_group:
+        blood_groups = [group for group, _ in BloodInventory.BLOOD_GROUP_CHOICES]
+    elif request.GET.get('compatible') == 'on':
+        blood_groups = COMPATIBLE_DONOR_GROUPS.get(blood_group, [blood_group])
+    else:
+        blood_groups = [blood_group]
+
+    cells = geohash_cells(
+        float(request.user.latitude), float(request.user.longitude),
+        max_distance, inventory_rollup.ROLLUP_PRECISION
+    )
+    return JsonResponse({
+        'success': True,
+        'blood_groups': blood_groups,
+        'max_distance': max_distance,
+        'precision': inventory_rollup.ROLLUP_PRECISION,
+        'cells': inventory_rollup.heatmap(cells, blood_groups),
+    })
+
+
+@staff_member_required
+def search_cache_stats(request):
+    """Hit and miss counters of the patient search cache"""
+    return JsonResponse(search_cache.stats())
+
+
 @patient_required
 def profile(request):
     """